@@ -0,0 +1,109 @@
+"""RAG APIサーバーへの連続したツール呼び出しのレイテンシを、接続の使い回しの有無で比較するレポート
+
+呼び出しごとに httpx.AsyncClient を作成する場合 (接続を毎回確立する) と、
+`RAGApiClient` の接続プールを使い回す場合のレイテンシを同じ回数ずつ計測する。
+
+使用例:
+    python -m mcp_adapter.benchmark --calls 100
+    python -m mcp_adapter.benchmark --operation search --query "DuckDBとは" --calls 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any
+
+import httpx
+
+from mcp_adapter.client import RAGApiClient
+from mcp_adapter.config import settings
+
+
+def _request_args(operation: str, base_url: str, query: str) -> tuple[str, str, Any]:
+    """計測する操作の (メソッド, URL, JSONボディ) を返す"""
+    if operation == "search":
+        return "POST", f"{base_url}/query", {"query": query, "k": 5}
+    return "GET", f"{base_url}/", None
+
+
+def summarize(latencies_ms: list[float]) -> dict[str, float]:
+    """レイテンシ (ミリ秒) の平均・中央値・p95・最大値を返す"""
+    ordered = sorted(latencies_ms)
+    return {
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+async def measure_per_call_client(
+    operation: str, base_url: str, query: str, calls: int
+) -> list[float]:
+    """呼び出しごとに httpx.AsyncClient を作成する (以前の実装と同じ) 場合のレイテンシを計測する"""
+    method, url, body = _request_args(operation, base_url, query)
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            response = await client.request(method, url, json=body)
+            response.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def measure_pooled_client(
+    operation: str, base_url: str, query: str, calls: int
+) -> list[float]:
+    """`RAGApiClient` の接続プールを使い回す場合のレイテンシを計測する"""
+    rag_client = RAGApiClient(base_url)
+    latencies = []
+    try:
+        for _ in range(calls):
+            started = time.perf_counter()
+            if operation == "search":
+                await rag_client.search(query)
+            else:
+                await rag_client.health_check()
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        await rag_client.close()
+    return latencies
+
+
+async def run(operation: str, base_url: str, query: str, calls: int):
+    # サーバー側のウォームアップ (モデルの読み込みなど) を計測から除く
+    await measure_pooled_client(operation, base_url, query, 1)
+    per_call = await measure_per_call_client(operation, base_url, query, calls)
+    pooled = await measure_pooled_client(operation, base_url, query, calls)
+    print(f"操作: {operation}, 呼び出し回数: {calls}, サーバー: {base_url}")
+    print(f"{'クライアント':<12}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}  (ms)")
+    for name, latencies in (("per-call", per_call), ("pooled", pooled)):
+        stats = summarize(latencies)
+        print(
+            f"{name:<12}{stats['mean']:>10}{stats['p50']:>10}{stats['p95']:>10}{stats['max']:>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="連続したツール呼び出しのレイテンシの比較 (接続を毎回確立する場合と接続プール)"
+    )
+    parser.add_argument(
+        "--base-url", default=settings.rag_api_base_url, help="RAG APIサーバーのURL"
+    )
+    parser.add_argument(
+        "--operation",
+        choices=("health", "search"),
+        default="health",
+        help="計測する操作 (health: ヘルスチェック, search: /query)",
+    )
+    parser.add_argument("--query", default="DuckDB", help="search で使用するクエリ")
+    parser.add_argument("--calls", type=int, default=100, help="呼び出し回数")
+    args = parser.parse_args()
+    asyncio.run(run(args.operation, args.base_url, args.query, args.calls))
+
+
+if __name__ == "__main__":
+    main()
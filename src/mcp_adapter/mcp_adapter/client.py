@@ -1,7 +1,13 @@
 """RAG APIサーバーのクライアントモジュール"""
 
+import asyncio
+import importlib.util
+import logging
 import os
 import sys
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
 
 # モジュールのパスを追加
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -9,12 +15,47 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from typing import Any
 
 import httpx
+from pydantic_settings import BaseSettings
 
 from mcp_adapter.config import settings
 
+logger = logging.getLogger("mcp_adapter")
+
+
+def create_http_client(config: BaseSettings | None = None) -> httpx.AsyncClient:
+    """設定の接続数・タイムアウトでキープアライブの接続プールを持つHTTPクライアントを作成する
+
+    HTTP/2 が有効で h2 パッケージがインストールされていない場合は HTTP/1.1 で接続する
+
+    Args:
+        config: `rag_api_*` の接続設定を持つ設定オブジェクト。指定しない場合はこのモジュールの設定を使用
+    """
+    config = config or settings
+    http2 = config.rag_api_http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning(
+            "HTTP/2 を使用するには h2 パッケージが必要です (pip install 'httpx[http2]')。HTTP/1.1 で接続します"
+        )
+        http2 = False
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.rag_api_max_connections,
+            max_keepalive_connections=config.rag_api_max_keepalive_connections,
+            keepalive_expiry=config.rag_api_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            config.rag_api_timeout, connect=config.rag_api_connect_timeout
+        ),
+        http2=http2,
+    )
+
 
 class RAGApiClient:
-    """RAG APIサーバーのクライアント"""
+    """RAG APIサーバーのクライアント
+
+    1つの httpx.AsyncClient をプロセス内で使い回し、ツールの呼び出しごとに
+    TCP接続を確立し直さないようにする。終了時に `close()` で接続を閉じる
+    """
 
     def __init__(self, base_url: str | None = None):
         """RAG APIクライアントを初期化する
@@ -23,46 +64,130 @@ class RAGApiClient:
             base_url: RAG APIサーバーのベースURL。指定しない場合は設定値を使用
         """
         self.base_url = base_url or settings.rag_api_base_url
+        # 最初のリクエストで作成する (作成したイベントループで使用するため)
+        self._client: httpx.AsyncClient | None = None
 
-    async def search(self, query: str, top_k: int = 5) -> list[dict[str, Any]]:
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """接続プールを共有するHTTPクライアント"""
+        if self._client is None or self._client.is_closed:
+            self._client = create_http_client()
+        return self._client
+
+    async def close(self):
+        """HTTPクライアントを閉じ、プールしている接続を解放する"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        collection: str | None = None,
+        window: int = 0,
+        min_similarity: float | None = None,
+        max_results: int | None = None,
+    ) -> list[dict[str, Any]]:
         """クエリに一致するドキュメントを検索する
 
         Args:
             query: 検索クエリ
             top_k: 返却する結果の数
+            collection: 検索対象のコレクション名（省略時はデフォルトのコレクション）
+            window: 各結果に連結する同じソースの前後のチャンク数（0 の場合は連結しない）
+            min_similarity: 返す結果の類似度の下限（省略時は下限なし）
+            max_results: 返す結果の件数の上限（top_k 件の候補から絞り込んだ後に適用する）
 
         Returns:
             メタデータと類似度スコアを含む一致ドキュメントのリスト
         """
         url = f"{self.base_url}/query"
-        data = {"query": query, "k": top_k}
+        data: dict[str, Any] = {"query": query, "k": top_k}
+        if collection:
+            data["collection"] = collection
+        if window:
+            data["window"] = window
+        if min_similarity is not None:
+            data["min_similarity"] = min_similarity
+        if max_results is not None:
+            data["max_results"] = max_results
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data)
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.post(url, json=data)
+        response.raise_for_status()
+        return response.json()
 
     async def add_content(
-        self, content: str, metadata: dict[str, Any] | None = None
+        self,
+        content: str,
+        metadata: dict[str, Any] | None = None,
+        collection: str | None = None,
     ) -> dict[str, Any]:
         """RAGシステムにテキストコンテンツを追加する
 
         Args:
             content: 追加するテキストコンテンツ
             metadata: コンテンツに関連するメタデータ（オプション）
+            collection: 追加先のコレクション名（オプション、存在しない場合は作成される）
 
         Returns:
             RAG APIサーバーからのレスポンス（ステータス、メッセージ、処理されたチャンク数など）
         """
-        url = f"{self.base_url}/contents/"
-        data = {"content": content}
+        url = f"{self.base_url}/add-content"
+        data: dict[str, Any] = {"content": content}
         if metadata:
             data["metadata"] = metadata
+        if collection:
+            data["collection"] = collection
+
+        response = await self.client.post(url, json=data)
+        response.raise_for_status()
+        return response.json()
+
+    async def search_batch(
+        self, queries: list[str], top_k: int = 5, collection: str | None = None
+    ) -> dict[str, Any]:
+        """複数のクエリに一致するドキュメントを1回のリクエストでまとめて検索する
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data)
-            response.raise_for_status()
-            return response.json()
+        Args:
+            queries: 検索クエリのリスト
+            top_k: クエリごとに返却する結果の数
+            collection: 検索対象のコレクション名（省略時はデフォルトのコレクション）
+
+        Returns:
+            サーバーからのJSONレスポンス（クエリごとの結果を含む'queries'キーを含む）
+        """
+        url = f"{self.base_url}/query-batch"
+        data: dict[str, Any] = {"queries": queries, "k": top_k}
+        if collection:
+            data["collection"] = collection
+
+        response = await self.client.post(url, json=data)
+        response.raise_for_status()
+        return response.json()
+
+    async def add_contents(
+        self,
+        contents: list[dict[str, Any]],
+        collection: str | None = None,
+    ) -> dict[str, Any]:
+        """複数のテキストコンテンツを1回のリクエストでまとめて追加する
+
+        Args:
+            contents: コンテンツ（'content'）とメタデータ（'metadata'、オプション）の辞書のリスト
+            collection: 追加先のコレクション名（オプション、存在しない場合は作成される）
+
+        Returns:
+            RAG APIサーバーからのレスポンス（コンテンツごとのチャンク数など）
+        """
+        url = f"{self.base_url}/add-contents"
+        data: dict[str, Any] = {"contents": contents}
+        if collection:
+            data["collection"] = collection
+
+        response = await self.client.post(url, json=data)
+        response.raise_for_status()
+        return response.json()
 
     async def health_check(self) -> dict[str, Any]:
         """RAG APIサーバーの状態を確認する
@@ -72,11 +197,130 @@ class RAGApiClient:
         """
         url = f"{self.base_url}/"
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.get(url)
+        response.raise_for_status()
+        return response.json()
+
+
+class SearchCache:
+    """検索結果のTTLキャッシュと、同じ検索の同時実行のまとめ (singleflight)
+
+    同じキー (クエリ・top_k・コレクション) の検索が実行中の場合は、新しいリクエストを送らずに
+    実行中の検索の結果を待つ。完了した検索の結果は `ttl_seconds` の間保持し、
+    エントリ数が上限を超えた場合は最も長く参照されていないエントリから追い出す
+    """
+
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 256):
+        """
+        Args:
+            ttl_seconds: 結果を保持する秒数。0 の場合はキャッシュせず、同時実行のまとめのみ行う
+            max_entries: 保持するエントリ数の上限
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # キー -> (有効期限 (time.monotonic), 結果)。末尾ほど最近参照されたエントリ
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        # clear() のたびに増やし、clear() 前に開始した検索の結果をキャッシュしないために使用する
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.evictions = 0
+
+    async def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda _: True,
+    ) -> Any:
+        """キャッシュされた結果を返す。ない場合は実行中の同じ検索を待つか、fetch を実行する
+
+        Args:
+            key: 検索のキー
+            fetch: 検索を実行するコルーチン関数
+            cacheable: 結果をキャッシュするかどうかを判定する関数 (エラーのレスポンスを除く)
+
+        Returns:
+            検索の結果
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+            self.expired += 1
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            inflight = asyncio.get_running_loop().create_task(
+                self._fetch(key, fetch, cacheable, self._generation)
+            )
+            self._inflight[key] = inflight
+        # 待っている呼び出しがキャンセルされても、共有している検索は中断しない
+        return await asyncio.shield(inflight)
+
+    async def _fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool],
+        generation: int,
+    ) -> Any:
+        try:
+            result = await fetch()
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+        # 検索中に clear() された場合は、追加前の結果をキャッシュしない
+        if (
+            self.ttl_seconds > 0
+            and generation == self._generation
+            and cacheable(result)
+        ):
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        """キャッシュした結果をすべて削除する (コンテンツの追加後に使用する)
+
+        実行中の検索の結果はキャッシュせず、以降の検索は実行中の検索を待たずに新しく実行する
+        """
+        self._entries.clear()
+        self._inflight.clear()
+        self._generation += 1
+
+    def stats(self) -> dict[str, Any]:
+        """キャッシュとまとめた検索の件数を返す"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4)
+            if lookups
+            else 0.0,
+        }
 
 
 # デフォルトのクライアントインスタンスを作成
 rag_client = RAGApiClient()
+# ツールの検索結果のキャッシュ
+search_cache = SearchCache(
+    ttl_seconds=settings.search_cache_ttl_seconds,
+    max_entries=settings.search_cache_max_entries,
+)
@@ -11,6 +11,17 @@ class Settings(BaseSettings):
 
     # RAG APIサーバーの設定
     rag_api_base_url: str = "http://localhost:8000"
+    # RAG APIサーバーへの接続プールの設定
+    rag_api_timeout: float = 30.0
+    rag_api_connect_timeout: float = 5.0
+    rag_api_max_connections: int = 10
+    rag_api_max_keepalive_connections: int = 5
+    rag_api_keepalive_expiry: float = 30.0
+    # HTTP/2 で接続する (h2 パッケージが必要)
+    rag_api_http2: bool = False
+    # search_documents の結果を保持する秒数 (0 でキャッシュしない) とエントリ数の上限
+    search_cache_ttl_seconds: float = 30.0
+    search_cache_max_entries: int = 256
 
     # サーバーの設定
     host: str = "0.0.0.0"
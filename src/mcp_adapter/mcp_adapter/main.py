@@ -1,6 +1,7 @@
 """MCPアダプターのメインモジュール"""
 
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 import uvicorn
@@ -23,11 +24,23 @@ if settings.log_file:
     )
     logger.addHandler(handler)
 
+# RAG APIクライアントの初期化
+rag_client = RAGApiClient(settings.rag_api_base_url)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """アプリケーションの終了時にRAG APIサーバーへの接続を閉じる"""
+    yield
+    await rag_client.close()
+
+
 # FastAPIアプリケーションの作成
 app = FastAPI(
     title="RAG MCP Adapter",
     description="RAG APIサーバーとMCPの間のアダプター",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # CORSミドルウェアの設定
@@ -39,9 +52,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# RAG APIクライアントの初期化
-rag_client = RAGApiClient(settings.rag_api_base_url)
-
 
 @app.get("/health")
 async def health_check():
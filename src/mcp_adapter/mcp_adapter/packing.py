@@ -0,0 +1,133 @@
+"""検索結果を文字数・トークン数の予算に収める抜粋にまとめるモジュール"""
+
+from collections.abc import Callable
+from typing import Any
+
+# 重なりとみなすチャンクの末尾と先頭の一致の最小文字数 (短い一致は偶然の可能性があるため除く)
+MIN_OVERLAP_CHARS = 20
+# 予算の残りで抜粋の先頭のこの文字数が収まらない場合は、切り詰めて追加しない
+MIN_TRIMMED_CHARS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのおおよそのトークン数を返す
+
+    ASCII文字は4文字で1トークン、それ以外 (日本語など) は1文字で1トークンとして数える
+    """
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return -(-ascii_chars // 4) + (len(text) - ascii_chars)
+
+
+def _overlap(head: str, tail: str) -> int:
+    """head の末尾と tail の先頭が一致する最長の文字数を返す (MIN_OVERLAP_CHARS 未満の場合は 0)"""
+    for length in range(min(len(head), len(tail)), MIN_OVERLAP_CHARS - 1, -1):
+        if head.endswith(tail[:length]):
+            return length
+    return 0
+
+
+def _merge_overlapping(results: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """重なりのあるチャンクを1つの抜粋にまとめ、ほかの抜粋に含まれるチャンクを除く
+
+    チャンクはID (保存順) の順に並べ、前の抜粋の末尾と先頭が重なる場合は連結する
+    (`chunk_overlap` で分割された隣接チャンク)。
+    """
+    passages: list[dict[str, Any]] = []
+    for result in sorted(results, key=lambda result: result.get("id", 0)):
+        text = result.get("text", "")
+        similarity = result.get("similarity", 0.0)
+        row_id = result.get("id")
+        if not text.strip():
+            continue
+        # 同じテキストや、連結済みの抜粋に含まれるチャンクは情報を増やさない
+        container = next(
+            (passage for passage in passages if text in passage["text"]), None
+        )
+        if container is not None:
+            container["similarity"] = max(container["similarity"], similarity)
+            continue
+        if passages:
+            last = passages[-1]
+            overlap = _overlap(last["text"], text)
+            if overlap:
+                last["text"] += text[overlap:]
+                last["ids"].append(row_id)
+                last["similarity"] = max(last["similarity"], similarity)
+                continue
+        passages.append({"ids": [row_id], "text": text, "similarity": similarity})
+    return passages
+
+
+def _trim(text: str, budget: int, cost: Callable[[str], int]) -> str:
+    """コストが budget 以下になる最長の先頭部分を返す (空白や句点の直後で区切れる場合はそこで切る)"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if cost(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    trimmed = text[:low]
+    boundary = max(trimmed.rfind(separator) for separator in ("\n", "。", ". ", " "))
+    if boundary > len(trimmed) // 2:
+        trimmed = trimmed[: boundary + 1]
+    return trimmed.rstrip()
+
+
+def pack_results(
+    results: list[dict[str, Any]],
+    max_chars: int | None = None,
+    max_tokens: int | None = None,
+) -> list[dict[str, Any]]:
+    """検索結果を、重なりをまとめ重複を除いた抜粋にして予算に収める
+
+    抜粋は類似度の高い順に追加し、予算を超える抜粋は残りの予算に合わせて切り詰める。
+
+    Args:
+        results: 検索結果 (`id`・`text`・`similarity` を含む辞書) のリスト
+        max_chars: 抜粋のテキストの合計文字数の上限
+        max_tokens: 抜粋のテキストの合計トークン数 (`estimate_tokens` による推定) の上限。
+            max_chars と両方指定した場合は、こちらを使用する
+
+    Returns:
+        類似度の降順に並べた抜粋 (`ids`・`text`・`similarity`・`truncated`) のリスト
+    """
+    if max_tokens is not None:
+        budget, cost = max_tokens, estimate_tokens
+    elif max_chars is not None:
+        budget, cost = max_chars, len
+    else:
+        budget, cost = None, len
+
+    packed = []
+    for passage in sorted(
+        _merge_overlapping(results),
+        key=lambda passage: passage["similarity"],
+        reverse=True,
+    ):
+        passage["truncated"] = False
+        if budget is not None:
+            passage_cost = cost(passage["text"])
+            if passage_cost > budget:
+                # 残りが少ない場合は切り詰めず、収まる短い抜粋がないか続けて確認する
+                if cost(passage["text"][:MIN_TRIMMED_CHARS]) > budget:
+                    continue
+                passage["text"] = _trim(passage["text"], budget, cost)
+                passage["truncated"] = True
+                passage_cost = cost(passage["text"])
+            budget -= passage_cost
+        packed.append(passage)
+    return packed
+
+
+def format_packed_results(
+    results: list[dict[str, Any]], passages: list[dict[str, Any]]
+) -> str:
+    """予算に収めた抜粋をMarkdownに整形する"""
+    if not passages:
+        return "予算に収まる検索結果がありませんでした。max_chars または max_tokens を増やしてください。"
+    formatted_results = f"## 検索結果 ({len(results)}個のチャンクを{len(passages)}個の抜粋にまとめました)\n\n"
+    for i, passage in enumerate(passages, 1):
+        note = "、切り詰め" if passage["truncated"] else ""
+        formatted_results += f"### 抜粋 {i} (類似度: {passage['similarity']:.4f}, チャンク: {len(passage['ids'])}個{note})\n\n{passage['text']}\n\n"
+    return formatted_results
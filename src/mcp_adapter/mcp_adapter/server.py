@@ -3,6 +3,8 @@
 import logging
 import os
 import sys
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
 # モジュールのパスを追加
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -10,8 +12,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from mcp.server.fastmcp import Context, FastMCP
 
-from mcp_adapter.client import rag_client
+from mcp_adapter.client import rag_client, search_cache
 from mcp_adapter.config import settings
+from mcp_adapter.packing import format_packed_results, pack_results
 
 # ロギングの設定
 logging.basicConfig(
@@ -20,17 +23,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger("mcp_adapter")
 
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """MCPサーバーの終了時にRAG APIサーバーへの接続を閉じる"""
+    try:
+        yield
+    finally:
+        await rag_client.close()
+
+
 # MCPサーバーの作成
-mcp = FastMCP(settings.server_name)
+mcp = FastMCP(settings.server_name, lifespan=lifespan)
 
 
 @mcp.tool()
-async def search_documents(query: str, top_k: int = 5, ctx: Context = None) -> str:
+async def search_documents(
+    query: str,
+    top_k: int = 5,
+    collection: str | None = None,
+    max_chars: int | None = None,
+    max_tokens: int | None = None,
+    window: int = 0,
+    min_similarity: float | None = None,
+    max_results: int | None = None,
+    ctx: Context = None,
+) -> str:
     """クエリに基づいて関連ドキュメントを検索する
 
+    max_chars または max_tokens を指定すると、重なりのある隣接チャンクを連結し、重複を除いて、
+    類似度の高い順に予算に収まる抜粋として返す。
+
     Args:
         query: 検索クエリ
         top_k: 返却する上位結果の数（デフォルト: 5）
+        collection: 検索対象のコレクション名（省略時はデフォルトのコレクション）
+        max_chars: 返却するテキストの合計文字数の上限（オプション）
+        max_tokens: 返却するテキストの合計トークン数の上限（オプション、推定値）
+        window: 各結果に含める同じソースの前後のチャンク数（デフォルト: 0）。前後の文脈が必要な場合に指定すると、続けて検索し直す必要がなくなる
+        min_similarity: 返却する結果の類似度の下限（オプション）。下限未満の結果は返さない。IVFインデックスでは、関連する内容がない場合にスキャンを省略してすぐに空の結果が返る
+        max_results: 返却する結果の件数の上限（オプション、top_k 件の候補から絞り込んだ後に適用する）
         ctx: MCPコンテキスト（自動注入）
 
     Returns:
@@ -40,11 +72,36 @@ async def search_documents(query: str, top_k: int = 5, ctx: Context = None) -> s
         ctx.info(f"検索中: {query}")
 
     try:
-        response_data = await rag_client.search(query, top_k)
+        # 同じ検索の同時実行は1回のリクエストにまとめ、最近の結果はキャッシュから返す
+        response_data = await search_cache.get_or_fetch(
+            (query, top_k, collection, window, min_similarity, max_results),
+            lambda: rag_client.search(
+                query,
+                top_k,
+                collection=collection,
+                window=window,
+                min_similarity=min_similarity,
+                max_results=max_results,
+            ),
+            cacheable=lambda response: response.get("status") != "error",
+        )
+        if response_data.get("status") == "error":
+            return f"ドキュメント検索エラー: {response_data.get('message', '不明なエラー')}"
         results = response_data.get("results", [])
 
         if not results:
             return "関連するドキュメントが見つかりませんでした。"
+        if window:
+            # 前後のチャンクを連結したテキストを結果のテキストとして扱う
+            results = [
+                {**result, "text": result.get("context", result.get("text"))}
+                for result in results
+            ]
+
+        if max_chars is not None or max_tokens is not None:
+            return format_packed_results(
+                results, pack_results(results, max_chars, max_tokens)
+            )
 
         formatted_results = "## 検索結果\n\n"
         for i, result in enumerate(results, 1):
@@ -66,6 +123,7 @@ async def add_content(
     content: str,
     source_description: str | None = None,
     source_url: str | None = None,
+    collection: str | None = None,
     ctx: Context = None,
 ) -> str:
     """RAGシステムにテキストコンテンツを追加する。コンテンツはチャンク化され、埋め込みが生成される。
@@ -74,6 +132,7 @@ async def add_content(
         content: 追加するテキストコンテンツ
         source_description: コンテンツのソースの説明（オプション）
         source_url: コンテンツのソースURL（オプション）
+        collection: 追加先のコレクション名（オプション、存在しない場合は作成される）
         ctx: MCPコンテキスト（自動注入）
 
     Returns:
@@ -89,9 +148,13 @@ async def add_content(
         if source_url:
             metadata["source_url"] = source_url
 
-        result = await rag_client.add_content(content, metadata if metadata else None)
+        result = await rag_client.add_content(
+            content, metadata if metadata else None, collection=collection
+        )
 
         if result.get("status") == "success":
+            # 追加したコンテンツが検索結果に含まれるよう、キャッシュした結果を破棄する
+            search_cache.clear()
             processed_chunks = result.get("processed_chunks", "N/A")
             return f"コンテンツが正常に追加されました。{processed_chunks}個のチャンクを処理しました。"
         else:
@@ -103,6 +166,110 @@ async def add_content(
         return f"コンテンツ追加エラー: {str(e)}"
 
 
+@mcp.tool()
+async def search_documents_batch(
+    queries: list[str],
+    top_k: int = 5,
+    collection: str | None = None,
+    ctx: Context = None,
+) -> str:
+    """複数のクエリで関連ドキュメントをまとめて検索する。クエリの埋め込みと検索はサーバーで1回にまとめて行われる。
+
+    Args:
+        queries: 検索クエリのリスト
+        top_k: クエリごとに返却する上位結果の数（デフォルト: 5）
+        collection: 検索対象のコレクション名（省略時はデフォルトのコレクション）
+        ctx: MCPコンテキスト（自動注入）
+
+    Returns:
+        クエリごとにまとめた検索結果を含むフォーマット済み文字列
+    """
+    if ctx:
+        ctx.info(f"{len(queries)}件のクエリを検索中")
+
+    try:
+        response_data = await rag_client.search_batch(
+            queries, top_k, collection=collection
+        )
+        if response_data.get("status") == "error":
+            return f"ドキュメント検索エラー: {response_data.get('message', '不明なエラー')}"
+
+        formatted_results = "## 検索結果\n\n"
+        for i, query_result in enumerate(response_data.get("queries", []), 1):
+            formatted_results += f"### クエリ {i}: {query_result.get('query', '')}\n\n"
+            results = query_result.get("results", [])
+            if not results:
+                formatted_results += "関連するドキュメントが見つかりませんでした。\n\n"
+            for j, result in enumerate(results, 1):
+                text = result.get("text", "コンテンツが利用できません")
+                similarity = result.get("similarity", 0.0)
+                formatted_results += (
+                    f"#### 結果 {j} (類似度: {similarity:.4f})\n\n{text}\n\n"
+                )
+
+        return formatted_results
+
+    except Exception as e:
+        logger.error(f"ドキュメント検索エラー: {e}")
+        return f"ドキュメント検索エラー: {str(e)}"
+
+
+@mcp.tool()
+async def add_contents_batch(
+    contents: list[str],
+    source_descriptions: list[str] | None = None,
+    source_urls: list[str] | None = None,
+    collection: str | None = None,
+    ctx: Context = None,
+) -> str:
+    """RAGシステムに複数のテキストコンテンツをまとめて追加する。すべてのチャンクの埋め込みは1回で生成される。
+
+    Args:
+        contents: 追加するテキストコンテンツのリスト
+        source_descriptions: コンテンツごとのソースの説明（オプション、contents と同じ順序と件数）
+        source_urls: コンテンツごとのソースURL（オプション、contents と同じ順序と件数）
+        collection: 追加先のコレクション名（オプション、存在しない場合は作成される）
+        ctx: MCPコンテキスト（自動注入）
+
+    Returns:
+        コンテンツ追加に関するステータスメッセージ
+    """
+    if ctx:
+        ctx.info(f"{len(contents)}件のコンテンツを追加中")
+
+    for name, values in (
+        ("source_descriptions", source_descriptions),
+        ("source_urls", source_urls),
+    ):
+        if values is not None and len(values) != len(contents):
+            return f"コンテンツの追加に失敗しました: {name} の件数 ({len(values)}) が contents の件数 ({len(contents)}) と一致しません"
+
+    try:
+        items = []
+        for i, content in enumerate(contents):
+            metadata = {}
+            if source_descriptions and source_descriptions[i]:
+                metadata["source_description"] = source_descriptions[i]
+            if source_urls and source_urls[i]:
+                metadata["source_url"] = source_urls[i]
+            items.append({"content": content, "metadata": metadata or None})
+
+        result = await rag_client.add_contents(items, collection=collection)
+
+        if result.get("status") == "success":
+            # 追加したコンテンツが検索結果に含まれるよう、キャッシュした結果を破棄する
+            search_cache.clear()
+            processed_chunks = result.get("processed_chunks", "N/A")
+            return f"{len(contents)}件のコンテンツが正常に追加されました。{processed_chunks}個のチャンクを処理しました。"
+        else:
+            error_message = result.get("message", "不明なエラー")
+            return f"コンテンツの追加に失敗しました: {error_message}"
+
+    except Exception as e:
+        logger.error(f"コンテンツ追加エラー: {e}")
+        return f"コンテンツ追加エラー: {str(e)}"
+
+
 @mcp.tool()
 async def check_rag_status(ctx: Context = None) -> str:
     """RAG APIサーバーの状態を確認する
@@ -125,6 +292,18 @@ async def check_rag_status(ctx: Context = None) -> str:
         return f"RAG APIサーバーは利用できないようです: {str(e)}"
 
 
+def _search_cache_status() -> str:
+    """検索結果のキャッシュの統計をMarkdownの箇条書きで返す"""
+    stats = search_cache.stats()
+    return (
+        "\n\n## 検索結果のキャッシュ\n\n"
+        f"- エントリ数: {stats['entries']} (実行中の検索: {stats['inflight']})\n"
+        f"- ヒット: {stats['hits']}, ミス: {stats['misses']}, まとめた検索: {stats['coalesced']}\n"
+        f"- 期限切れ: {stats['expired']}, 追い出し: {stats['evictions']}\n"
+        f"- ヒット率 (まとめた検索を含む): {stats['hit_rate']:.1%}"
+    )
+
+
 @mcp.resource("rag-info://status")
 async def get_rag_status() -> str:
     """RAGシステムの現在の状態を取得する
@@ -134,8 +313,14 @@ async def get_rag_status() -> str:
     """
     try:
         status = await rag_client.health_check()
-        return f"# RAGシステムの状態\n\n- 状態: オンライン\n- バージョン: {status.get('version', '不明')}\n- APIエンドポイント: {settings.rag_api_base_url}"
+        return (
+            f"# RAGシステムの状態\n\n- 状態: オンライン\n- バージョン: {status.get('version', '不明')}\n- APIエンドポイント: {settings.rag_api_base_url}"
+            + _search_cache_status()
+        )
 
     except Exception as e:
         logger.error(f"RAGシステムの状態取得エラー: {e}")
-        return "# RAGシステムの状態\n\n- 状態: オフライン\n- エラー: RAG APIサーバーに接続できません"
+        return (
+            "# RAGシステムの状態\n\n- 状態: オフライン\n- エラー: RAG APIサーバーに接続できません"
+            + _search_cache_status()
+        )
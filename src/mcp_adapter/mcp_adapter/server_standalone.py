@@ -1,20 +1,26 @@
 #!/usr/bin/env python
 """RAGシステム用のスタンドアロンMCPサーバー実装"""
 
+import asyncio
 import logging
 import os
 import sys
-from typing import Any
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any, Literal
 
 import httpx
 from mcp.server.fastmcp import Context, FastMCP
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-# 親ディレクトリをsys.pathに追加
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(os.path.dirname(current_dir))
-if parent_dir not in sys.path:
-    sys.path.insert(0, parent_dir)
+# 親ディレクトリと mcp_adapter パッケージのディレクトリをsys.pathに追加
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcp_adapter.client import SearchCache, create_http_client
+from mcp_adapter.packing import format_packed_results, pack_results
 
 
 class Settings(BaseSettings):
@@ -24,9 +30,23 @@ class Settings(BaseSettings):
 
     # MCPサーバーの設定
     server_name: str = "RAG MCP Adapter"
+    # "http": RAG APIサーバーにHTTPで問い合わせる,
+    # "embedded": RAGCoreをこのプロセス内で直接呼び出す (RAG APIサーバーは不要。設定は RAG_ 環境変数)
+    mode: Literal["http", "embedded"] = "http"
 
     # RAG APIサーバーの設定
     rag_api_base_url: str = "http://localhost:8000"
+    # RAG APIサーバーへの接続プールの設定
+    rag_api_timeout: float = 30.0
+    rag_api_connect_timeout: float = 5.0
+    rag_api_max_connections: int = 10
+    rag_api_max_keepalive_connections: int = 5
+    rag_api_keepalive_expiry: float = 30.0
+    # HTTP/2 で接続する (h2 パッケージが必要)
+    rag_api_http2: bool = False
+    # search_documents の結果を保持する秒数 (0 でキャッシュしない) とエントリ数の上限
+    search_cache_ttl_seconds: float = 30.0
+    search_cache_max_entries: int = 256
 
     # サーバー設定
     host: str = "localhost"
@@ -36,9 +56,20 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
+# ロギングの設定
+logging.basicConfig(
+    level=getattr(logging, settings.log_level.upper()),
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger("mcp_adapter")
+
 
 class RAGApiClient:
-    """RAG APIサーバーのクライアント"""
+    """RAG APIサーバーのクライアント
+
+    1つの httpx.AsyncClient をプロセス内で使い回し、ツールの呼び出しごとに
+    TCP接続を確立し直さないようにする。終了時に `close()` で接続を閉じる
+    """
 
     def __init__(self, base_url: str | None = None):
         """RAG APIクライアントを初期化する
@@ -47,33 +78,71 @@ class RAGApiClient:
             base_url: RAG APIサーバーのベースURL。指定しない場合は設定値を使用
         """
         self.base_url = base_url or settings.rag_api_base_url
-
-    async def search(self, query: str, top_k: int = 5) -> dict[str, Any]:
+        # 最初のリクエストで作成する (作成したイベントループで使用するため)
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """接続プールを共有するHTTPクライアント"""
+        if self._client is None or self._client.is_closed:
+            self._client = create_http_client(settings)
+        return self._client
+
+    async def close(self):
+        """HTTPクライアントを閉じ、プールしている接続を解放する"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        collection: str | None = None,
+        window: int = 0,
+        min_similarity: float | None = None,
+        max_results: int | None = None,
+    ) -> dict[str, Any]:
         """クエリに一致するドキュメントを検索する
 
         Args:
             query: 検索クエリ
             top_k: 返却する結果の数
+            collection: 検索対象のコレクション名（省略時はデフォルトのコレクション）
+            window: 各結果に連結する同じソースの前後のチャンク数（0 の場合は連結しない）
+            min_similarity: 返す結果の類似度の下限（省略時は下限なし）
+            max_results: 返す結果の件数の上限（top_k 件の候補から絞り込んだ後に適用する）
 
         Returns:
             サーバーからのJSONレスポンス（'results'キーを含む）
         """
         url = f"{self.base_url}/query"
-        data = {"query": query, "k": top_k}
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data)
-            response.raise_for_status()
-            return response.json()
+        data: dict[str, Any] = {"query": query, "k": top_k}
+        if collection:
+            data["collection"] = collection
+        if window:
+            data["window"] = window
+        if min_similarity is not None:
+            data["min_similarity"] = min_similarity
+        if max_results is not None:
+            data["max_results"] = max_results
+
+        response = await self.client.post(url, json=data)
+        response.raise_for_status()
+        return response.json()
 
     async def add_content(
-        self, content: str, metadata: dict[str, Any] | None = None
+        self,
+        content: str,
+        metadata: dict[str, Any] | None = None,
+        collection: str | None = None,
     ) -> dict[str, Any]:
         """RAGシステムにテキストコンテンツを追加する
 
         Args:
             content: 追加するテキストコンテンツ
             metadata: コンテンツに関連するメタデータ（オプション）
+            collection: 追加先のコレクション名（オプション、存在しない場合は作成される）
 
         Returns:
             RAG APIサーバーからのレスポンス
@@ -82,11 +151,57 @@ class RAGApiClient:
         data: dict[str, Any] = {"content": content}
         if metadata:
             data["metadata"] = metadata
+        if collection:
+            data["collection"] = collection
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data)
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.post(url, json=data)
+        response.raise_for_status()
+        return response.json()
+
+    async def search_batch(
+        self, queries: list[str], top_k: int = 5, collection: str | None = None
+    ) -> dict[str, Any]:
+        """複数のクエリに一致するドキュメントを1回のリクエストでまとめて検索する
+
+        Args:
+            queries: 検索クエリのリスト
+            top_k: クエリごとに返却する結果の数
+            collection: 検索対象のコレクション名（省略時はデフォルトのコレクション）
+
+        Returns:
+            サーバーからのJSONレスポンス（クエリごとの結果を含む'queries'キーを含む）
+        """
+        url = f"{self.base_url}/query-batch"
+        data: dict[str, Any] = {"queries": queries, "k": top_k}
+        if collection:
+            data["collection"] = collection
+
+        response = await self.client.post(url, json=data)
+        response.raise_for_status()
+        return response.json()
+
+    async def add_contents(
+        self,
+        contents: list[dict[str, Any]],
+        collection: str | None = None,
+    ) -> dict[str, Any]:
+        """複数のテキストコンテンツを1回のリクエストでまとめて追加する
+
+        Args:
+            contents: コンテンツ（'content'）とメタデータ（'metadata'、オプション）の辞書のリスト
+            collection: 追加先のコレクション名（オプション、存在しない場合は作成される）
+
+        Returns:
+            RAG APIサーバーからのレスポンス（コンテンツごとのチャンク数など）
+        """
+        url = f"{self.base_url}/add-contents"
+        data: dict[str, Any] = {"contents": contents}
+        if collection:
+            data["collection"] = collection
+
+        response = await self.client.post(url, json=data)
+        response.raise_for_status()
+        return response.json()
 
     async def health_check(self) -> dict[str, Any]:
         """RAG APIサーバーの状態を確認する
@@ -96,33 +211,154 @@ class RAGApiClient:
         """
         url = f"{self.base_url}/"
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.get(url)
+        response.raise_for_status()
+        return response.json()
 
 
-# デフォルトのクライアントインスタンスを作成
-rag_client = RAGApiClient()
+class EmbeddedRAGClient:
+    """RAGCoreをプロセス内で直接呼び出すクライアント
 
-# ロギングの設定
-logging.basicConfig(
-    level=getattr(logging, settings.log_level.upper()),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    `RAGApiClient` と同じインターフェースで、HTTPによるシリアライズと通信を省略する。
+    ベクトルストアと埋め込みモデルを持つ RAGCore は最初のツール呼び出しで1回だけ初期化し、
+    以降のすべての呼び出しで共有する。ベクトルストアの設定は RAG APIサーバーと同じ
+    RAG_ 環境変数 (RAG_DB_PATH など) から読み込む
+    """
+
+    def __init__(self):
+        self._core = None
+        self._init_lock: asyncio.Lock | None = None
+
+    async def _get_core(self):
+        """RAGCoreを返す (最初の呼び出しで初期化する)"""
+        if self._core is not None:
+            return self._core
+        if self._init_lock is None:
+            self._init_lock = asyncio.Lock()
+        async with self._init_lock:
+            if self._core is None:
+                # RAGCoreの進捗は logging で標準エラー出力に出力されるため、MCPのstdio通信には混ざらない
+                from rag_api_server.core import RAGCore
+
+                logger.info("RAGCoreを初期化中 (embeddedモード)")
+                # DuckDBのオープンなどでイベントループを止めないよう、別のスレッドで初期化する
+                self._core = await asyncio.to_thread(RAGCore)
+        return self._core
+
+    async def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        collection: str | None = None,
+        window: int = 0,
+        min_similarity: float | None = None,
+        max_results: int | None = None,
+    ) -> dict[str, Any]:
+        """クエリに一致するドキュメントを検索する (RAGCore.query のレスポンス)"""
+        core = await self._get_core()
+        return await core.query(
+            query,
+            k=top_k,
+            collection=collection,
+            window=window,
+            min_similarity=min_similarity,
+            max_results=max_results,
+        )
+
+    async def add_content(
+        self,
+        content: str,
+        metadata: dict[str, Any] | None = None,
+        collection: str | None = None,
+    ) -> dict[str, Any]:
+        """RAGシステムにテキストコンテンツを追加する (RAGCore.add_single_content のレスポンス)"""
+        core = await self._get_core()
+        return await core.add_single_content(content, metadata, collection=collection)
+
+    async def search_batch(
+        self, queries: list[str], top_k: int = 5, collection: str | None = None
+    ) -> dict[str, Any]:
+        """複数のクエリに一致するドキュメントをまとめて検索する (RAGCore.query_batch のレスポンス)"""
+        core = await self._get_core()
+        return await core.query_batch(queries, k=top_k, collection=collection)
+
+    async def add_contents(
+        self,
+        contents: list[dict[str, Any]],
+        collection: str | None = None,
+    ) -> dict[str, Any]:
+        """複数のテキストコンテンツをまとめて追加する (RAGCore.add_contents のレスポンス)"""
+        core = await self._get_core()
+        return await core.add_contents(contents, collection=collection)
+
+    async def health_check(self) -> dict[str, Any]:
+        """RAGCoreの状態を確認する (未初期化の場合は初期化する)
+
+        Returns:
+            ヘルスステータス情報
+        """
+        core = await self._get_core()
+        return {
+            "status": "healthy",
+            "mode": "embedded",
+            "collections": len(core.list_collections()["collections"]),
+        }
+
+    async def close(self):
+        """RAGCoreのベクトルストアを閉じる"""
+        if self._core is not None:
+            self._core.close()
+            self._core = None
+
+
+# デフォルトのクライアントインスタンスを作成
+rag_client = EmbeddedRAGClient() if settings.mode == "embedded" else RAGApiClient()
+# ツールの検索結果のキャッシュ
+search_cache = SearchCache(
+    ttl_seconds=settings.search_cache_ttl_seconds,
+    max_entries=settings.search_cache_max_entries,
 )
-logger = logging.getLogger("mcp_adapter")
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """MCPサーバーの終了時にRAG APIサーバーへの接続を閉じる"""
+    try:
+        yield
+    finally:
+        await rag_client.close()
+
 
 # MCPサーバーの作成
-mcp = FastMCP(settings.server_name)
+mcp = FastMCP(settings.server_name, lifespan=lifespan)
 
 
 @mcp.tool()
-async def search_documents(query: str, top_k: int = 5, ctx: Context = None) -> str:
+async def search_documents(
+    query: str,
+    top_k: int = 5,
+    collection: str | None = None,
+    max_chars: int | None = None,
+    max_tokens: int | None = None,
+    window: int = 0,
+    min_similarity: float | None = None,
+    max_results: int | None = None,
+    ctx: Context = None,
+) -> str:
     """クエリに基づいて関連ドキュメントを検索する
 
+    max_chars または max_tokens を指定すると、重なりのある隣接チャンクを連結し、重複を除いて、
+    類似度の高い順に予算に収まる抜粋として返す。
+
     Args:
         query: 検索クエリ
         top_k: 返却する上位結果の数（デフォルト: 5）
+        collection: 検索対象のコレクション名（省略時はデフォルトのコレクション）
+        max_chars: 返却するテキストの合計文字数の上限（オプション）
+        max_tokens: 返却するテキストの合計トークン数の上限（オプション、推定値）
+        window: 各結果に含める同じソースの前後のチャンク数（デフォルト: 0）。前後の文脈が必要な場合に指定すると、続けて検索し直す必要がなくなる
+        min_similarity: 返却する結果の類似度の下限（オプション）。下限未満の結果は返さない。IVFインデックスでは、関連する内容がない場合にスキャンを省略してすぐに空の結果が返る
+        max_results: 返却する結果の件数の上限（オプション、top_k 件の候補から絞り込んだ後に適用する）
         ctx: MCPコンテキスト（自動注入）
 
     Returns:
@@ -132,11 +368,36 @@ async def search_documents(query: str, top_k: int = 5, ctx: Context = None) -> s
         ctx.info(f"検索中: {query}")
 
     try:
-        response_data = await rag_client.search(query, top_k)
+        # 同じ検索の同時実行は1回のリクエストにまとめ、最近の結果はキャッシュから返す
+        response_data = await search_cache.get_or_fetch(
+            (query, top_k, collection, window, min_similarity, max_results),
+            lambda: rag_client.search(
+                query,
+                top_k,
+                collection=collection,
+                window=window,
+                min_similarity=min_similarity,
+                max_results=max_results,
+            ),
+            cacheable=lambda response: response.get("status") != "error",
+        )
+        if response_data.get("status") == "error":
+            return f"ドキュメント検索エラー: {response_data.get('message', '不明なエラー')}"
         results = response_data.get("results", [])
 
         if not results:
             return "関連するドキュメントが見つかりませんでした。"
+        if window:
+            # 前後のチャンクを連結したテキストを結果のテキストとして扱う
+            results = [
+                {**result, "text": result.get("context", result.get("text"))}
+                for result in results
+            ]
+
+        if max_chars is not None or max_tokens is not None:
+            return format_packed_results(
+                results, pack_results(results, max_chars, max_tokens)
+            )
 
         formatted_results = "## 検索結果\n\n"
         for i, result in enumerate(results, 1):
@@ -158,6 +419,7 @@ async def add_content(
     content: str,
     source_description: str | None = None,
     source_url: str | None = None,
+    collection: str | None = None,
     ctx: Context = None,
 ) -> str:
     """RAGシステムにテキストコンテンツを追加する。コンテンツはチャンク化され、埋め込みが生成される。
@@ -166,6 +428,7 @@ async def add_content(
         content: 追加するテキストコンテンツ
         source_description: コンテンツのソースの説明（オプション）
         source_url: コンテンツのソースURL（オプション）
+        collection: 追加先のコレクション名（オプション、存在しない場合は作成される）
         ctx: MCPコンテキスト（自動注入）
 
     Returns:
@@ -181,9 +444,13 @@ async def add_content(
         if source_url:
             metadata["source_url"] = source_url
 
-        result = await rag_client.add_content(content, metadata if metadata else None)
+        result = await rag_client.add_content(
+            content, metadata if metadata else None, collection=collection
+        )
 
         if result.get("status") == "success":
+            # 追加したコンテンツが検索結果に含まれるよう、キャッシュした結果を破棄する
+            search_cache.clear()
             processed_chunks = result.get("processed_chunks", "N/A")
             return f"コンテンツが正常に追加されました。{processed_chunks}個のチャンクを処理しました。"
         else:
@@ -195,6 +462,110 @@ async def add_content(
         return f"コンテンツ追加エラー: {str(e)}"
 
 
+@mcp.tool()
+async def search_documents_batch(
+    queries: list[str],
+    top_k: int = 5,
+    collection: str | None = None,
+    ctx: Context = None,
+) -> str:
+    """複数のクエリで関連ドキュメントをまとめて検索する。クエリの埋め込みと検索はサーバーで1回にまとめて行われる。
+
+    Args:
+        queries: 検索クエリのリスト
+        top_k: クエリごとに返却する上位結果の数（デフォルト: 5）
+        collection: 検索対象のコレクション名（省略時はデフォルトのコレクション）
+        ctx: MCPコンテキスト（自動注入）
+
+    Returns:
+        クエリごとにまとめた検索結果を含むフォーマット済み文字列
+    """
+    if ctx:
+        ctx.info(f"{len(queries)}件のクエリを検索中")
+
+    try:
+        response_data = await rag_client.search_batch(
+            queries, top_k, collection=collection
+        )
+        if response_data.get("status") == "error":
+            return f"ドキュメント検索エラー: {response_data.get('message', '不明なエラー')}"
+
+        formatted_results = "## 検索結果\n\n"
+        for i, query_result in enumerate(response_data.get("queries", []), 1):
+            formatted_results += f"### クエリ {i}: {query_result.get('query', '')}\n\n"
+            results = query_result.get("results", [])
+            if not results:
+                formatted_results += "関連するドキュメントが見つかりませんでした。\n\n"
+            for j, result in enumerate(results, 1):
+                text = result.get("text", "コンテンツが利用できません")
+                similarity = result.get("similarity", 0.0)
+                formatted_results += (
+                    f"#### 結果 {j} (類似度: {similarity:.4f})\n\n{text}\n\n"
+                )
+
+        return formatted_results
+
+    except Exception as e:
+        logger.error(f"ドキュメント検索エラー: {e}")
+        return f"ドキュメント検索エラー: {str(e)}"
+
+
+@mcp.tool()
+async def add_contents_batch(
+    contents: list[str],
+    source_descriptions: list[str] | None = None,
+    source_urls: list[str] | None = None,
+    collection: str | None = None,
+    ctx: Context = None,
+) -> str:
+    """RAGシステムに複数のテキストコンテンツをまとめて追加する。すべてのチャンクの埋め込みは1回で生成される。
+
+    Args:
+        contents: 追加するテキストコンテンツのリスト
+        source_descriptions: コンテンツごとのソースの説明（オプション、contents と同じ順序と件数）
+        source_urls: コンテンツごとのソースURL（オプション、contents と同じ順序と件数）
+        collection: 追加先のコレクション名（オプション、存在しない場合は作成される）
+        ctx: MCPコンテキスト（自動注入）
+
+    Returns:
+        コンテンツ追加に関するステータスメッセージ
+    """
+    if ctx:
+        ctx.info(f"{len(contents)}件のコンテンツを追加中")
+
+    for name, values in (
+        ("source_descriptions", source_descriptions),
+        ("source_urls", source_urls),
+    ):
+        if values is not None and len(values) != len(contents):
+            return f"コンテンツの追加に失敗しました: {name} の件数 ({len(values)}) が contents の件数 ({len(contents)}) と一致しません"
+
+    try:
+        items = []
+        for i, content in enumerate(contents):
+            metadata = {}
+            if source_descriptions and source_descriptions[i]:
+                metadata["source_description"] = source_descriptions[i]
+            if source_urls and source_urls[i]:
+                metadata["source_url"] = source_urls[i]
+            items.append({"content": content, "metadata": metadata or None})
+
+        result = await rag_client.add_contents(items, collection=collection)
+
+        if result.get("status") == "success":
+            # 追加したコンテンツが検索結果に含まれるよう、キャッシュした結果を破棄する
+            search_cache.clear()
+            processed_chunks = result.get("processed_chunks", "N/A")
+            return f"{len(contents)}件のコンテンツが正常に追加されました。{processed_chunks}個のチャンクを処理しました。"
+        else:
+            error_message = result.get("message", "不明なエラー")
+            return f"コンテンツの追加に失敗しました: {error_message}"
+
+    except Exception as e:
+        logger.error(f"コンテンツ追加エラー: {e}")
+        return f"コンテンツ追加エラー: {str(e)}"
+
+
 @mcp.tool()
 async def check_rag_status(ctx: Context = None) -> str:
     """RAG APIサーバーの状態を確認する
@@ -217,6 +588,18 @@ async def check_rag_status(ctx: Context = None) -> str:
         return f"RAG APIサーバーは利用できないようです: {str(e)}"
 
 
+def _search_cache_status() -> str:
+    """検索結果のキャッシュの統計をMarkdownの箇条書きで返す"""
+    stats = search_cache.stats()
+    return (
+        "\n\n## 検索結果のキャッシュ\n\n"
+        f"- エントリ数: {stats['entries']} (実行中の検索: {stats['inflight']})\n"
+        f"- ヒット: {stats['hits']}, ミス: {stats['misses']}, まとめた検索: {stats['coalesced']}\n"
+        f"- 期限切れ: {stats['expired']}, 追い出し: {stats['evictions']}\n"
+        f"- ヒット率 (まとめた検索を含む): {stats['hit_rate']:.1%}"
+    )
+
+
 @mcp.resource("rag-info://status")
 async def get_rag_status() -> str:
     """RAGシステムの現在の状態を取得する
@@ -226,17 +609,33 @@ async def get_rag_status() -> str:
     """
     try:
         status = await rag_client.health_check()
-        return f"# RAGシステムの状態\n\n- 状態: オンライン\n- バージョン: {status.get('version', '不明')}\n- APIエンドポイント: {settings.rag_api_base_url}"
+        if settings.mode == "embedded":
+            return (
+                f"# RAGシステムの状態\n\n- 状態: オンライン\n- モード: embedded (プロセス内のRAGCore)\n- コレクション数: {status.get('collections', '不明')}"
+                + _search_cache_status()
+            )
+        return (
+            f"# RAGシステムの状態\n\n- 状態: オンライン\n- バージョン: {status.get('version', '不明')}\n- APIエンドポイント: {settings.rag_api_base_url}"
+            + _search_cache_status()
+        )
 
     except Exception as e:
         logger.error(f"RAGシステムの状態取得エラー: {e}")
-        return "# RAGシステムの状態\n\n- 状態: オフライン\n- エラー: RAG APIサーバーに接続できません"
+        return (
+            "# RAGシステムの状態\n\n- 状態: オフライン\n- エラー: RAG APIサーバーに接続できません"
+            + _search_cache_status()
+        )
 
 
 def main():
     """MCPサーバーを実行する"""
     logger.info(f"MCPサーバーを起動中: {settings.server_name}")
-    logger.info(f"RAG APIサーバー: {settings.rag_api_base_url}")
+    if settings.mode == "embedded":
+        logger.info(
+            "embeddedモード: RAGCoreを最初のツール呼び出しでプロセス内に初期化します"
+        )
+    else:
+        logger.info(f"RAG APIサーバー: {settings.rag_api_base_url}")
 
     # MCPサーバーを実行
     mcp.run()
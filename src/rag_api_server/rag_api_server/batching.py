@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from rag_core.metrics import Histogram
+
+# バッチサイズのヒストグラムの境界
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# 待ち時間を含むリクエストごとのレイテンシのヒストグラムの境界 (ミリ秒)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class MicroBatcher:
+    """
+    短い時間内に届いたリクエストをまとめて処理するバッチャー
+
+    同じキーで最初のリクエストが届いてから `window_ms` の間に届いたリクエスト
+    (最大 `max_batch_size` 件) を1つのバッチにして `process(キー, 要素のリスト)` を1回呼び出し、
+    返された結果のリストを各リクエストに返す。バッチの処理中に届いたリクエストは次のバッチになる。
+    イベントループのスレッドで使用すること。
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Hashable, list[Any]], Awaitable[list[Any]]],
+        window_ms: float = 5.0,
+        max_batch_size: int = 32,
+    ):
+        """
+        Args:
+            process: バッチを処理するコルーチン関数。要素と同じ順序で結果のリストを返す
+            window_ms: 最初のリクエストからバッチを締め切るまでの待ち時間 (ミリ秒)
+            max_batch_size: 1つのバッチの最大件数。達した時点で待たずに処理する
+        """
+        if max_batch_size < 1:
+            raise ValueError(
+                f"max_batch_size は1以上である必要があります: {max_batch_size}"
+            )
+        self._process = process
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self._pending: dict[Hashable, list[tuple[Any, asyncio.Future]]] = {}
+        self._timers: dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """
+        要素をバッチに追加し、バッチの処理結果のうち要素に対応する結果を返す
+
+        Args:
+            key: バッチのキー。同じキーの要素だけが同じバッチにまとめられる
+            item: `process` に渡す要素
+
+        Raises:
+            Exception: バッチの処理で発生した例外
+        """
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, future))
+        if len(batch) >= self.max_batch_size:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(self.window_ms / 1000, self._flush, key)
+        try:
+            return await future
+        finally:
+            self.latency_ms.observe((time.perf_counter() - started) * 1000)
+
+    def _flush(self, key: Hashable):
+        """キーの待機中のバッチを締め切り、処理を開始する"""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+        self.batch_sizes.observe(len(batch))
+        task = asyncio.get_running_loop().create_task(self._run(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable, batch: list[tuple[Any, asyncio.Future]]):
+        try:
+            results = await self._process(key, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results, strict=True):
+            # 待っていたリクエストがキャンセルされた場合は結果を捨てる
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict[str, Any]:
+        """バッチサイズとリクエストごとのレイテンシ (ミリ秒) のヒストグラムを返す"""
+        return {
+            "window_ms": self.window_ms,
+            "max_batch_size": self.max_batch_size,
+            "pending": sum(len(batch) for batch in self._pending.values()),
+            "batch_size": self.batch_sizes.snapshot(),
+            "latency_ms": self.latency_ms.snapshot(),
+        }
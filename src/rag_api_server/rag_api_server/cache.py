@@ -0,0 +1,298 @@
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+import numpy as np
+
+
+def _estimate_bytes(key: Hashable, value: Any) -> int:
+    """キャッシュのエントリが使用するメモリのおおよそのバイト数を返す"""
+    return len(repr(key).encode()) + len(
+        json.dumps(value, ensure_ascii=False, default=str).encode()
+    )
+
+
+class QueryResultCache:
+    """
+    検索結果のLRUキャッシュ
+
+    各エントリには保存時のベクトルストアの書き込み世代 (`write_generation`) を記録し、
+    取得時の世代と異なる場合は無効とみなす。書き込みのたびにキャッシュ全体を走査する必要がなく、
+    無効になったエントリは次に参照されたときか、LRUの追い出しで削除される。
+    エントリ数と推定メモリ使用量の上限を超えた場合は、最も長く参照されていないエントリから追い出す。
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_entries: 保持するエントリ数の上限。0 の場合はキャッシュしない
+            max_bytes: エントリの推定メモリ使用量の合計の上限 (バイト)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # キー -> (書き込み世代, 値, 推定バイト数)。末尾ほど最近参照されたエントリ
+        self._entries: OrderedDict[Hashable, tuple[int, Any, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable, generation: int) -> Any | None:
+        """
+        キャッシュされた値を返す
+
+        Args:
+            key: キャッシュのキー
+            generation: 現在のベクトルストアの書き込み世代
+
+        Returns:
+            キャッシュされた値。存在しない場合、または書き込み世代が異なる場合は None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != generation:
+                # 保存後にストアへの書き込みがあったため、古い結果は返さない
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, generation: int, value: Any):
+        """
+        値をキャッシュする
+
+        Args:
+            key: キャッシュのキー
+            generation: 値を計算する前に取得したベクトルストアの書き込み世代
+            value: キャッシュする値 (JSONに変換できる値)。キャッシュ後に変更しないこと
+        """
+        if not self.enabled:
+            return
+        size = _estimate_bytes(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (generation, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """すべてのエントリを削除する"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        """ヒット率・エントリ数・推定メモリ使用量などの統計を返す"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class _SemanticScope:
+    """同じ検索条件のクエリの埋め込みと検索結果を保持するリングバッファ"""
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        # 正規化したクエリの埋め込み (行) と、対応する検索結果
+        self.embeddings: np.ndarray | None = None
+        self.results: list[Any] = []
+        self.next = 0
+
+
+class SemanticQueryCache:
+    """
+    言い換えられたクエリの検索結果を再利用するセマンティックキャッシュ
+
+    検索条件 (コレクション・k など) ごとに最近のクエリの埋め込みを小さな行列で保持し、
+    新しいクエリの埋め込みとのコサイン類似度がしきい値以上のクエリがあれば、その検索結果を返す。
+    検索条件ごとに保存時のベクトルストアの書き込み世代を記録し、世代が変わった場合はその条件の
+    エントリをすべて破棄する。ヒットの一部は実際に検索して結果を比較し (`record_verification`)、
+    上位の結果が異なった割合を誤ヒット率として報告する。
+    """
+
+    # 保持する検索条件の数の上限。超えた場合は最も長く参照されていない条件から破棄する
+    MAX_SCOPES = 32
+
+    def __init__(self, max_entries: int = 128, threshold: float = 0.95):
+        """
+        Args:
+            max_entries: 検索条件ごとに保持するクエリ数の上限。超えた場合は古いクエリから置き換える
+            threshold: キャッシュした結果を返すクエリの埋め込みのコサイン類似度のしきい値
+        """
+        if not -1.0 <= threshold <= 1.0:
+            raise ValueError(
+                f"threshold は -1.0 以上 1.0 以下である必要があります: {threshold}"
+            )
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._scopes: OrderedDict[Hashable, _SemanticScope] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.verified_hits = 0
+        self.false_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def get(
+        self, scope_key: Hashable, generation: int, embedding: list[float]
+    ) -> tuple[Any, float] | None:
+        """
+        埋め込みが近いクエリのキャッシュされた検索結果を返す
+
+        Args:
+            scope_key: 検索条件を表すキー (コレクション・テーブル・k など)
+            generation: 現在のベクトルストアの書き込み世代
+            embedding: 新しいクエリの埋め込み
+
+        Returns:
+            (検索結果, クエリの埋め込みのコサイン類似度)。しきい値以上のクエリがない場合は None
+        """
+        if not self.enabled:
+            return None
+        query = self._normalize(embedding)
+        with self._lock:
+            scope = self._scopes.get(scope_key)
+            if scope is not None and scope.generation != generation:
+                del self._scopes[scope_key]
+                self.invalidations += 1
+                scope = None
+            if (
+                scope is None
+                or scope.embeddings is None
+                or scope.embeddings.shape[1] != query.shape[0]
+            ):
+                self.misses += 1
+                return None
+            self._scopes.move_to_end(scope_key)
+            similarities = scope.embeddings @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return scope.results[best], float(similarities[best])
+
+    def put(
+        self,
+        scope_key: Hashable,
+        generation: int,
+        embedding: list[float],
+        results: Any,
+    ):
+        """
+        クエリの埋め込みと検索結果をキャッシュする
+
+        Args:
+            scope_key: 検索条件を表すキー
+            generation: 検索の前に取得したベクトルストアの書き込み世代
+            embedding: クエリの埋め込み
+            results: 検索結果。キャッシュ後に変更しないこと
+        """
+        if not self.enabled:
+            return
+        query = self._normalize(embedding)
+        with self._lock:
+            scope = self._scopes.get(scope_key)
+            if (
+                scope is None
+                or scope.generation != generation
+                or scope.embeddings.shape[1] != query.shape[0]
+            ):
+                scope = _SemanticScope(generation)
+                self._scopes[scope_key] = scope
+            self._scopes.move_to_end(scope_key)
+            if scope.embeddings is None:
+                scope.embeddings = query[np.newaxis, :]
+                scope.results.append(results)
+            elif len(scope.results) < self.max_entries:
+                scope.embeddings = np.vstack([scope.embeddings, query])
+                scope.results.append(results)
+            else:
+                # 上限に達した場合は最も古いクエリを置き換える
+                scope.embeddings[scope.next] = query
+                scope.results[scope.next] = results
+                scope.next = (scope.next + 1) % self.max_entries
+            while len(self._scopes) > self.MAX_SCOPES:
+                self._scopes.popitem(last=False)
+
+    def record_verification(self, matched: bool):
+        """ヒットした結果を実際の検索結果と比較した結果 (上位の結果が一致したか) を記録する"""
+        with self._lock:
+            self.verified_hits += 1
+            if not matched:
+                self.false_hits += 1
+
+    def clear(self):
+        """すべてのエントリを削除する"""
+        with self._lock:
+            self._scopes.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """ヒット率・誤ヒット率などの統計を返す"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "entries": sum(len(scope.results) for scope in self._scopes.values()),
+                "scopes": len(self._scopes),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "verified_hits": self.verified_hits,
+                "false_hits": self.false_hits,
+                "false_hit_rate": (
+                    round(self.false_hits / self.verified_hits, 4)
+                    if self.verified_hits
+                    else 0.0
+                ),
+            }
@@ -11,10 +11,78 @@ class Settings(BaseSettings):
     # DuckDBの設定
     db_path: str = "vector_store.db"
     table_name: str = "embeddings"
+    # 新しく作成するコレクションの埋め込みの次元数 (bge-m3 は1024次元)
+    embedding_dim: int = 1024
+    # 類似検索のインデックス。"exact": 全行スキャン, "ivf": IVFインデックスによる近似検索,
+    # "pq": 直積量子化で圧縮したコードによる近似検索,
+    # "matryoshka": 埋め込みの先頭の次元による粗い検索 + 元の埋め込みによる再スコアリング
+    index_type: str = "exact"
+    # IVFインデックスのリスト数 (未指定の場合は行数の平方根) と検索時にスキャンするリスト数
+    ivf_nlist: int | None = None
+    ivf_nprobe: int = 8
+    # PQインデックスの部分空間の数 (= 1ベクトルあたりのバイト数)
+    pq_m: int = 64
+    # PQインデックスで上位 k * pq_rerank_factor 件を元の埋め込みで再スコアリング (0 で無効)
+    pq_rerank_factor: int = 10
+    # Matryoshkaインデックスの1段階目で使用する先頭の次元数と、再スコアリングする候補数
+    matryoshka_dim: int = 256
+    matryoshka_candidates: int = 100
+    # シャード数。2以上の場合はチャンクをテキストのハッシュで複数のDuckDBファイルに分散する
+    num_shards: int = 1
+    # 起動時にデフォルトのコレクションが空の場合に読み込むParquetスナップショットのディレクトリ
+    # (`rag-core-cli snapshot export` で書き出したもの)。新しいレプリカの立ち上げに使用する
+    snapshot_path: str | None = None
+
+    # 検索の設定
+    # "vector": ベクトル検索のみ, "hybrid": ベクトル検索とBM25全文検索をRRFで統合
+    search_mode: str = "vector"
+    # ハイブリッド検索で各検索器から取得する候補数
+    hybrid_candidates: int = 50
+    # Reciprocal Rank Fusion の定数 k
+    rrf_k: int = 60
+    # Maximal Marginal Relevance による多様化 (リクエストで mmr を指定した場合) の
+    # 関連度の重み (1.0 で関連度のみ) と、選び直す候補数
+    mmr_lambda: float = 0.5
+    mmr_pool_size: int = 20
+    # 検索結果のキャッシュのエントリ数の上限 (0 で無効) と推定メモリ使用量の上限 (バイト)
+    query_cache_size: int = 1024
+    query_cache_max_bytes: int = 64 * 1024 * 1024
+    # クエリの埋め込みが近い (言い換えられた) クエリの検索結果を再利用するセマンティックキャッシュ
+    semantic_cache_enabled: bool = False
+    # キャッシュした結果を返すクエリの埋め込みのコサイン類似度のしきい値
+    semantic_cache_threshold: float = 0.95
+    # 検索条件 (コレクション・k など) ごとに保持するクエリ数
+    semantic_cache_size: int = 128
+    # ヒットのうち実際に検索して結果を比較し、誤ヒット率を計測する割合
+    semantic_cache_verify_rate: float = 0.05
+    # 同時に届いたベクトル検索のクエリをまとめて埋め込み・検索するマイクロバッチ
+    query_batch_enabled: bool = False
+    # 最初のクエリからバッチを締め切るまでの待ち時間 (ミリ秒) と1つのバッチの最大件数
+    query_batch_window_ms: float = 5.0
+    query_batch_max_size: int = 32
+    # /query-batch で1回に検索できるクエリ数と、/add-contents で1回に追加できるコンテンツ数の上限
+    batch_max_items: int = 64
+    # ステージごとの処理時間と件数を集計し、/metrics で Prometheus 形式で公開するか
+    metrics_enabled: bool = False
+    # ログレベル ("debug", "info", "warning", "error") と出力形式 ("text" または "json")
+    log_level: str = "info"
+    log_format: str = "text"
+    # 検索・登録の要約のログを出力するリクエストの割合 (0.0 から 1.0。エラーは常に出力する)
+    log_sample_rate: float = 1.0
+    # リクエストと再埋め込みジョブを cProfile で計測した .prof ファイルの出力先 (未設定の場合は無効)
+    profile_dir: str | None = None
+    # X-Profile ヘッダーを指定しないリクエストを計測する割合 (0.0 から 1.0)
+    profile_sample_rate: float = 0.0
 
     # ドキュメント処理の設定
     chunk_size: int = 1000
     chunk_overlap: int = 200
+    # 1回のベクトル化・保存（チェックポイント）で扱うチャンク数
+    ingest_batch_size: int = 64
+    # MinHash/LSHによるニアデュプリケートチャンクの除外
+    dedup_enabled: bool = False
+    dedup_threshold: float = 0.9
+    dedup_mode: str = "drop"  # "drop" または "link"
 
     # 環境変数のプレフィックス
     class Config:
@@ -1,19 +1,57 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import Any
 
 from langchain_core.documents import Document
 
+from rag_core.document_processor.dedup import NearDuplicateFilter
 from rag_core.document_processor.loader import load_documents
-from rag_core.document_processor.splitter import split_documents
+from rag_core.document_processor.splitter import join_chunks, split_documents
 from rag_core.embedding.model import (
+    embed_queries,
     embed_query,
     embed_texts,
     initialize_embedding_model,
 )
+from rag_core.ingestion import (
+    filter_near_duplicates,
+    hash_content,
+    ingest_documents,
+    record_near_duplicates,
+)
+from rag_core.log import per_request
+from rag_core.metrics import metrics
+from rag_core.profiling import profiler
+from rag_core.reembed import reembed_collection
+from rag_core.vectordb.collection import DEFAULT_COLLECTION, CollectionManager
+from rag_core.vectordb.hybrid import reciprocal_rank_fusion
+from rag_core.vectordb.mmr import maximal_marginal_relevance
+from rag_core.vectordb.sharded import ShardedVectorStore, shard_path
+from rag_core.vectordb.snapshot import read_manifest
 from rag_core.vectordb.storage import DuckDBVectorStore
 
+from .batching import MicroBatcher
+from .cache import QueryResultCache, SemanticQueryCache
 from .config import settings
 
+# 検索モード。"hybrid" はベクトル検索とBM25全文検索の結果をRRFで統合する
+SEARCH_MODES = ("vector", "hybrid")
+
+logger = logging.getLogger(__name__)
+
+
+def _elapsed_ms(start: float) -> float:
+    """start (time.perf_counter() の値) からの経過時間をミリ秒で返す"""
+    return round((time.perf_counter() - start) * 1000, 3)
+
 
 class RAGCore:
     """RAGコアコンポーネントを統合し、APIサーバーから利用可能にするクラス"""
@@ -28,17 +66,234 @@ class RAGCore:
             db_path: DuckDBデータベースのパス
             table_name: ベクトルを保存するテーブル名
         """
+        # ステージごとの処理時間と件数のメトリクス (/metrics で公開する)
+        metrics.enable(settings.metrics_enabled)
+        profiler.configure(settings.profile_dir, settings.profile_sample_rate)
+        metrics.describe(
+            "rag_query_stage_duration_seconds",
+            "histogram",
+            "検索の各ステージ (embed, vector_search, context, total など) の処理時間",
+        )
+        metrics.describe(
+            "rag_queries_total", "counter", "検索モードとキャッシュの種類ごとの検索数"
+        )
+        metrics.describe(
+            "rag_cache_lookups_total", "counter", "検索結果のキャッシュの参照数"
+        )
+        metrics.describe(
+            "rag_query_batch_queue_depth",
+            "gauge",
+            "マイクロバッチで処理を待っているクエリ数",
+        )
+        metrics.describe(
+            "rag_cache_entries", "gauge", "検索結果のキャッシュのエントリ数"
+        )
+        metrics.describe(
+            "rag_reembed_jobs_running", "gauge", "実行中の再埋め込みジョブの数"
+        )
+        metrics.describe("rag_query_errors_total", "counter", "エラーになった検索の数")
         self.embeddings = initialize_embedding_model(
             ollama_base_url=settings.ollama_base_url,
             model_name=settings.embedding_model_name,
         )
-        self.vector_store = DuckDBVectorStore(
-            db_path=settings.db_path, table_name=settings.table_name
+        # コレクションごとに記録された埋め込みモデル (モデル名 -> インスタンス)
+        self._embedding_models = {settings.embedding_model_name: self.embeddings}
+        # 再埋め込みのテーブルの切り替えと書き込みを排他する
+        self._write_lock = threading.Lock()
+        # コレクションごとの再埋め込みジョブの状態
+        self._reembed_jobs: dict[str, dict[str, Any]] = {}
+        self._reembed_tasks: set[asyncio.Task] = set()
+        # 検索結果のキャッシュ。ベクトルストアの書き込み世代が変わると無効になる
+        self.query_cache = QueryResultCache(
+            max_entries=settings.query_cache_size,
+            max_bytes=settings.query_cache_max_bytes,
+        )
+        # 言い換えられたクエリの検索結果を再利用するセマンティックキャッシュ (オプトイン)
+        self.semantic_cache = SemanticQueryCache(
+            max_entries=(
+                settings.semantic_cache_size if settings.semantic_cache_enabled else 0
+            ),
+            threshold=settings.semantic_cache_threshold,
+        )
+        # 同時に届いたベクトル検索のクエリをまとめて埋め込み・検索するバッチャー (オプトイン)
+        self.query_batcher = (
+            MicroBatcher(
+                self._process_query_batch,
+                window_ms=settings.query_batch_window_ms,
+                max_batch_size=settings.query_batch_max_size,
+            )
+            if settings.query_batch_enabled
+            else None
+        )
+        store_kwargs = {
+            "index_type": settings.index_type,
+            "ivf_nlist": settings.ivf_nlist,
+            "ivf_nprobe": settings.ivf_nprobe,
+            "pq_m": settings.pq_m,
+            "pq_rerank_factor": settings.pq_rerank_factor,
+            "matryoshka_dim": settings.matryoshka_dim,
+            "matryoshka_candidates": settings.matryoshka_candidates,
+        }
+        if settings.num_shards > 1:
+            store_factory = partial(ShardedVectorStore, num_shards=settings.num_shards)
+            catalog_path = shard_path(settings.db_path, 0)
+        else:
+            store_factory = DuckDBVectorStore
+            catalog_path = None
+        # コレクションごとのベクトルストアは最初に使用したときに開かれる
+        self.collections = CollectionManager(
+            db_path=settings.db_path,
+            table_name=settings.table_name,
+            embedding_dim=settings.embedding_dim,
+            store_factory=store_factory,
+            catalog_path=catalog_path,
+            **store_kwargs,
+        )
+        # デフォルトのコレクションのベクトルストア
+        self.vector_store = self.collections.get()
+        if settings.snapshot_path:
+            self._bootstrap_from_snapshot(settings.snapshot_path)
+        logger.info("RAGCoreの初期化が完了しました。")
+
+    def _bootstrap_from_snapshot(self, snapshot_path: str):
+        """デフォルトのコレクションが空の場合に、スナップショットから一括で読み込む"""
+        if sum(self._count(self.vector_store)) > 0:
+            logger.info(
+                "ベクトルストアが空ではないため、スナップショットは読み込みません: %s",
+                snapshot_path,
+            )
+            return
+        # スナップショットの埋め込みを作成したモデルをコレクションに記録する
+        embedding_model = read_manifest(snapshot_path).get("embedding_model")
+        if embedding_model:
+            self.collections.get(embedding_model=embedding_model)
+        stats = self.vector_store.import_snapshot(snapshot_path)
+        logger.info("スナップショットからベクトルストアを準備しました: %s", stats)
+
+    @staticmethod
+    def _count(store) -> list[int]:
+        """ストア (シャード化されている場合はシャードごと) の行数を返す"""
+        if isinstance(store, ShardedVectorStore):
+            return store.count()
+        return [
+            store.conn.execute(f"SELECT count(*) FROM {store.table_name}").fetchone()[0]
+        ]
+
+    def _embedding_model(self, model_name: str | None):
+        """モデル名の埋め込みモデルを返す (未指定の場合は設定のモデル)"""
+        model_name = model_name or settings.embedding_model_name
+        if model_name not in self._embedding_models:
+            self._embedding_models[model_name] = initialize_embedding_model(
+                ollama_base_url=settings.ollama_base_url, model_name=model_name
+            )
+        return self._embedding_models[model_name]
+
+    def _model_for_write(self, collection: str | None) -> str:
+        """
+        書き込みに使用する埋め込みモデルの名前を返す
+
+        既存のコレクションには記録されたモデル、新しいコレクションには設定のモデルを使用する
+        """
+        return (
+            self.collections.embedding_model(collection)
+            or settings.embedding_model_name
+        )
+
+    def _create_deduplicator(self, store) -> NearDuplicateFilter | None:
+        """設定に応じてニアデュプリケート検出フィルターを生成する"""
+        if not settings.dedup_enabled:
+            return None
+        return NearDuplicateFilter(
+            threshold=settings.dedup_threshold,
+            mode=settings.dedup_mode,
+            store=store,
         )
-        print("RAGCoreの初期化が完了しました。")
+
+    def _existing_store(self, collection: str | None):
+        """コレクションのベクトルストアを返す (存在しない場合は None)"""
+        try:
+            return self.collections.get(collection)
+        except ValueError:
+            return None
+
+    def _store_chunks(
+        self,
+        collection: str | None,
+        texts: list[str],
+        sources: list[str | None],
+        ordinals: list[int],
+        content_hashes: list[str],
+        replace_source: str | None = None,
+    ) -> dict[str, int]:
+        """
+        ニアデュプリケートなチャンクを除外し、残りのチャンクの埋め込みを生成してベクトルDBに保存する
+
+        書き込みロックを取得した状態で呼び出す。`replace_source` を指定した場合は、そのソースの
+        古いチャンクの削除と新しいチャンクの保存を1つのトランザクションで行う。重複の判定は
+        古いチャンクを削除した後に行うため、置き換え前の版と同じチャンクは重複とみなさない。
+        コミット後にベクトルインデックスの学習・再学習が必要かを確認する
+
+        Args:
+            collection: 保存先のコレクション名 (存在しない場合は作成する)
+            texts: チャンクのテキストのリスト
+            sources: 各チャンクのソース
+            ordinals: 各チャンクのソース内での位置
+            content_hashes: 各チャンクのコンテンツのハッシュ値。ソースが同じでも、コンテンツごとに
+                別の前後の文脈 (`window`) のグループになる
+            replace_source: 古いチャンクを削除するソース (オプション)
+
+        Returns:
+            保存したチャンク数 (`embedded_chunks`)、重複として除外したチャンク数
+            (`duplicate_chunks`)、削除した古いチャンク数 (`deleted_chunks`) の辞書
+        """
+        model_name = self._model_for_write(collection)
+        existing = self._existing_store(collection)
+        replacing = existing is not None and replace_source is not None
+        with existing.transaction() if replacing else nullcontext():
+            deleted = existing.delete_by_source(replace_source) if replacing else 0
+            deduplicator = self._create_deduplicator(existing)
+            decisions, kept = filter_near_duplicates(deduplicator, texts)
+            kept_texts = [texts[i] for i in kept]
+            embeddings = (
+                embed_texts(kept_texts, self._embedding_model(model_name))
+                if kept_texts
+                else []
+            )
+            store = self.collections.get(
+                collection,
+                create=True,
+                embedding_dim=len(embeddings[0]) if embeddings else None,
+                embedding_model=model_name,
+            )
+            with store.transaction():
+                store.add_embeddings(
+                    kept_texts,
+                    embeddings,
+                    sources=[sources[i] for i in kept],
+                    ordinals=[ordinals[i] for i in kept],
+                    content_hashes=[content_hashes[i] for i in kept],
+                )
+                record_near_duplicates(store, deduplicator, decisions, sources)
+        # トランザクション内の add_embeddings はインデックスを更新しないため、コミット後に更新する
+        store.maintain_index()
+        return {
+            "embedded_chunks": len(kept),
+            "duplicate_chunks": len(texts) - len(kept),
+            "deleted_chunks": deleted,
+        }
+
+    def list_collections(self) -> dict[str, Any]:
+        """登録されているコレクションの一覧を返す"""
+        return {
+            "status": "success",
+            "collections": self.collections.list_collections(),
+        }
 
     async def process_directory(
-        self, directory_path: str, glob_pattern: str = "**/*[.md|.txt]"
+        self,
+        directory_path: str,
+        glob_pattern: str = "**/*[.md|.txt]",
+        collection: str | None = None,
     ) -> dict[str, Any]:
         """
         ディレクトリ内のドキュメントを処理し、ベクトルDBに保存する
@@ -46,6 +301,8 @@ class RAGCore:
         Args:
             directory_path: 処理対象のディレクトリパス
             glob_pattern: ファイルのフィルタリングパターン
+            collection: 保存先のコレクション名 (存在しない場合は作成する)。
+                指定しない場合はデフォルトのコレクション
 
         Returns:
             処理結果を含む辞書
@@ -57,7 +314,7 @@ class RAGCore:
                 raise ValueError(f"無効なディレクトリパス: {directory_path}")
 
             # ドキュメントの読み込み
-            print(f"ドキュメントを読み込み中: {dir_path}...")
+            started = time.perf_counter()
             documents = load_documents(str(dir_path), glob_pattern=glob_pattern)
             if not documents:
                 return {
@@ -65,91 +322,738 @@ class RAGCore:
                     "message": "指定されたディレクトリにドキュメントが見つかりません",
                 }
 
-            # ドキュメントの分割
-            print("ドキュメントをチャンクに分割中...")
-            chunks = split_documents(documents)
-            if not chunks:
+            # 分割・埋め込み生成・保存をチェックポイント付きで実行
+            # 中断した場合でも、再実行時には保存済みのチャンクから再開される
+            with self._write_lock:
+                model_name = self._model_for_write(collection)
+                store = self.collections.get(
+                    collection, create=True, embedding_model=model_name
+                )
+                stats = ingest_documents(
+                    documents,
+                    store,
+                    self._embedding_model(model_name),
+                    batch_size=settings.ingest_batch_size,
+                    deduplicator=self._create_deduplicator(store),
+                )
+            if not stats["chunks"]:
                 return {
                     "status": "no_chunks",
                     "message": "ドキュメントからチャンクが生成されませんでした",
                 }
 
-            # テキストとメタデータの抽出
-            texts = [chunk.page_content for chunk in chunks]
-
-            # 埋め込みの生成
-            print("埋め込みを生成中...")
-            embeddings = embed_texts(texts, self.embeddings)
-
-            # ベクトルDBへの保存
-            print("ベクトルDBに保存中...")
-            self.vector_store.add_embeddings(texts, embeddings)
-
+            logger.info(
+                "ドキュメントを登録しました",
+                extra=per_request(
+                    collection=collection or DEFAULT_COLLECTION,
+                    documents=len(documents),
+                    chunks=stats["chunks"],
+                    embedded_chunks=stats["embedded_chunks"],
+                    duration_ms=_elapsed_ms(started),
+                ),
+            )
             return {
                 "status": "success",
                 "processed_documents": len(documents),
-                "processed_chunks": len(chunks),
+                "processed_chunks": stats["chunks"],
+                "embedded_chunks": stats["embedded_chunks"],
+                "skipped_chunks": stats["skipped_chunks"],
+                "duplicate_chunks": stats["duplicate_chunks"],
+                "deleted_chunks": stats["deleted_chunks"],
+                "collection": collection or DEFAULT_COLLECTION,
                 "message": "ドキュメントの処理が完了しました",
             }
 
         except Exception as e:
+            logger.error("ドキュメント処理中にエラーが発生しました: %s", e)
             return {
                 "status": "error",
                 "message": f"ドキュメント処理中にエラーが発生しました: {str(e)}",
             }
 
     async def query(
-        self, query_text: str, k: int = 4, filter_criteria: dict[str, Any] | None = None
+        self,
+        query_text: str,
+        k: int = 4,
+        filter_criteria: dict[str, Any] | None = None,
+        search_mode: str | None = None,
+        nprobe: int | None = None,
+        collection: str | None = None,
+        window: int = 0,
+        mmr: bool = False,
+        mmr_lambda: float | None = None,
+        mmr_pool: int | None = None,
+        min_similarity: float | None = None,
+        max_results: int | None = None,
     ) -> dict[str, Any]:
         """
         クエリに対して類似ドキュメントを検索する
 
         Args:
             query_text: 検索クエリのテキスト
-            k: 返却する類似ドキュメントの数
+            k: 検索する類似ドキュメントの数 (候補数)。`max_results` を指定しない場合は返す件数の上限
             filter_criteria: 検索結果をフィルタリングするための条件
+            search_mode: 検索モード ("vector" または "hybrid")。
+                指定しない場合は設定値を使用する
+            nprobe: IVFインデックスでスキャンするリスト数 (IVF使用時のみ)
+            collection: 検索対象のコレクション名。指定しない場合はデフォルトのコレクション
+            window: 各結果に含める同じソースの前後のチャンク数。1以上の場合、各結果に
+                前後のチャンクを連結したテキスト (`context`) とそのID (`context_ids`) を追加する
+            mmr: 上位 `mmr_pool` 件の候補から Maximal Marginal Relevance で k 件を選び直し、
+                重複した内容のチャンクを減らすかどうか
+            mmr_lambda: MMRの関連度の重み (1.0 で関連度のみ)。指定しない場合は設定値を使用する
+            mmr_pool: MMRで選び直す候補数。指定しない場合は設定値を使用する (k 未満の場合は k)
+            min_similarity: 返す結果のコサイン類似度の下限。k 件に満たない場合もそのまま返す。
+                しきい値以上の行を含み得ないリストのスキャンを省略するのはIVFインデックスのみで、
+                厳密検索は全行をスキャンしてから並べ替えの前に、PQ・Matryoshkaは検索の後に除外する
+            max_results: 返す結果の件数の上限。しきい値・MMR・前後のチャンクの追加の後に適用し、
+                k は検索する候補数のままにする
 
         Returns:
-            検索結果を含む辞書
+            検索結果と各ステージの処理時間 (ミリ秒) を含む辞書
         """
         try:
-            # クエリの埋め込みを生成
-            query_embedding = embed_query(query_text, self.embeddings)
+            mode = search_mode or settings.search_mode
+            if mode not in SEARCH_MODES:
+                raise ValueError(
+                    f"サポートされていない検索モードです: {mode} {SEARCH_MODES}"
+                )
+            if max_results is not None and max_results < 1:
+                raise ValueError(
+                    f"max_results は1以上である必要があります: {max_results}"
+                )
+            if mmr:
+                mmr_lambda = settings.mmr_lambda if mmr_lambda is None else mmr_lambda
+                search_k = max(k, mmr_pool or settings.mmr_pool_size)
+            else:
+                search_k = k
+            # 存在しないコレクションの場合はエラーとする
+            store = self.collections.get(collection)
+            timings: dict[str, float] = {}
+            started = time.perf_counter()
+            if not query_text.strip():
+                # 空のクエリは埋め込み・検索せずに空の結果を返す
+                timings["total_ms"] = _elapsed_ms(started)
+                return self._query_response([], mode, collection, timings)
 
-            # ベクトルDBで類似検索
-            # filter_criteriaパラメータは使用されていないため削除
-            results = self.vector_store.similarity_search(query_embedding, k=k)
+            # 同じクエリの結果がキャッシュされており、その後ストアへの書き込みがなければ再利用する
+            # 世代は検索の前に取得し、検索中の書き込みを含まない結果が新しい世代で保存されないようにする
+            generation = store.write_generation
+            # 検索条件 (セマンティックキャッシュのキー) とクエリのテキスト
+            scope_key = (
+                collection or DEFAULT_COLLECTION,
+                store.table_name,
+                mode,
+                k,
+                nprobe,
+                json.dumps(filter_criteria, sort_keys=True, default=str),
+                (mmr_lambda, search_k) if mmr else None,
+                min_similarity,
+            )
+            # しきい値やMMRを指定した検索は、マイクロバッチとセマンティックキャッシュを使用しない
+            plain = not mmr and min_similarity is None
+            cache_key = (*scope_key, query_text)
+            cached = self.query_cache.get(cache_key, generation)
+            if cached is not None:
+                timings["total_ms"] = _elapsed_ms(started)
+                return self._finish_query(
+                    store,
+                    window,
+                    max_results,
+                    self._query_response(
+                        cached, mode, collection, timings, cache="exact"
+                    ),
+                )
 
-            # 返却結果の構造を修正
-            # vectordb.storage.py の similarity_search メソッドはタプルのリストを返す
-            # 例: [('doc1 text', 0.98), ('doc2 text', 0.95)]
-            return {
-                "status": "success",
-                "results": [
+            if mode == "vector" and plain and self.query_batcher is not None:
+                # 同時に届いたクエリとまとめて埋め込み・検索する
+                outcome = await self.query_batcher.submit(
+                    (store, nprobe), (query_text, k, scope_key, generation)
+                )
+                timings.update(outcome["timings"])
+                self.query_cache.put(cache_key, generation, outcome["results"])
+                timings["total_ms"] = _elapsed_ms(started)
+                return self._finish_query(
+                    store,
+                    window,
+                    max_results,
+                    self._query_response(
+                        outcome["results"],
+                        mode,
+                        collection,
+                        timings,
+                        batch_size=outcome["batch_size"],
+                        **outcome["cache"],
+                    ),
+                )
+
+            # コレクションの埋め込みと同じモデルでクエリの埋め込みを生成
+            stage = time.perf_counter()
+            query_embedding = embed_query(
+                query_text, self._embedding_model(store.embedding_model)
+            )
+            timings["embed_ms"] = _elapsed_ms(stage)
+
+            # 全文検索の結果はクエリのテキストに依存するため、セマンティックキャッシュはベクトル検索のみ
+            semantic_hit = None
+            if mode == "vector" and plain and self.semantic_cache.enabled:
+                stage = time.perf_counter()
+                semantic_hit = self._semantic_cache_lookup(
+                    store, scope_key, generation, query_embedding, k, nprobe
+                )
+                timings["semantic_cache_ms"] = _elapsed_ms(stage)
+            if semantic_hit is not None:
+                results, query_similarity = semantic_hit
+                self.query_cache.put(cache_key, generation, results)
+                timings["total_ms"] = _elapsed_ms(started)
+                return self._finish_query(
+                    store,
+                    window,
+                    max_results,
+                    self._query_response(
+                        results,
+                        mode,
+                        collection,
+                        timings,
+                        cache="semantic",
+                        cache_similarity=query_similarity,
+                    ),
+                )
+
+            if mode == "hybrid":
+                results = self._hybrid_search(
+                    store,
+                    query_text,
+                    query_embedding,
+                    search_k,
+                    timings,
+                    nprobe=nprobe,
+                    min_similarity=min_similarity,
+                )
+            else:
+                # ベクトルDBで類似検索
+                # filter_criteriaパラメータは使用されていないため削除
+                stage = time.perf_counter()
+                hits = store.similarity_search_with_ids(
+                    query_embedding,
+                    k=search_k,
+                    nprobe=nprobe,
+                    min_similarity=min_similarity,
+                )
+                timings["vector_search_ms"] = _elapsed_ms(stage)
+                # similarity_search_with_ids メソッドはタプルのリストを返す
+                # 例: [(1, 'doc1 text', 0.98), (2, 'doc2 text', 0.95)]
+                # id は /delete でチャンクを削除するときに使用できる
+                results = [
                     {
+                        "id": row_id,
                         "text": text,
                         "similarity": similarity,
                     }
-                    for text, similarity in results
+                    for row_id, text, similarity in hits
+                ]
+                if plain:
+                    self.semantic_cache.put(
+                        scope_key, generation, query_embedding, results
+                    )
+            if mmr:
+                results = self._diversify(
+                    store, query_embedding, results, k, mmr_lambda, timings
+                )
+            self.query_cache.put(cache_key, generation, results)
+            timings["total_ms"] = _elapsed_ms(started)
+            return self._finish_query(
+                store,
+                window,
+                max_results,
+                self._query_response(results, mode, collection, timings),
+            )
+
+        except Exception as e:
+            metrics.inc("rag_query_errors_total")
+            logger.error("検索中にエラーが発生しました: %s", e)
+            return {
+                "status": "error",
+                "message": f"検索中にエラーが発生しました: {str(e)}",
+            }
+
+    async def query_batch(
+        self,
+        query_texts: list[str],
+        k: int = 4,
+        search_mode: str | None = None,
+        nprobe: int | None = None,
+        collection: str | None = None,
+    ) -> dict[str, Any]:
+        """
+        複数のクエリに対して類似ドキュメントをまとめて検索する
+
+        キャッシュにないクエリの埋め込みはOllamaへの1回のリクエストで生成する。ベクトル検索では
+        `similarity_search_batch_with_ids` で1回にまとめて検索し、ハイブリッド検索では
+        クエリごとに全文検索と統合する。結果は `query` と同じキャッシュに保存される。
+
+        Args:
+            query_texts: 検索クエリのテキストのリスト
+            k: クエリごとに返却する類似ドキュメントの数
+            search_mode: 検索モード ("vector" または "hybrid")。
+                指定しない場合は設定値を使用する
+            nprobe: IVFインデックスでスキャンするリスト数 (IVF使用時のみ)
+            collection: 検索対象のコレクション名。指定しない場合はデフォルトのコレクション
+
+        Returns:
+            クエリと同じ順序の検索結果 (`queries`) と、バッチ全体の各ステージの処理時間 (ミリ秒) を含む辞書
+        """
+        try:
+            if not query_texts:
+                raise ValueError("クエリを1つ以上指定してください")
+            if len(query_texts) > settings.batch_max_items:
+                raise ValueError(
+                    f"1回に検索できるクエリは {settings.batch_max_items} 件までです: {len(query_texts)}"
+                )
+            mode = search_mode or settings.search_mode
+            if mode not in SEARCH_MODES:
+                raise ValueError(
+                    f"サポートされていない検索モードです: {mode} {SEARCH_MODES}"
+                )
+            store = self.collections.get(collection)
+            timings: dict[str, float] = {}
+            started = time.perf_counter()
+
+            generation = store.write_generation
+            # フィルタを指定しない `query` と同じキーで、キャッシュを共有する
+            scope_key = (
+                collection or DEFAULT_COLLECTION,
+                store.table_name,
+                mode,
+                k,
+                nprobe,
+                json.dumps(None),
+                None,
+                None,
+            )
+            outcomes: list[dict[str, Any] | None] = []
+            for query_text in query_texts:
+                cached = self.query_cache.get((*scope_key, query_text), generation)
+                outcomes.append(
+                    None if cached is None else {"results": cached, "cached": True}
+                )
+            misses = [i for i, outcome in enumerate(outcomes) if outcome is None]
+
+            if misses and mode == "vector":
+                batch = await self._process_query_batch(
+                    (store, nprobe),
+                    [(query_texts[i], k, scope_key, generation) for i in misses],
+                )
+                # バッチ内のすべてのクエリで同じ処理時間の辞書を共有している
+                timings.update(batch[0]["timings"])
+                for i, outcome in zip(misses, batch, strict=True):
+                    outcomes[i] = {
+                        "results": outcome["results"],
+                        "cached": bool(outcome["cache"]),
+                    }
+            elif misses:
+                stage = time.perf_counter()
+                query_embeddings = await asyncio.to_thread(
+                    embed_queries,
+                    [query_texts[i] for i in misses],
+                    self._embedding_model(store.embedding_model),
+                )
+                timings["embed_ms"] = _elapsed_ms(stage)
+                for i, query_embedding in zip(misses, query_embeddings, strict=True):
+                    query_timings: dict[str, float] = {}
+                    results = self._hybrid_search(
+                        store,
+                        query_texts[i],
+                        query_embedding,
+                        k,
+                        query_timings,
+                        nprobe=nprobe,
+                    )
+                    for name, elapsed in query_timings.items():
+                        timings[name] = round(timings.get(name, 0.0) + elapsed, 3)
+                    outcomes[i] = {"results": results, "cached": False}
+
+            for i in misses:
+                self.query_cache.put(
+                    (*scope_key, query_texts[i]), generation, outcomes[i]["results"]
+                )
+            timings["total_ms"] = _elapsed_ms(started)
+            return {
+                "status": "success",
+                "queries": [
+                    {
+                        "query": query_text,
+                        "results": [dict(result) for result in outcome["results"]],
+                        "cached": outcome["cached"],
+                    }
+                    for query_text, outcome in zip(query_texts, outcomes, strict=True)
                 ],
+                "search_mode": mode,
+                "collection": collection or DEFAULT_COLLECTION,
+                "timings": timings,
                 "message": "検索が完了しました",
             }
 
         except Exception as e:
+            logger.error("検索中にエラーが発生しました: %s", e)
             return {
                 "status": "error",
                 "message": f"検索中にエラーが発生しました: {str(e)}",
             }
 
+    @staticmethod
+    def _query_response(
+        results: list[dict[str, Any]],
+        mode: str,
+        collection: str | None,
+        timings: dict[str, float],
+        cache: str | None = None,
+        **extra: Any,
+    ) -> dict[str, Any]:
+        """
+        検索のレスポンスを作成する
+
+        Args:
+            results: 検索結果 (キャッシュと共有するため、レスポンスにはコピーを含める)
+            mode: 検索モード
+            collection: 検索対象のコレクション名
+            timings: 各ステージの処理時間 (ミリ秒)
+            cache: キャッシュから返した場合はキャッシュの種類 ("exact" または "semantic")
+            **extra: レスポンスに追加する項目 (cache_similarity, batch_size など)
+        """
+        response = {
+            "status": "success",
+            "results": [dict(result) for result in results],
+            "search_mode": mode,
+            "collection": collection or DEFAULT_COLLECTION,
+            "cached": cache is not None,
+        }
+        if cache is not None:
+            response["cache"] = cache
+        return {
+            **response,
+            **extra,
+            "timings": timings,
+            "message": "検索が完了しました",
+        }
+
+    @staticmethod
+    def _diversify(
+        store,
+        query_embedding: list[float],
+        results: list[dict[str, Any]],
+        k: int,
+        lambda_mult: float,
+        timings: dict[str, float],
+    ) -> list[dict[str, Any]]:
+        """
+        候補の検索結果から Maximal Marginal Relevance で k 件を選び直す
+
+        候補の埋め込みは1回のクエリで取得し、候補同士の類似度は NumPy の行列積で計算する。
+
+        Args:
+            store: 検索対象のコレクションのベクトルストア
+            query_embedding: クエリの埋め込み
+            results: 関連度の順に並べた候補の検索結果
+            k: 選択する件数
+            lambda_mult: 関連度の重み (1.0 で関連度のみ)
+            timings: 処理時間 (`mmr_ms`) を書き込む辞書
+
+        Returns:
+            MMRで選択した順に並べた検索結果
+        """
+        stage = time.perf_counter()
+        embeddings = store.get_embeddings([result["id"] for result in results])
+        candidates = [result for result in results if result["id"] in embeddings]
+        order = maximal_marginal_relevance(
+            query_embedding,
+            [embeddings[result["id"]] for result in candidates],
+            k,
+            lambda_mult,
+        )
+        timings["mmr_ms"] = _elapsed_ms(stage)
+        return [candidates[i] for i in order]
+
+    def _finish_query(
+        self,
+        store,
+        window: int,
+        max_results: int | None,
+        response: dict[str, Any],
+    ) -> dict[str, Any]:
+        """
+        検索のレスポンスに前後のチャンクを追加して結果を `max_results` 件までに絞り、
+        ステージごとの処理時間をメトリクスとログに記録する
+        """
+        response = self._with_context(store, window, response)
+        if max_results is not None:
+            # しきい値・MMR・前後のチャンクの追加の後に適用する上限
+            response["results"] = response["results"][:max_results]
+        logger.info(
+            "検索が完了しました",
+            extra=per_request(
+                collection=response["collection"],
+                mode=response["search_mode"],
+                results=len(response["results"]),
+                cache=response.get("cache", "miss"),
+                duration_ms=response["timings"].get("total_ms"),
+            ),
+        )
+        if metrics.enabled:
+            for name, elapsed_ms in response["timings"].items():
+                metrics.observe(
+                    "rag_query_stage_duration_seconds",
+                    elapsed_ms / 1000,
+                    stage=name.removesuffix("_ms"),
+                )
+            metrics.inc(
+                "rag_queries_total",
+                mode=response["search_mode"],
+                cache=response.get("cache", "miss"),
+            )
+        return response
+
+    @staticmethod
+    def _with_context(store, window: int, response: dict[str, Any]) -> dict[str, Any]:
+        """
+        検索結果に同じソースの前後のチャンクを連結したテキストを追加する
+
+        すべての結果の前後のチャンクは `neighbor_chunks` で1回にまとめて取得する。
+
+        Args:
+            store: 検索対象のコレクションのベクトルストア
+            window: 前後それぞれに含めるチャンク数。0 の場合は何もしない
+            response: `_query_response` で作成したレスポンス (結果はキャッシュと共有していないコピー)
+        """
+        if window <= 0 or not response["results"]:
+            return response
+        timings = response["timings"]
+        stage = time.perf_counter()
+        neighbors = store.neighbor_chunks(
+            [result["id"] for result in response["results"]], window
+        )
+        for result in response["results"]:
+            chunks = neighbors.get(result["id"]) or [(result["id"], result["text"])]
+            result["context"] = join_chunks([text for _, text in chunks])
+            result["context_ids"] = [row_id for row_id, _ in chunks]
+        timings["context_ms"] = _elapsed_ms(stage)
+        timings["total_ms"] = round(timings["total_ms"] + timings["context_ms"], 3)
+        return response
+
+    async def _process_query_batch(
+        self, key: tuple, items: list[tuple[str, int, tuple, int]]
+    ) -> list[dict[str, Any]]:
+        """
+        同時に届いたベクトル検索のクエリをまとめて処理する (`MicroBatcher` から呼び出される)
+
+        クエリの埋め込みはOllamaへの1回のリクエストで生成し、その間もイベントループは次のバッチの
+        リクエストを受け付ける。セマンティックキャッシュにヒットしなかったクエリは
+        `similarity_search_batch_with_ids` で1回にまとめて検索する。
+
+        Args:
+            key: (ベクトルストア, nprobe)
+            items: (クエリのテキスト, k, 検索条件のキー, 書き込み世代) のリスト
+
+        Returns:
+            クエリごとの検索結果 (`results`)、キャッシュの情報 (`cache`)、
+            バッチ全体の処理時間 (`timings`)、バッチの件数 (`batch_size`) を含む辞書のリスト
+        """
+        store, nprobe = key
+        timings: dict[str, float] = {}
+
+        stage = time.perf_counter()
+        query_embeddings = await asyncio.to_thread(
+            embed_queries,
+            [query_text for query_text, _, _, _ in items],
+            self._embedding_model(store.embedding_model),
+        )
+        timings["embed_ms"] = _elapsed_ms(stage)
+
+        outcomes: list[tuple[list[dict[str, Any]], dict[str, Any]] | None] = [
+            None
+        ] * len(items)
+        if self.semantic_cache.enabled:
+            stage = time.perf_counter()
+            for i, ((_, k, scope_key, generation), query_embedding) in enumerate(
+                zip(items, query_embeddings, strict=True)
+            ):
+                hit = self._semantic_cache_lookup(
+                    store, scope_key, generation, query_embedding, k, nprobe
+                )
+                if hit is not None:
+                    results, query_similarity = hit
+                    outcomes[i] = (
+                        results,
+                        {"cache": "semantic", "cache_similarity": query_similarity},
+                    )
+            timings["semantic_cache_ms"] = _elapsed_ms(stage)
+
+        misses = [i for i, outcome in enumerate(outcomes) if outcome is None]
+        if misses:
+            # k が異なるクエリは最大の k で検索し、クエリごとに切り詰める
+            stage = time.perf_counter()
+            hits_per_query = store.similarity_search_batch_with_ids(
+                [query_embeddings[i] for i in misses],
+                k=max(items[i][1] for i in misses),
+                nprobe=nprobe,
+            )
+            timings["vector_search_ms"] = _elapsed_ms(stage)
+            for i, hits in zip(misses, hits_per_query, strict=True):
+                _, k, scope_key, generation = items[i]
+                results = [
+                    {"id": row_id, "text": text, "similarity": similarity}
+                    for row_id, text, similarity in hits[:k]
+                ]
+                self.semantic_cache.put(
+                    scope_key, generation, query_embeddings[i], results
+                )
+                outcomes[i] = (results, {})
+
+        return [
+            {
+                "results": results,
+                "cache": cache,
+                "timings": timings,
+                "batch_size": len(items),
+            }
+            for results, cache in outcomes
+        ]
+
+    def _semantic_cache_lookup(
+        self,
+        store,
+        scope_key: tuple,
+        generation: int,
+        query_embedding: list[float],
+        k: int,
+        nprobe: int | None,
+    ) -> tuple[list[dict[str, Any]], float] | None:
+        """
+        埋め込みが近いクエリの検索結果をセマンティックキャッシュから取得する
+
+        キャッシュした結果の類似度は、新しいクエリの埋め込みで該当する行だけを計算し直して並べ替える。
+        ヒットのうち `semantic_cache_verify_rate` の割合は実際に検索して上位の結果と比較し、
+        誤ヒットとして記録する (比較した場合は検索結果を返す)。
+
+        Returns:
+            (検索結果, キャッシュしたクエリとの埋め込みのコサイン類似度)。ヒットしない場合は None
+        """
+        hit = self.semantic_cache.get(scope_key, generation, query_embedding)
+        if hit is None:
+            return None
+        cached, query_similarity = hit
+        similarities = store.similarities_by_ids(
+            query_embedding, [result["id"] for result in cached]
+        )
+        results = sorted(
+            (
+                {**result, "similarity": similarities[result["id"]]}
+                for result in cached
+                if result["id"] in similarities
+            ),
+            key=lambda result: result["similarity"],
+            reverse=True,
+        )
+        if random.random() < settings.semantic_cache_verify_rate:
+            hits = store.similarity_search_with_ids(query_embedding, k=k, nprobe=nprobe)
+            self.semantic_cache.record_verification(
+                [row_id for row_id, _, _ in hits]
+                == [result["id"] for result in results]
+            )
+            results = [
+                {"id": row_id, "text": text, "similarity": similarity}
+                for row_id, text, similarity in hits
+            ]
+        return results, round(query_similarity, 6)
+
+    def _hybrid_search(
+        self,
+        store,
+        query_text: str,
+        query_embedding: list[float],
+        k: int,
+        timings: dict[str, float],
+        nprobe: int | None = None,
+        min_similarity: float | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        ベクトル検索とBM25全文検索を実行し、Reciprocal Rank Fusionで統合する
+
+        Args:
+            store: 検索対象のコレクションのベクトルストア
+            query_text: 検索クエリのテキスト
+            query_embedding: クエリの埋め込み
+            k: 返却する類似ドキュメントの数
+            timings: 各ステージの処理時間 (ミリ秒) を書き込む辞書
+            nprobe: IVFインデックスでスキャンするリスト数 (IVF使用時のみ)
+            min_similarity: 結果のコサイン類似度の下限 (全文検索のみでヒットした行にも適用する)
+
+        Returns:
+            RRFスコアの降順に並べた検索結果のリスト
+        """
+        pool = max(k, settings.hybrid_candidates)
+
+        stage = time.perf_counter()
+        vector_hits = store.similarity_search_with_ids(
+            query_embedding, k=pool, nprobe=nprobe, min_similarity=min_similarity
+        )
+        timings["vector_search_ms"] = _elapsed_ms(stage)
+
+        stage = time.perf_counter()
+        lexical_hits = store.lexical_search(query_text, k=pool)
+        timings["lexical_search_ms"] = _elapsed_ms(stage)
+
+        stage = time.perf_counter()
+        fused = reciprocal_rank_fusion(
+            [
+                [row_id for row_id, _, _ in vector_hits],
+                [row_id for row_id, _, _ in lexical_hits],
+            ],
+            k=settings.rrf_k,
+        )
+        if min_similarity is None:
+            fused = fused[:k]
+        texts = {row_id: text for row_id, text, _ in vector_hits + lexical_hits}
+        similarities = {row_id: similarity for row_id, _, similarity in vector_hits}
+        bm25_scores = {row_id: score for row_id, _, score in lexical_hits}
+        # 全文検索のみでヒットした行の類似度を補完する
+        missing = [row_id for row_id, _ in fused if row_id not in similarities]
+        similarities.update(store.similarities_by_ids(query_embedding, missing))
+        if min_similarity is not None:
+            fused = [
+                (row_id, rrf_score)
+                for row_id, rrf_score in fused
+                if similarities.get(row_id, 0.0) >= min_similarity
+            ][:k]
+        results = [
+            {
+                "id": row_id,
+                "text": texts[row_id],
+                "similarity": similarities.get(row_id, 0.0),
+                "rrf_score": rrf_score,
+                "bm25_score": bm25_scores.get(row_id),
+            }
+            for row_id, rrf_score in fused
+        ]
+        timings["fusion_ms"] = _elapsed_ms(stage)
+        return results
+
     async def add_single_content(
-        self, content: str, metadata: dict[str, Any] | None = None
+        self,
+        content: str,
+        metadata: dict[str, Any] | None = None,
+        collection: str | None = None,
     ) -> dict[str, Any]:
         """
         単一のテキストコンテンツを処理し、チャンク化してベクトルDBに保存する
 
+        ニアデュプリケートの除外が有効な場合、保存済みのチャンクと重複するチャンクは保存しない
+
         Args:
             content: 登録するテキストコンテンツ
             metadata: コンテンツに関連するメタデータ (オプション)
+            collection: 保存先のコレクション名 (存在しない場合は作成する)。
+                指定しない場合はデフォルトのコレクション
 
         Returns:
             処理結果を含む辞書
@@ -158,9 +1062,9 @@ class RAGCore:
             # コンテンツをDocumentオブジェクトに変換
             doc_metadata = metadata if metadata is not None else {}
             document = Document(page_content=content, metadata=doc_metadata)
+            started = time.perf_counter()
 
             # ドキュメントの分割
-            print("コンテンツをチャンクに分割中...")
             chunks = split_documents([document])
             if not chunks:
                 return {
@@ -171,27 +1075,414 @@ class RAGCore:
             # テキストとメタデータの抽出
             texts = [chunk.page_content for chunk in chunks]
 
-            # 埋め込みの生成
-            print("埋め込みを生成中...")
-            embeddings = embed_texts(texts, self.embeddings)
+            with self._write_lock:
+                # ニアデュプリケートの除外・埋め込みの生成・ベクトルDBへの保存
+                stats = self._store_chunks(
+                    collection,
+                    texts,
+                    sources=[doc_metadata.get("source")] * len(texts),
+                    ordinals=list(range(len(texts))),
+                    content_hashes=[hash_content(content)] * len(texts),
+                )
 
-            # ベクトルDBへの保存
-            print("ベクトルDBに保存中...")
-            self.vector_store.add_embeddings(texts, embeddings)
+            logger.info(
+                "コンテンツを登録しました",
+                extra=per_request(
+                    collection=collection or DEFAULT_COLLECTION,
+                    chunks=len(chunks),
+                    embedded_chunks=stats["embedded_chunks"],
+                    duration_ms=_elapsed_ms(started),
+                ),
+            )
+            return {
+                "status": "success",
+                "processed_chunks": len(chunks),
+                "embedded_chunks": stats["embedded_chunks"],
+                "duplicate_chunks": stats["duplicate_chunks"],
+                "collection": collection or DEFAULT_COLLECTION,
+                "message": "コンテンツの処理が完了しました",
+            }
 
+        except Exception as e:
+            logger.error("コンテンツ処理中にエラーが発生しました: %s", e)
+            return {
+                "status": "error",
+                "message": f"コンテンツ処理中にエラーが発生しました: {str(e)}",
+            }
+
+    async def add_contents(
+        self,
+        contents: list[dict[str, Any]],
+        collection: str | None = None,
+    ) -> dict[str, Any]:
+        """
+        複数のテキストコンテンツをチャンク化し、まとめてベクトルDBに保存する
+
+        すべてのコンテンツのチャンクの埋め込みを1回で生成し、1回の書き込みで保存する
+
+        Args:
+            contents: コンテンツ (`content`) とメタデータ (`metadata`、オプション) の辞書のリスト
+            collection: 保存先のコレクション名 (存在しない場合は作成する)。
+                指定しない場合はデフォルトのコレクション
+
+        Returns:
+            コンテンツごとのチャンク数 (`chunks_per_content`) を含む処理結果の辞書
+        """
+        try:
+            if not contents:
+                raise ValueError("コンテンツを1つ以上指定してください")
+            if len(contents) > settings.batch_max_items:
+                raise ValueError(
+                    f"1回に追加できるコンテンツは {settings.batch_max_items} 件までです: {len(contents)}"
+                )
+            started = time.perf_counter()
+            chunks_per_content = [
+                split_documents(
+                    [
+                        Document(
+                            page_content=item["content"],
+                            metadata=item.get("metadata") or {},
+                        )
+                    ]
+                )
+                for item in contents
+            ]
+            chunks = [chunk for chunks in chunks_per_content for chunk in chunks]
+            if not chunks:
+                return {
+                    "status": "no_chunks",
+                    "message": "コンテンツからチャンクが生成されませんでした",
+                }
+
+            texts = [chunk.page_content for chunk in chunks]
+
+            with self._write_lock:
+                stats = self._store_chunks(
+                    collection,
+                    texts,
+                    sources=[chunk.metadata.get("source") for chunk in chunks],
+                    ordinals=[
+                        ordinal
+                        for chunks in chunks_per_content
+                        for ordinal in range(len(chunks))
+                    ],
+                    content_hashes=[
+                        hash_content(item["content"])
+                        for item, chunks in zip(
+                            contents, chunks_per_content, strict=True
+                        )
+                        for _ in chunks
+                    ],
+                )
+
+            logger.info(
+                "コンテンツを登録しました",
+                extra=per_request(
+                    collection=collection or DEFAULT_COLLECTION,
+                    contents=len(contents),
+                    chunks=len(chunks),
+                    embedded_chunks=stats["embedded_chunks"],
+                    duration_ms=_elapsed_ms(started),
+                ),
+            )
             return {
                 "status": "success",
                 "processed_chunks": len(chunks),
+                "embedded_chunks": stats["embedded_chunks"],
+                "duplicate_chunks": stats["duplicate_chunks"],
+                "chunks_per_content": [len(chunks) for chunks in chunks_per_content],
+                "collection": collection or DEFAULT_COLLECTION,
                 "message": "コンテンツの処理が完了しました",
             }
 
         except Exception as e:
+            logger.error("コンテンツ処理中にエラーが発生しました: %s", e)
             return {
                 "status": "error",
                 "message": f"コンテンツ処理中にエラーが発生しました: {str(e)}",
             }
 
+    async def upsert_content(
+        self,
+        source: str,
+        content: str,
+        metadata: dict[str, Any] | None = None,
+        collection: str | None = None,
+    ) -> dict[str, Any]:
+        """
+        ソースのチャンクを新しいコンテンツのチャンクで置き換える
+
+        古いチャンクの削除と新しいチャンクの追加は1つのトランザクションで行われる。
+        ニアデュプリケートの除外が有効な場合、ほかのソースのチャンクと重複するチャンクは保存しない
+
+        Args:
+            source: 置き換えるドキュメントのソース
+            content: 新しいテキストコンテンツ
+            metadata: コンテンツに関連するメタデータ (オプション)
+            collection: 保存先のコレクション名 (存在しない場合は作成する)。
+                指定しない場合はデフォルトのコレクション
+
+        Returns:
+            処理結果を含む辞書
+        """
+        try:
+            doc_metadata = {**(metadata or {}), "source": source}
+            chunks = split_documents(
+                [Document(page_content=content, metadata=doc_metadata)]
+            )
+            texts = [chunk.page_content for chunk in chunks]
+            with self._write_lock:
+                stats = self._store_chunks(
+                    collection,
+                    texts,
+                    sources=[source] * len(texts),
+                    ordinals=list(range(len(texts))),
+                    content_hashes=[hash_content(content)] * len(texts),
+                    replace_source=source,
+                )
+
+            return {
+                "status": "success",
+                "source": source,
+                "deleted_chunks": stats["deleted_chunks"],
+                "processed_chunks": len(texts),
+                "embedded_chunks": stats["embedded_chunks"],
+                "duplicate_chunks": stats["duplicate_chunks"],
+                "collection": collection or DEFAULT_COLLECTION,
+                "message": "コンテンツの置き換えが完了しました",
+            }
+
+        except Exception as e:
+            logger.error("コンテンツの置き換え中にエラーが発生しました: %s", e)
+            return {
+                "status": "error",
+                "message": f"コンテンツの置き換え中にエラーが発生しました: {str(e)}",
+            }
+
+    async def delete(
+        self,
+        source: str | None = None,
+        ids: list[int] | None = None,
+        collection: str | None = None,
+    ) -> dict[str, Any]:
+        """
+        ソースまたはIDを指定してチャンクを削除する
+
+        Args:
+            source: 削除するドキュメントのソース (そのすべてのチャンクを削除する)
+            ids: 削除するチャンクのID (検索結果の id)
+            collection: 削除対象のコレクション名。指定しない場合はデフォルトのコレクション
+
+        Returns:
+            処理結果を含む辞書
+        """
+        try:
+            with self._write_lock:
+                store = self.collections.get(collection)
+                deleted = 0
+                with store.transaction():
+                    if source is not None:
+                        deleted += store.delete_by_source(source)
+                    if ids:
+                        deleted += store.delete_by_ids(ids)
+                store.maintain_index()
+            return {
+                "status": "success",
+                "deleted_chunks": deleted,
+                "collection": collection or DEFAULT_COLLECTION,
+                "message": "チャンクの削除が完了しました",
+            }
+
+        except Exception as e:
+            logger.error("削除中にエラーが発生しました: %s", e)
+            return {
+                "status": "error",
+                "message": f"削除中にエラーが発生しました: {str(e)}",
+            }
+
+    async def compact(self, collection: str | None = None) -> dict[str, Any]:
+        """
+        削除済みの行の領域を回収し、近似検索・全文検索インデックスを作り直す
+
+        Args:
+            collection: 対象のコレクション名。指定しない場合はデフォルトのコレクション
+
+        Returns:
+            行数とデータベースファイルの圧縮前後のサイズを含む辞書
+        """
+        try:
+            with self._write_lock:
+                stats = self.collections.get(collection).compact()
+            return {
+                "status": "success",
+                **stats,
+                "collection": collection or DEFAULT_COLLECTION,
+                "message": "コンパクションが完了しました",
+            }
+
+        except Exception as e:
+            logger.error("コンパクション中にエラーが発生しました: %s", e)
+            return {
+                "status": "error",
+                "message": f"コンパクション中にエラーが発生しました: {str(e)}",
+            }
+
+    async def reembed(
+        self,
+        model_name: str,
+        collection: str | None = None,
+        batch_size: int | None = None,
+        pause_seconds: float = 0.0,
+        profile: bool = False,
+    ) -> dict[str, Any]:
+        """
+        コレクションのチャンクを別の埋め込みモデルでベクトル化し直すジョブをバックグラウンドで開始する
+
+        ジョブの実行中も検索と書き込みは元のテーブルで続けられ、完了するとテーブルと
+        クエリの埋め込みに使用するモデルが切り替わる。進捗は `reembed_status` で確認できる
+
+        Args:
+            model_name: 新しい埋め込みモデルの名前
+            collection: 対象のコレクション名。指定しない場合はデフォルトのコレクション
+            batch_size: 1回にベクトル化・保存するチャンク数。指定しない場合は設定値
+            pause_seconds: バッチの間で待機する秒数
+            profile: ジョブを cProfile で計測するか (`RAG_PROFILE_DIR` が設定されている場合のみ)
+
+        Returns:
+            ジョブの状態を含む辞書
+        """
+        try:
+            name = collection or DEFAULT_COLLECTION
+            self.collections.get(name)  # 存在しないコレクションの場合はエラーとする
+            job = self._reembed_jobs.get(name)
+            if job is not None and job["status"] == "running":
+                raise ValueError(f"コレクション {name} の再埋め込みは実行中です")
+            job = {
+                "status": "running",
+                "collection": name,
+                "embedding_model": model_name,
+                "embedded_rows": 0,
+                "total_rows": None,
+                "started_at": datetime.now().isoformat(),
+            }
+            self._reembed_jobs[name] = job
+            task = asyncio.create_task(
+                self._run_reembed(
+                    job,
+                    model_name,
+                    name,
+                    batch_size or settings.ingest_batch_size,
+                    pause_seconds,
+                    profile,
+                )
+            )
+            # 実行中のタスクがガベージコレクションされないよう参照を保持する
+            self._reembed_tasks.add(task)
+            task.add_done_callback(self._reembed_tasks.discard)
+            return {
+                **job,
+                "message": "再埋め込みを開始しました",
+            }
+
+        except Exception as e:
+            logger.error("再埋め込みの開始中にエラーが発生しました: %s", e)
+            return {
+                "status": "error",
+                "message": f"再埋め込みの開始中にエラーが発生しました: {str(e)}",
+            }
+
+    async def _run_reembed(
+        self,
+        job: dict[str, Any],
+        model_name: str,
+        collection: str,
+        batch_size: int,
+        pause_seconds: float,
+        profile: bool = False,
+    ):
+        """再埋め込みを別のスレッドで実行し、完了後に元のテーブルを削除する"""
+
+        def on_progress(embedded_rows: int, total_rows: int):
+            job["embedded_rows"] = embedded_rows
+            job["total_rows"] = total_rows
+
+        def run_job() -> dict[str, Any]:
+            # cProfile は有効にしたスレッドの処理だけを計測するため、ジョブのスレッドで計測する
+            with profiler.profile(f"reembed-{collection}", force=profile):
+                return reembed_collection(
+                    self.collections,
+                    self._embedding_model(model_name),
+                    model_name,
+                    collection=collection,
+                    batch_size=batch_size,
+                    pause_seconds=pause_seconds,
+                    drop_previous=False,
+                    write_lock=self._write_lock,
+                    on_progress=on_progress,
+                )
+
+        try:
+            stats = await asyncio.to_thread(run_job)
+            # 切り替え前に取得したストアで実行中の検索がないよう、イベントループのスレッドで削除する
+            self.collections.drop_retired()
+            job.update(status="completed", result=stats)
+        except Exception as e:
+            logger.error("再埋め込み中にエラーが発生しました: %s", e)
+            job.update(
+                status="error",
+                message=f"再埋め込み中にエラーが発生しました (同じモデルで再実行すると続きから再開します): {str(e)}",
+            )
+        job["finished_at"] = datetime.now().isoformat()
+
+    def cache_stats(self) -> dict[str, Any]:
+        """検索結果のキャッシュ・セマンティックキャッシュのヒット率などの統計を返す"""
+        return {
+            "status": "success",
+            "query_cache": self.query_cache.stats(),
+            "semantic_cache": self.semantic_cache.stats(),
+        }
+
+    def batching_stats(self) -> dict[str, Any]:
+        """クエリのマイクロバッチのバッチサイズとレイテンシのヒストグラムを返す"""
+        if self.query_batcher is None:
+            return {"status": "success", "enabled": False}
+        return {
+            "status": "success",
+            "enabled": True,
+            **self.query_batcher.stats(),
+        }
+
+    def collect_metrics(self):
+        """キャッシュ・マイクロバッチ・再埋め込みジョブの現在の状態をメトリクスに反映する"""
+        for name, cache in (
+            ("exact", self.query_cache),
+            ("semantic", self.semantic_cache),
+        ):
+            stats = cache.stats()
+            metrics.set_counter(
+                "rag_cache_lookups_total", stats["hits"], cache=name, result="hit"
+            )
+            metrics.set_counter(
+                "rag_cache_lookups_total", stats["misses"], cache=name, result="miss"
+            )
+            metrics.set_gauge("rag_cache_entries", stats["entries"], cache=name)
+        if self.query_batcher is not None:
+            metrics.set_gauge(
+                "rag_query_batch_queue_depth", self.query_batcher.stats()["pending"]
+            )
+        metrics.set_gauge(
+            "rag_reembed_jobs_running",
+            sum(job["status"] == "running" for job in self._reembed_jobs.values()),
+        )
+
+    def reembed_status(self) -> dict[str, Any]:
+        """再埋め込みジョブの状態を返す"""
+        return {
+            "status": "success",
+            "jobs": list(self._reembed_jobs.values()),
+        }
+
     def close(self):
         """リソースの解放"""
-        if hasattr(self, "vector_store"):
-            self.vector_store.close()
+        if hasattr(self, "collections"):
+            self.collections.close()
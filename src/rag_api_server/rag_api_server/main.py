@@ -1,14 +1,22 @@
+import logging
+import time
 from contextlib import asynccontextmanager
-from typing import Any
+from typing import Any, Literal
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, Field
+from rag_core.log import configure_logging, request_context
+from rag_core.metrics import PROMETHEUS_CONTENT_TYPE, metrics
+from rag_core.profiling import profiler
 
+from .config import settings
 from .core import RAGCore
 
+logger = logging.getLogger(__name__)
+
 # グローバル変数としてRAGCoreインスタンスを保持
 rag_core: RAGCore | None = None
 
@@ -20,15 +28,15 @@ async def lifespan(app: FastAPI):
     """
     # アプリケーション起動時の処理
     global rag_core
+    configure_logging(settings.log_level, settings.log_format)
     rag_core = RAGCore()
-    print("RAGCoreの初期化が完了しました。")
 
     yield
 
     # アプリケーション終了時の処理
     if rag_core:
         rag_core.close()
-        print("RAGCoreのリソースを解放しました。")
+        logger.info("RAGCoreのリソースを解放しました。")
 
 
 app = FastAPI(
@@ -55,6 +63,67 @@ async def http_exception_handler(request, exc):
     )
 
 
+metrics.describe(
+    "rag_http_request_duration_seconds",
+    "histogram",
+    "レスポンスのシリアライズを含むリクエストごとの処理時間",
+)
+
+
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    """
+    レスポンスのシリアライズを含むリクエストごとの処理時間をメトリクスに記録する
+    """
+    if not metrics.enabled:
+        return await call_next(request)
+    started = time.perf_counter()
+    response = await call_next(request)
+    # パスのパラメータで系列が増えないよう、ルートのパターンをラベルにする
+    route = request.scope.get("route")
+    metrics.observe(
+        "rag_http_request_duration_seconds",
+        time.perf_counter() - started,
+        method=request.method,
+        path=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    return response
+
+
+async def profile_request(request: Request, call_next):
+    """
+    X-Profile ヘッダーを指定したリクエストと、RAG_PROFILE_SAMPLE_RATE の割合で選ばれたリクエストを
+    cProfile で計測し、書き出したファイル名をレスポンスの X-Profile-File ヘッダーで返す
+    """
+    forced = request.headers.get("X-Profile", "").lower() in ("1", "true")
+    with profiler.profile(request.url.path, force=forced) as session:
+        response = await call_next(request)
+    if session is not None and session.path is not None:
+        response.headers["X-Profile-File"] = session.path.name
+    return response
+
+
+# プロファイリングが無効の場合は、ミドルウェアを追加しない
+if settings.profile_dir:
+    app.middleware("http")(profile_request)
+
+
+@app.middleware("http")
+async def bind_request_id(request: Request, call_next):
+    """
+    リクエストの処理中のログにリクエストIDを付与し、レスポンスの X-Request-ID ヘッダーで返す
+
+    クライアントが X-Request-ID ヘッダーを送った場合はその値を使用する。
+    """
+    with request_context(
+        request.headers.get("X-Request-ID"), settings.log_sample_rate
+    ) as request_id:
+        response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
 # CORS設定
 app.add_middleware(
     CORSMiddleware,
@@ -73,6 +142,10 @@ class DocumentRequest(BaseModel):
     glob_pattern: str = Field(
         default="**/*[.md|.txt]", description="処理対象ファイルのフィルタリングパターン"
     )
+    collection: str | None = Field(
+        default=None,
+        description="保存先のコレクション名（存在しない場合は作成、省略時はデフォルトのコレクション）",
+    )
 
 
 class ContentRequest(BaseModel):
@@ -80,6 +153,86 @@ class ContentRequest(BaseModel):
     metadata: dict[str, Any] | None = Field(
         default=None, description="コンテンツに関連するメタデータ"
     )
+    collection: str | None = Field(
+        default=None,
+        description="保存先のコレクション名（存在しない場合は作成、省略時はデフォルトのコレクション）",
+    )
+
+
+class ContentItem(BaseModel):
+    content: str = Field(..., description="処理対象のテキストコンテンツ")
+    metadata: dict[str, Any] | None = Field(
+        default=None, description="コンテンツに関連するメタデータ"
+    )
+
+
+class ContentsRequest(BaseModel):
+    contents: list[ContentItem] = Field(
+        ..., min_length=1, description="まとめて追加するコンテンツのリスト"
+    )
+    collection: str | None = Field(
+        default=None,
+        description="保存先のコレクション名（存在しない場合は作成、省略時はデフォルトのコレクション）",
+    )
+
+
+class UpsertRequest(BaseModel):
+    source: str = Field(
+        ..., description="置き換えるドキュメントのソース（ファイルパスやURLなど）"
+    )
+    content: str = Field(..., description="新しいテキストコンテンツ")
+    metadata: dict[str, Any] | None = Field(
+        default=None, description="コンテンツに関連するメタデータ"
+    )
+    collection: str | None = Field(
+        default=None,
+        description="保存先のコレクション名（存在しない場合は作成、省略時はデフォルトのコレクション）",
+    )
+
+
+class DeleteRequest(BaseModel):
+    source: str | None = Field(
+        default=None,
+        description="削除するドキュメントのソース（そのすべてのチャンクを削除）",
+    )
+    ids: list[int] | None = Field(
+        default=None, description="削除するチャンクのID（/query の結果の id）"
+    )
+    collection: str | None = Field(
+        default=None,
+        description="削除対象のコレクション名（省略時はデフォルトのコレクション）",
+    )
+
+
+class CompactRequest(BaseModel):
+    collection: str | None = Field(
+        default=None,
+        description="対象のコレクション名（省略時はデフォルトのコレクション）",
+    )
+
+
+class ReembedRequest(BaseModel):
+    model_name: str = Field(
+        ..., description="新しい埋め込みモデルの名前（Ollamaのモデル名）"
+    )
+    collection: str | None = Field(
+        default=None,
+        description="対象のコレクション名（省略時はデフォルトのコレクション）",
+    )
+    batch_size: int | None = Field(
+        default=None,
+        ge=1,
+        description="1回にベクトル化・保存するチャンク数（省略時は RAG_INGEST_BATCH_SIZE）",
+    )
+    pause_seconds: float = Field(
+        default=0.0,
+        ge=0.0,
+        description="バッチの間で待機する秒数（Ollamaや検索への負荷の調整用）",
+    )
+    profile: bool = Field(
+        default=False,
+        description="ジョブを cProfile で計測するか（RAG_PROFILE_DIR が設定されている場合のみ）",
+    )
 
 
 class QueryRequest(BaseModel):
@@ -88,6 +241,70 @@ class QueryRequest(BaseModel):
     filter_criteria: dict[str, Any] | None = Field(
         default=None, description="検索結果をフィルタリングするための条件"
     )
+    search_mode: Literal["vector", "hybrid"] | None = Field(
+        default=None,
+        description="検索モード。hybrid はベクトル検索とBM25全文検索をRRFで統合する（省略時は設定値）",
+    )
+    nprobe: int | None = Field(
+        default=None,
+        ge=1,
+        description="IVFインデックスでスキャンするリスト数（IVF使用時のみ、省略時は設定値）",
+    )
+    collection: str | None = Field(
+        default=None,
+        description="検索対象のコレクション名（省略時はデフォルトのコレクション）",
+    )
+    window: int = Field(
+        default=0,
+        ge=0,
+        description="各結果に連結して返す同じソースの前後のチャンク数（0 の場合は連結しない）",
+    )
+    mmr: bool = Field(
+        default=False,
+        description="Maximal Marginal Relevance で上位の候補から重複の少ない k 件を選び直すか",
+    )
+    mmr_lambda: float | None = Field(
+        default=None,
+        ge=0.0,
+        le=1.0,
+        description="MMRの関連度の重み（1.0 で関連度のみ、省略時は設定値）",
+    )
+    mmr_pool: int | None = Field(
+        default=None,
+        ge=1,
+        description="MMRで選び直す候補数（省略時は設定値、k 未満の場合は k）",
+    )
+    min_similarity: float | None = Field(
+        default=None,
+        ge=-1.0,
+        le=1.0,
+        description="返す結果のコサイン類似度の下限（k 件に満たなくてもそのまま返す。リストのスキャンを省略できるのはIVFインデックスのみ）",
+    )
+    max_results: int | None = Field(
+        default=None,
+        ge=1,
+        description="返す結果の件数の上限（しきい値・MMR・前後のチャンクの追加の後に適用する。k は検索する候補数）",
+    )
+
+
+class QueryBatchRequest(BaseModel):
+    queries: list[str] = Field(
+        ..., min_length=1, description="まとめて検索するクエリのテキストのリスト"
+    )
+    k: int = Field(default=4, description="クエリごとに返却する類似ドキュメントの数")
+    search_mode: Literal["vector", "hybrid"] | None = Field(
+        default=None,
+        description="検索モード。hybrid はベクトル検索とBM25全文検索をRRFで統合する（省略時は設定値）",
+    )
+    nprobe: int | None = Field(
+        default=None,
+        ge=1,
+        description="IVFインデックスでスキャンするリスト数（IVF使用時のみ、省略時は設定値）",
+    )
+    collection: str | None = Field(
+        default=None,
+        description="検索対象のコレクション名（省略時はデフォルトのコレクション）",
+    )
 
 
 # APIエンドポイント
@@ -99,7 +316,9 @@ async def process_directory(request: DocumentRequest) -> dict[str, Any]:
     if not rag_core:
         raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
     return await rag_core.process_directory(
-        request.source_path, glob_pattern=request.glob_pattern
+        request.source_path,
+        glob_pattern=request.glob_pattern,
+        collection=request.collection,
     )
 
 
@@ -110,7 +329,89 @@ async def add_content(request: ContentRequest) -> dict[str, Any]:
     """
     if not rag_core:
         raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
-    return await rag_core.add_single_content(request.content, metadata=request.metadata)
+    return await rag_core.add_single_content(
+        request.content, metadata=request.metadata, collection=request.collection
+    )
+
+
+@app.post("/add-contents")
+async def add_contents(request: ContentsRequest) -> dict[str, Any]:
+    """
+    複数のテキストコンテンツをまとめて処理し、ベクトルDBに保存する
+    """
+    if not rag_core:
+        raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
+    return await rag_core.add_contents(
+        [item.model_dump() for item in request.contents],
+        collection=request.collection,
+    )
+
+
+@app.post("/upsert-content")
+async def upsert_content(request: UpsertRequest) -> dict[str, Any]:
+    """
+    ソースのチャンクを新しいコンテンツのチャンクでアトミックに置き換える
+    """
+    if not rag_core:
+        raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
+    return await rag_core.upsert_content(
+        request.source,
+        request.content,
+        metadata=request.metadata,
+        collection=request.collection,
+    )
+
+
+@app.post("/delete")
+async def delete(request: DeleteRequest) -> dict[str, Any]:
+    """
+    ソースまたはIDを指定してチャンクを削除する
+    """
+    if not rag_core:
+        raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
+    if request.source is None and not request.ids:
+        raise HTTPException(
+            status_code=400, detail="source または ids を指定してください"
+        )
+    return await rag_core.delete(
+        source=request.source, ids=request.ids, collection=request.collection
+    )
+
+
+@app.post("/compact")
+async def compact(request: CompactRequest) -> dict[str, Any]:
+    """
+    削除済みの行の領域を回収し、インデックスを作り直す
+    """
+    if not rag_core:
+        raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
+    return await rag_core.compact(collection=request.collection)
+
+
+@app.post("/reembed")
+async def reembed(request: ReembedRequest) -> dict[str, Any]:
+    """
+    コレクションのチャンクを別の埋め込みモデルでベクトル化し直すジョブを開始する
+    """
+    if not rag_core:
+        raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
+    return await rag_core.reembed(
+        request.model_name,
+        collection=request.collection,
+        batch_size=request.batch_size,
+        pause_seconds=request.pause_seconds,
+        profile=request.profile,
+    )
+
+
+@app.get("/reembed")
+async def reembed_status() -> dict[str, Any]:
+    """
+    再埋め込みジョブの状態を返す
+    """
+    if not rag_core:
+        raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
+    return rag_core.reembed_status()
 
 
 @app.post("/query")
@@ -121,10 +422,82 @@ async def query(request: QueryRequest) -> dict[str, Any]:
     if not rag_core:
         raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
     return await rag_core.query(
-        request.query, k=request.k, filter_criteria=request.filter_criteria
+        request.query,
+        k=request.k,
+        filter_criteria=request.filter_criteria,
+        search_mode=request.search_mode,
+        nprobe=request.nprobe,
+        collection=request.collection,
+        window=request.window,
+        mmr=request.mmr,
+        mmr_lambda=request.mmr_lambda,
+        mmr_pool=request.mmr_pool,
+        min_similarity=request.min_similarity,
+        max_results=request.max_results,
+    )
+
+
+@app.post("/query-batch")
+async def query_batch(request: QueryBatchRequest) -> dict[str, Any]:
+    """
+    複数のクエリに対して類似ドキュメントをまとめて検索する
+    """
+    if not rag_core:
+        raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
+    return await rag_core.query_batch(
+        request.queries,
+        k=request.k,
+        search_mode=request.search_mode,
+        nprobe=request.nprobe,
+        collection=request.collection,
     )
 
 
+@app.get("/cache")
+async def cache_stats() -> dict[str, Any]:
+    """
+    検索結果のキャッシュのヒット率などの統計を返す
+    """
+    if not rag_core:
+        raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
+    return rag_core.cache_stats()
+
+
+@app.get("/batching")
+async def batching_stats() -> dict[str, Any]:
+    """
+    クエリのマイクロバッチのバッチサイズとレイテンシのヒストグラムを返す
+    """
+    if not rag_core:
+        raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
+    return rag_core.batching_stats()
+
+
+@app.get("/collections")
+async def list_collections() -> dict[str, Any]:
+    """
+    登録されているコレクションの一覧を返す
+    """
+    if not rag_core:
+        raise HTTPException(status_code=500, detail="RAGCoreが初期化されていません")
+    return rag_core.list_collections()
+
+
+@app.get("/metrics")
+async def get_metrics() -> Response:
+    """
+    ステージごとの処理時間のヒストグラムと件数を Prometheus のテキスト形式で返す
+    """
+    if not settings.metrics_enabled:
+        raise HTTPException(
+            status_code=404,
+            detail="メトリクスは無効です (RAG_METRICS_ENABLED=true で有効になります)",
+        )
+    if rag_core:
+        rag_core.collect_metrics()
+    return Response(content=metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 # 基本的なルート
 @app.get("/")
 async def root():
@@ -2,13 +2,41 @@ from pathlib import Path
 
 import typer
 
-from .main import process_directory, process_file
+from .ingestion import DEFAULT_BATCH_SIZE
+from .log import configure_logging
+from .main import (
+    compact_store,
+    delete_documents,
+    export_snapshot,
+    import_snapshot,
+    process_directory,
+    process_file,
+    reembed,
+)
+from .profiling import profiler
+from .vectordb.collection import validate_collection_name
 
 app = typer.Typer(help="RAG Core CLI - ドキュメントを処理してベクトルDBに登録します。")
+snapshot_app = typer.Typer(
+    help="ベクトルDBのParquetスナップショットを書き出し・読み込みます。"
+)
+app.add_typer(snapshot_app, name="snapshot")
 
 
-@app.command()
+def _validate_collection(collection: str | None):
+    """コレクション名が不正な場合はエラーメッセージを表示して終了する"""
+    if collection is None:
+        return
+    try:
+        validate_collection_name(collection)
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(code=1) from e
+
+
+@app.callback(invoke_without_command=True)
 def main(
+    ctx: typer.Context,
     file: Path = typer.Option(
         None,
         "--file",
@@ -31,10 +59,53 @@ def main(
         readable=True,
         resolve_path=True,
     ),
+    batch_size: int = typer.Option(
+        DEFAULT_BATCH_SIZE,
+        "--batch-size",
+        "-b",
+        min=1,
+        help="1回のベクトル化・保存（チェックポイント）で扱うチャンク数。中断した場合、再実行すると保存済みのチャンクはスキップされます。",
+    ),
+    dedup: bool = typer.Option(
+        False,
+        "--dedup/--no-dedup",
+        help="MinHash/LSHでニアデュプリケートなチャンクを検出し、ベクトル化前に除外します。",
+    ),
+    dedup_threshold: float = typer.Option(
+        0.9,
+        "--dedup-threshold",
+        min=0.0,
+        max=1.0,
+        help="ニアデュプリケートとみなす推定Jaccard類似度のしきい値。",
+    ),
+    dedup_mode: str = typer.Option(
+        "drop",
+        "--dedup-mode",
+        help="重複チャンクの扱い。drop: 破棄する, link: 重複元へのリンクとして記録する。",
+    ),
+    collection: str = typer.Option(
+        None,
+        "--collection",
+        "-c",
+        help="登録先のコレクション名。存在しない場合は作成します。省略時はデフォルトのコレクション。",
+    ),
+    profile_dir: Path = typer.Option(
+        None,
+        "--profile-dir",
+        help="処理を cProfile で計測し、.prof ファイルをこのディレクトリに書き出します。snakeviz や flameprof で表示できます。",
+        file_okay=False,
+        resolve_path=True,
+    ),
 ):
     """
     指定されたファイルまたはディレクトリ内のドキュメントを処理し、ベクトルDBに登録します。
+
+    内容が変わったファイルは、古い版のチャンクを削除してから新しい版を登録します。
     """
+    # 読み込み・保存などの進捗のログを標準エラー出力に表示する
+    configure_logging()
+    if ctx.invoked_subcommand is not None:
+        return
     if file and directory:
         typer.echo(
             "エラー: --file と --dir を同時に指定することはできません。", err=True
@@ -46,6 +117,21 @@ def main(
         )
         raise typer.Exit(code=1)
 
+    if dedup_mode not in ("drop", "link"):
+        typer.echo(
+            f"エラー: --dedup-mode には drop または link を指定してください: {dedup_mode}",
+            err=True,
+        )
+        raise typer.Exit(code=1)
+    _validate_collection(collection)
+    ingest_options = {
+        "batch_size": batch_size,
+        "dedup_threshold": dedup_threshold if dedup else None,
+        "dedup_mode": dedup_mode,
+        "collection": collection,
+    }
+    profiler.configure(profile_dir)
+
     if file:
         if file.suffix not in [".txt", ".md"]:
             typer.echo(
@@ -53,16 +139,205 @@ def main(
             )
             raise typer.Exit(code=1)
         typer.echo(f"処理を開始します (ファイル): {file}")
-        process_file(file)
+        with profiler.profile(f"ingest-{file.name}", force=True):
+            process_file(file, **ingest_options)
         typer.echo(f"ファイルの処理が完了しました: {file}")
 
     if directory:
         typer.echo(f"処理を開始します (ディレクトリ): {directory}")
-        process_directory(directory)
+        with profiler.profile(f"ingest-{directory.name}", force=True):
+            process_directory(directory, **ingest_options)
         typer.echo(f"ディレクトリの処理が完了しました: {directory}")
 
     raise typer.Exit(code=0)
 
 
+@app.command()
+def delete(
+    source: str = typer.Option(
+        None,
+        "--source",
+        "-s",
+        help="削除するドキュメントのソース (登録時のファイルパス)。そのファイルのすべてのチャンクを削除します。",
+    ),
+    ids: list[int] = typer.Option(
+        None,
+        "--id",
+        help="削除するチャンクの行ID。複数回指定できます。",
+    ),
+    collection: str = typer.Option(
+        None,
+        "--collection",
+        "-c",
+        help="削除対象のコレクション名。省略時はデフォルトのコレクション。",
+    ),
+):
+    """
+    ソースまたは行IDを指定して、ベクトルDBからチャンクを削除します。
+    """
+    if source is None and not ids:
+        typer.echo("エラー: --source または --id を指定してください。", err=True)
+        raise typer.Exit(code=1)
+    _validate_collection(collection)
+    # 登録時のソースは絶対パスのため、存在するファイルのパスは解決してから照合する
+    if source is not None and Path(source).exists():
+        source = str(Path(source).resolve())
+    try:
+        deleted = delete_documents(source=source, ids=ids, collection=collection)
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(code=1) from e
+    typer.echo(f"{deleted} 個のチャンクを削除しました。")
+
+
+@app.command()
+def compact(
+    collection: str = typer.Option(
+        None,
+        "--collection",
+        "-c",
+        help="対象のコレクション名。省略時はデフォルトのコレクション。",
+    ),
+):
+    """
+    削除済みの行の領域を回収し、近似検索・全文検索インデックスを作り直してチェックポイントします。
+    """
+    _validate_collection(collection)
+    try:
+        stats = compact_store(collection=collection)
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(code=1) from e
+    typer.echo(
+        f"コンパクションが完了しました: 行数={stats['rows']}, "
+        f"ファイルサイズ={stats['file_bytes_before']} -> {stats['file_bytes_after']} bytes"
+    )
+
+
+@app.command("reembed")
+def reembed_command(
+    model: str = typer.Option(
+        ...,
+        "--model",
+        "-m",
+        help="新しい埋め込みモデルの名前 (Ollamaのモデル名。例: bge-m3:latest)。",
+    ),
+    collection: str = typer.Option(
+        None,
+        "--collection",
+        "-c",
+        help="対象のコレクション名。省略時はデフォルトのコレクション。",
+    ),
+    batch_size: int = typer.Option(
+        DEFAULT_BATCH_SIZE,
+        "--batch-size",
+        "-b",
+        min=1,
+        help="1回にベクトル化・保存するチャンク数。",
+    ),
+    pause: float = typer.Option(
+        0.0,
+        "--pause",
+        min=0.0,
+        help="バッチの間で待機する秒数。Ollamaや検索への負荷を抑える場合に指定します。",
+    ),
+    keep_previous: bool = typer.Option(
+        False,
+        "--keep-previous",
+        help="切り替え後も元のテーブルを削除せずに残します。",
+    ),
+    profile_dir: Path = typer.Option(
+        None,
+        "--profile-dir",
+        help="処理を cProfile で計測し、.prof ファイルをこのディレクトリに書き出します。snakeviz や flameprof で表示できます。",
+        file_okay=False,
+        resolve_path=True,
+    ),
+):
+    """
+    保存済みのチャンクを別の埋め込みモデルでベクトル化し直し、完了後にテーブルを切り替えます。
+
+    中断した場合は、同じモデルで再実行すると続きから再開します。
+    """
+    _validate_collection(collection)
+    profiler.configure(profile_dir)
+    try:
+        with profiler.profile(f"reembed-{model}", force=True):
+            stats = reembed(
+                model,
+                collection=collection,
+                batch_size=batch_size,
+                pause_seconds=pause,
+                keep_previous=keep_previous,
+            )
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(code=1) from e
+    typer.echo(
+        f"再埋め込みが完了しました: {stats['previous_table']} -> {stats['table_name']} "
+        f"(モデル={stats['embedding_model']}, 次元数={stats['embedding_dim']}, 行数={stats['rows']})"
+    )
+
+
+@snapshot_app.command("export")
+def snapshot_export(
+    directory: Path = typer.Argument(
+        ...,
+        help="スナップショットの書き出し先のディレクトリ。",
+        file_okay=False,
+        resolve_path=True,
+    ),
+    collection: str = typer.Option(
+        None,
+        "--collection",
+        "-c",
+        help="書き出すコレクション名。省略時はデフォルトのコレクション。",
+    ),
+):
+    """
+    ベクトル・テキスト・メタデータをParquetファイルとマニフェストに書き出します。
+    """
+    _validate_collection(collection)
+    try:
+        manifest = export_snapshot(directory, collection=collection)
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(code=1) from e
+    typer.echo(
+        f"スナップショットを書き出しました: {directory} (行数={manifest['rows']})"
+    )
+
+
+@snapshot_app.command("import")
+def snapshot_import(
+    directory: Path = typer.Argument(
+        ...,
+        help="読み込むスナップショットのディレクトリ。",
+        exists=True,
+        file_okay=False,
+        resolve_path=True,
+    ),
+    collection: str = typer.Option(
+        None,
+        "--collection",
+        "-c",
+        help="読み込み先のコレクション名 (空である必要があります)。存在しない場合は作成します。",
+    ),
+):
+    """
+    スナップショットを空のベクトルDBに一括で読み込み、近似検索インデックスを学習します。
+    """
+    _validate_collection(collection)
+    try:
+        stats = import_snapshot(directory, collection=collection)
+    except ValueError as e:
+        typer.echo(f"エラー: {e}", err=True)
+        raise typer.Exit(code=1) from e
+    typer.echo(
+        f"スナップショットを読み込みました: 行数={stats['rows']}, "
+        f"読み込み={stats['load_seconds']}秒, インデックス={stats['index_seconds']}秒"
+    )
+
+
 if __name__ == "__main__":
     app()
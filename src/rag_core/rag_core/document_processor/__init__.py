@@ -1,13 +1,15 @@
 # rag_core/document_processor/__init__.py
 
 """
-ドキュメントの読み込みと分割を行うモジュール。
+ドキュメントの読み込みと分割、ニアデュプリケートの検出を行うモジュール。
 """
 
+from .dedup import NearDuplicateFilter
 from .loader import load_documents
 from .splitter import split_documents
 
 __all__ = [
+    "NearDuplicateFilter",
     "load_documents",
     "split_documents",
 ]
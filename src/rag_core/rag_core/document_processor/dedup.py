@@ -0,0 +1,250 @@
+# rag_core/document_processor/dedup.py
+"""
+MinHash と LSH (Locality Sensitive Hashing) によるニアデュプリケートチャンクの検出。
+
+チャンクの文字 n-gram (shingle) 集合から MinHash シグネチャを計算し、
+LSH のバンドでJaccard類似度が高そうな候補を絞り込んでから、
+シグネチャの一致率で推定したJaccard類似度がしきい値以上のものを重複と判定します。
+文字単位の shingle を使用するため、空白で区切られない日本語のテキストにも対応します。
+"""
+
+import hashlib
+import zlib
+from dataclasses import dataclass
+from typing import Protocol
+
+import numpy as np
+
+# 2^31 - 1 (メルセンヌ素数)。a * x が uint64 に収まるようにこの値を法とする
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+
+class MinHasher:
+    """テキストの MinHash シグネチャを計算するクラス"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        """
+        MinHasherを初期化します。
+
+        Args:
+            num_perm (int): ハッシュ関数（順列）の数。シグネチャの長さになります。
+            shingle_size (int): shingle とする文字 n-gram の長さ。
+            seed (int): ハッシュ関数の係数を生成する乱数シード。
+                        永続化したシグネチャと比較するため、常に同じ値を使用してください。
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        prime = int(_MERSENNE_PRIME)
+        self._a = rng.integers(1, prime, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, prime, size=num_perm, dtype=np.uint64)
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        """テキストの shingle 集合を32ビットハッシュ値の配列に変換します。"""
+        normalized = " ".join(text.split())
+        n = self.shingle_size
+        if len(normalized) <= n:
+            shingles = {normalized}
+        else:
+            shingles = {normalized[i : i + n] for i in range(len(normalized) - n + 1)}
+        return np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        テキストの MinHash シグネチャを計算します。
+
+        Args:
+            text (str): 対象のテキスト。
+
+        Returns:
+            np.ndarray: 長さ `num_perm` の uint32 配列。
+        """
+        hashes = self._shingle_hashes(text) % _MERSENNE_PRIME
+        # (num_perm, shingle数) のハッシュ値を一括で計算し、順列ごとの最小値を取る
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+def estimate_jaccard(signature: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """
+    シグネチャの一致率からJaccard類似度を推定します。
+
+    Args:
+        signature (np.ndarray): 基準となるシグネチャ (num_perm,)。
+        others (np.ndarray): 比較対象のシグネチャ (n, num_perm)。
+
+    Returns:
+        np.ndarray: 各比較対象との推定Jaccard類似度 (n,)。
+    """
+    return (others == signature).mean(axis=1)
+
+
+def optimal_bands(num_perm: int, threshold: float) -> tuple[int, int]:
+    """
+    しきい値に対して候補判定の境界が最も近くなるバンド数と行数を選びます。
+
+    LSH で候補となる確率が急激に立ち上がる類似度はおおよそ (1/b)^(1/r) です。
+
+    Returns:
+        tuple[int, int]: (バンド数 b, バンドあたりの行数 r)。
+    """
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHashStore(Protocol):
+    """永続化されたLSHインデックスを検索するためのインターフェース"""
+
+    def find_minhash_candidates(
+        self, buckets: list[tuple[int, int]]
+    ) -> list[tuple[int, int, str, np.ndarray]]:
+        """指定したバケットに属する (バンド番号, バケットキー, チャンクハッシュ, シグネチャ) を返す"""
+        ...
+
+
+@dataclass
+class DedupDecision:
+    """1つのチャンクに対する重複判定の結果"""
+
+    chunk_hash: str
+    signature: np.ndarray
+    buckets: list[tuple[int, int]]
+    duplicate_of: str | None = None
+    similarity: float = 0.0
+
+    @property
+    def is_duplicate(self) -> bool:
+        return self.duplicate_of is not None
+
+
+class NearDuplicateFilter:
+    """
+    MinHash/LSH を使用して、ベクトル化前にニアデュプリケートなチャンクを検出するクラス。
+
+    同じ実行内で受け入れたチャンクはメモリ上のLSHインデックスで、
+    過去に保存されたチャンクは `store` (ベクトルストア) に永続化されたLSHインデックスで照合します。
+    """
+
+    MODES = ("drop", "link")
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        shingle_size: int = 5,
+        mode: str = "drop",
+        store: MinHashStore | None = None,
+    ):
+        """
+        NearDuplicateFilterを初期化します。
+
+        Args:
+            threshold (float): 重複とみなす推定Jaccard類似度のしきい値 (0〜1)。
+            num_perm (int): MinHash シグネチャの長さ。
+            shingle_size (int): shingle とする文字 n-gram の長さ。
+            mode (str): 重複チャンクの扱い。"drop" は破棄し、
+                        "link" は重複元へのリンクとして記録します（どちらもベクトル化はしません）。
+            store: 永続化されたLSHインデックスを持つベクトルストア（オプション）。
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError(
+                f"threshold は0より大きく1以下である必要があります: {threshold}"
+            )
+        if mode not in self.MODES:
+            raise ValueError(f"サポートされていないモードです: {mode} ({self.MODES})")
+        self.threshold = threshold
+        self.mode = mode
+        self.store = store
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self.bands, self.rows = optimal_bands(num_perm, threshold)
+        self._buckets: dict[tuple[int, int], list[str]] = {}
+        self._signatures: dict[str, np.ndarray] = {}
+
+    def _band_buckets(self, signature: np.ndarray) -> list[tuple[int, int]]:
+        """シグネチャをバンドに分割し、(バンド番号, バケットキー) のリストを返します。"""
+        buckets = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows : (band + 1) * self.rows]
+            digest = hashlib.blake2b(chunk.tobytes(), digest_size=8).digest()
+            buckets.append((band, int.from_bytes(digest, "big", signed=True)))
+        return buckets
+
+    def _best_match(
+        self, signature: np.ndarray, candidates: dict[str, np.ndarray]
+    ) -> tuple[str | None, float]:
+        """候補の中で推定Jaccard類似度が最も高いものを返します。"""
+        if not candidates:
+            return None, 0.0
+        keys = list(candidates)
+        similarities = estimate_jaccard(
+            signature, np.stack([candidates[k] for k in keys])
+        )
+        best = int(similarities.argmax())
+        return keys[best], float(similarities[best])
+
+    def check(self, texts: list[str]) -> list[DedupDecision]:
+        """
+        チャンクのリストを重複判定し、重複でないチャンクをメモリ上のインデックスに登録します。
+
+        永続化されたインデックスへの問い合わせはリスト全体で1回にまとめて行います。
+        判定は入力順に行われるため、同じリスト内で先に現れたチャンクが重複元になります。
+
+        Args:
+            texts (list[str]): 判定対象のチャンクテキストのリスト。
+
+        Returns:
+            list[DedupDecision]: 入力と同じ順序の判定結果のリスト。
+        """
+        decisions = []
+        for text in texts:
+            signature = self.hasher.signature(text)
+            decisions.append(
+                DedupDecision(
+                    chunk_hash=hashlib.sha1(text.encode("utf-8")).hexdigest(),
+                    signature=signature,
+                    buckets=self._band_buckets(signature),
+                )
+            )
+
+        persisted_buckets: dict[tuple[int, int], list[str]] = {}
+        persisted_signatures: dict[str, np.ndarray] = {}
+        if self.store is not None and decisions:
+            all_buckets = list({b for d in decisions for b in d.buckets})
+            for (
+                band,
+                bucket,
+                chunk_hash,
+                signature,
+            ) in self.store.find_minhash_candidates(all_buckets):
+                persisted_buckets.setdefault((band, bucket), []).append(chunk_hash)
+                persisted_signatures[chunk_hash] = signature
+
+        for decision in decisions:
+            candidates: dict[str, np.ndarray] = {}
+            for bucket in decision.buckets:
+                for key in self._buckets.get(bucket, []):
+                    candidates[key] = self._signatures[key]
+                for key in persisted_buckets.get(bucket, []):
+                    candidates[key] = persisted_signatures[key]
+
+            match, similarity = self._best_match(decision.signature, candidates)
+            if match is not None and similarity >= self.threshold:
+                decision.duplicate_of = match
+                decision.similarity = similarity
+            elif decision.chunk_hash not in self._signatures:
+                self._signatures[decision.chunk_hash] = decision.signature
+                for bucket in decision.buckets:
+                    self._buckets.setdefault(bucket, []).append(decision.chunk_hash)
+        return decisions
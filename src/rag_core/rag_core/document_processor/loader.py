@@ -1,10 +1,15 @@
 # rag_core/document_processor/loader.py
+import logging
 import os
 from collections.abc import Callable
 
 from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from langchain_core.documents import Document
 
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
 # .txt と .md ファイルを読み込むためのローダー設定
 DEFAULT_LOADERS: dict[str, Callable] = {
     ".txt": lambda path: TextLoader(path, encoding="utf-8"),
@@ -54,9 +59,10 @@ def load_documents(
         silent_errors=True,
     )
 
-    print(f"ドキュメントを読み込み中: {directory_path} (glob: {glob_pattern})")
-    docs = loader.load()
-    print(f"読み込み完了: {len(docs)}個のドキュメント")
+    logger.info("ドキュメントを読み込み中: %s (glob: %s)", directory_path, glob_pattern)
+    with metrics.span("load"):
+        docs = loader.load()
+    logger.info("読み込み完了: %d個のドキュメント", len(docs))
 
     allowed_extensions = tuple(loaders_to_use.keys())
     filtered_docs = [
@@ -65,8 +71,10 @@ def load_documents(
         if "source" in doc.metadata
         and doc.metadata["source"].endswith(allowed_extensions)
     ]
-    print(
-        f"拡張子でフィルタリング後: {len(filtered_docs)}個のドキュメント (拡張子: {allowed_extensions})"
+    logger.info(
+        "拡張子でフィルタリング後: %d個のドキュメント (拡張子: %s)",
+        len(filtered_docs),
+        allowed_extensions,
     )
 
     return filtered_docs
@@ -1,8 +1,13 @@
 # rag_core/document_processor/splitter.py
+import logging
 
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
 
 def split_documents(
     documents: list[Document],
@@ -51,15 +56,52 @@ def split_documents(
             **kwargs,
         )
 
-    print(
-        f"ドキュメントを分割中... (チャンクサイズ={chunk_size}, オーバーラップ={chunk_overlap})"
+    with metrics.span("split"):
+        split_docs = text_splitter.split_documents(documents)
+    logger.debug(
+        "ドキュメントを分割しました",
+        extra={
+            "documents": len(documents),
+            "chunks": len(split_docs),
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+        },
     )
-    split_docs = text_splitter.split_documents(documents)
-    print(f"分割完了: {len(split_docs)}個のチャンクに分割されました。")
 
     return split_docs
 
 
+def join_chunks(texts: list[str], min_overlap: int = 20) -> str:
+    """
+    同じドキュメントの連続したチャンクを、重なり (chunk_overlap) を除いて1つのテキストに連結します。
+
+    前のチャンクの末尾と次のチャンクの先頭が `min_overlap` 文字以上一致する場合は、一致した部分を
+    1回だけ含めます。一致しない場合 (段落の区切りで分割された場合など) は改行で連結します。
+
+    Args:
+        texts: 位置の順に並べたチャンクのテキストのリスト。
+        min_overlap: 重なりとみなす一致の最小文字数。
+
+    Returns:
+        連結したテキスト。
+    """
+    joined = ""
+    for text in texts:
+        if not joined:
+            joined = text
+            continue
+        overlap = next(
+            (
+                length
+                for length in range(min(len(joined), len(text)), min_overlap - 1, -1)
+                if joined.endswith(text[:length])
+            ),
+            0,
+        )
+        joined += text[overlap:] if overlap else "\n" + text
+    return joined
+
+
 if __name__ == "__main__":
     # テスト用のダミードキュメントを作成
     long_text = (
@@ -1,12 +1,26 @@
 # Ollamaを使用した埋め込みモデルの実装
+import logging
 import os
+import time
 
 from langchain_ollama import OllamaEmbeddings
 
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 埋め込みモデルが記録されていないコレクションに使用するモデルの名前
+DEFAULT_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "bge-m3")
+
+
+def _elapsed_ms(start: float) -> float:
+    """start (time.perf_counter() の値) からの経過時間をミリ秒で返す"""
+    return round((time.perf_counter() - start) * 1000, 3)
+
 
 def initialize_embedding_model(
     ollama_base_url: str = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434"),
-    model_name: str = os.environ.get("EMBEDDING_MODEL_NAME", "bge-m3"),
+    model_name: str = DEFAULT_MODEL_NAME,
 ) -> OllamaEmbeddings:
     """
     Ollama埋め込みモデルのインスタンスを初期化して返します。
@@ -23,8 +37,10 @@ def initialize_embedding_model(
     Returns:
         OllamaEmbeddings: Ollama埋め込みモデルのインスタンス。
     """
-    print(
-        f"Ollama埋め込みモデルを初期化中: base_url='{ollama_base_url}', model='{model_name}'"
+    logger.info(
+        "Ollama埋め込みモデルを初期化中: base_url='%s', model='%s'",
+        ollama_base_url,
+        model_name,
     )
     embeddings = OllamaEmbeddings(base_url=ollama_base_url, model=model_name)
     return embeddings
@@ -41,9 +57,13 @@ def embed_texts(texts: list[str], embeddings: OllamaEmbeddings) -> list[list[flo
     Returns:
         List[List[float]]: 各入力テキストに対する埋め込みベクトルのリスト。
     """
-    print(f"{len(texts)}個のドキュメントを埋め込み中...")
-    embedded_vectors = embeddings.embed_documents(texts)
-    print("埋め込み完了。")
+    started = time.perf_counter()
+    with metrics.span("embed"):
+        embedded_vectors = embeddings.embed_documents(texts)
+    logger.debug(
+        "ドキュメントの埋め込みが完了しました",
+        extra={"texts": len(texts), "duration_ms": _elapsed_ms(started)},
+    )
     return embedded_vectors
 
 
@@ -58,12 +78,40 @@ def embed_query(text: str, embeddings: OllamaEmbeddings) -> list[float]:
     Returns:
         List[float]: 入力クエリテキストの埋め込みベクトル。
     """
-    print(f"クエリを埋め込み中: '{text[:50]}...'")  # 最初の50文字をログに記録
-    embedded_vector = embeddings.embed_query(text)
-    print("クエリの埋め込み完了。")
+    started = time.perf_counter()
+    with metrics.span("embed"):
+        embedded_vector = embeddings.embed_query(text)
+    logger.debug(
+        "クエリの埋め込みが完了しました",
+        extra={"query_chars": len(text), "duration_ms": _elapsed_ms(started)},
+    )
     return embedded_vector
 
 
+def embed_queries(texts: list[str], embeddings: OllamaEmbeddings) -> list[list[float]]:
+    """
+    複数のクエリテキストを1回の呼び出しでまとめて埋め込みます。
+
+    `embed_query` と同じ埋め込みを返しますが、Ollamaへのリクエストは1回になります。
+    APIサーバーで同時に届いたクエリをまとめて埋め込むために使用します。
+
+    Args:
+        texts (List[str]): 埋め込むクエリテキストのリスト。
+        embeddings (OllamaEmbeddings): 初期化されたOllama埋め込みモデルのインスタンス。
+
+    Returns:
+        List[List[float]]: 各クエリテキストの埋め込みベクトルのリスト。
+    """
+    started = time.perf_counter()
+    with metrics.span("embed"):
+        embedded_vectors = embeddings.embed_documents(texts)
+    logger.debug(
+        "クエリの埋め込みが完了しました",
+        extra={"queries": len(texts), "duration_ms": _elapsed_ms(started)},
+    )
+    return embedded_vectors
+
+
 # 使用例（オプション、テスト用）
 if __name__ == "__main__":
     # Ollamaサーバーが実行中で、モデルが利用可能であることを確認
@@ -0,0 +1,270 @@
+# rag_core/ingestion.py
+"""
+チェックポイント付きでドキュメントをベクトルDBに取り込むモジュール。
+
+チャンクは `batch_size` 件ずつベクトル化・保存され、バッチごとにファイル単位の
+進捗がデータベースに記録されます。途中で失敗した場合でも保存済みのバッチは残り、
+同じドキュメントを再度取り込むと続きのチャンクから処理が再開されます。
+内容が変わったファイルは、古い版のチャンクの削除と新しい版のチャンクの保存を
+1つのトランザクションで行うため、検索結果に古い版と新しい版が混在することはありません。
+`NearDuplicateFilter` を指定すると、ニアデュプリケートなチャンクはベクトル化前に除外されます。
+"""
+
+import hashlib
+import logging
+from typing import Any
+
+from langchain_core.documents import Document
+from langchain_ollama import OllamaEmbeddings
+
+from .document_processor.dedup import DedupDecision, NearDuplicateFilter
+from .document_processor.splitter import split_documents
+from .embedding.model import embed_texts
+from .vectordb.storage import DuckDBVectorStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 64
+
+
+def hash_content(text: str) -> str:
+    """ドキュメント本文のハッシュ値を計算します。
+
+    同じソースのチャンクのうち、ハッシュ値が同じチャンクが前後の文脈 (`neighbor_chunks`) の対象になります。
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def filter_near_duplicates(
+    deduplicator: NearDuplicateFilter | None, texts: list[str]
+) -> tuple[list[DedupDecision] | None, list[int]]:
+    """
+    チャンクのニアデュプリケートを判定し、ベクトル化するチャンクを選びます。
+
+    Args:
+        deduplicator: ニアデュプリケート検出フィルター。None の場合はすべてのチャンクを残します。
+        texts: チャンクのテキストのリスト。
+
+    Returns:
+        判定結果のリスト (`deduplicator` が None の場合は None) と、
+        重複ではないチャンクのインデックスのリスト。
+    """
+    if deduplicator is None:
+        return None, list(range(len(texts)))
+    decisions = deduplicator.check(texts)
+    return decisions, [i for i, d in enumerate(decisions) if not d.is_duplicate]
+
+
+def record_near_duplicates(
+    storage: DuckDBVectorStore,
+    deduplicator: NearDuplicateFilter | None,
+    decisions: list[DedupDecision] | None,
+    sources: list[str | None],
+):
+    """
+    判定結果をLSHインデックスに保存し、"link" モードでは重複元へのリンクを記録します。
+
+    チャンクの `add_embeddings` と同じトランザクション内で呼び出します。
+
+    Args:
+        storage: 保存先のベクトルストア。
+        deduplicator: 判定に使用したニアデュプリケート検出フィルター。
+        decisions: `filter_near_duplicates` の判定結果 (None の場合は何もしません)。
+        sources: 判定したチャンクのソースのリスト (`decisions` と同じ順序)。
+    """
+    if decisions is None:
+        return
+    storage.add_minhash_entries(
+        [
+            (d.chunk_hash, sources[i], d.signature, d.buckets)
+            for i, d in enumerate(decisions)
+            if not d.is_duplicate
+        ]
+    )
+    if deduplicator.mode == "link":
+        storage.add_duplicate_links(
+            [
+                (d.chunk_hash, sources[i], d.duplicate_of, d.similarity)
+                for i, d in enumerate(decisions)
+                if d.is_duplicate
+            ]
+        )
+
+
+def _store_batch(
+    batch: list[tuple[str | None, str | None, int, str]],
+    storage: DuckDBVectorStore,
+    embedding_model: OllamaEmbeddings,
+    deduplicator: NearDuplicateFilter | None,
+    total_chunks: dict[tuple[str, str], int],
+) -> int:
+    """
+    1バッチ分のチャンクをベクトル化し、進捗とあわせて1つのトランザクションで保存します。
+
+    Returns:
+        保存したチャンク数 (ニアデュプリケートとして除外したチャンクを除く)。
+    """
+    texts = [text for _, _, _, text in batch]
+
+    # ニアデュプリケートなチャンクはベクトル化の前に除外する
+    decisions, kept = filter_near_duplicates(deduplicator, texts)
+    kept_texts = [texts[i] for i in kept]
+    embeddings = embed_texts(kept_texts, embedding_model) if kept_texts else []
+
+    # バッチ内でのファイルごとの最終チャンク番号を次の再開位置とする
+    checkpoints: dict[tuple[str, str], int] = {}
+    for source, content_hash, index, _ in batch:
+        if source is not None:
+            checkpoints[(source, content_hash)] = index + 1
+
+    with storage.transaction():
+        storage.add_embeddings(
+            texts=kept_texts,
+            embeddings=embeddings,
+            sources=[batch[i][0] for i in kept],
+            content_hashes=[batch[i][1] for i in kept],
+            ordinals=[batch[i][2] for i in kept],
+        )
+        record_near_duplicates(
+            storage, deduplicator, decisions, [source for source, _, _, _ in batch]
+        )
+        for (source, content_hash), completed in checkpoints.items():
+            storage.save_ingest_progress(
+                source,
+                content_hash,
+                total_chunks[(source, content_hash)],
+                completed,
+            )
+    return len(kept)
+
+
+def ingest_documents(
+    documents: list[Document],
+    storage: DuckDBVectorStore,
+    embedding_model: OllamaEmbeddings,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    deduplicator: NearDuplicateFilter | None = None,
+    **split_kwargs: Any,
+) -> dict[str, int]:
+    """
+    ドキュメントをチャンクに分割し、バッチ単位でベクトル化してベクトルDBに保存します。
+
+    `metadata["source"]` を持つドキュメントは、ソースと本文のハッシュ値をキーとして
+    保存済みのチャンク数が記録されます。記録済みのチャンクはスキップされるため、
+    中断した取り込みを再実行すると続きから再開されます。
+    ソースを持たないドキュメントは進捗を記録せずに毎回保存されます。
+    以前に別の内容で取り込まれたソースは、古い版のチャンクを削除してから新しい版を保存します。
+    この置き換えはソースごとに1つのトランザクションで行われ、中断した場合は古い版が残ります。
+
+    Args:
+        documents: 取り込む Document オブジェクトのリスト。
+        storage: 保存先のベクトルストア。
+        embedding_model: 初期化済みの埋め込みモデル。
+        batch_size: 1回のベクトル化・保存（チェックポイント）で扱うチャンク数。
+        deduplicator: ニアデュプリケート検出フィルター（オプション）。
+                      重複と判定されたチャンクはベクトル化されず、
+                      "link" モードの場合は重複元との対応が記録されます。
+        **split_kwargs: `split_documents` に渡すその他の引数。
+
+    Returns:
+        チャンクの総数 (`chunks`)、今回保存したチャンク数 (`embedded_chunks`)、
+        保存済みのためスキップしたチャンク数 (`skipped_chunks`)、
+        ニアデュプリケートとして除外したチャンク数 (`duplicate_chunks`)、
+        内容が変わったファイルの古い版として削除したチャンク数 (`deleted_chunks`) を含む辞書。
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size は1以上である必要があります: {batch_size}")
+
+    # 同じソースのドキュメントは1つのファイルとして扱う
+    source_texts: dict[str, list[str]] = {}
+    for doc in documents:
+        source = doc.metadata.get("source")
+        if source is not None:
+            source_texts.setdefault(source, []).append(doc.page_content)
+    content_hashes = {
+        source: hash_content("\n".join(texts)) for source, texts in source_texts.items()
+    }
+
+    chunks = split_documents(documents, **split_kwargs)
+
+    # ソースごとにチャンクをまとめる（順序は分割結果のまま維持）
+    grouped: dict[str | None, list[str]] = {}
+    for chunk in chunks:
+        grouped.setdefault(chunk.metadata.get("source"), []).append(chunk.page_content)
+
+    # (ソース, ハッシュ値, チャンク番号, テキスト) の未処理チャンクを列挙
+    pending: list[tuple[str | None, str | None, int, str]] = []
+    # 内容が変わったソースは、古い版の削除と同じトランザクションで保存する
+    replacements: list[tuple[str, str, list[tuple[str, str, int, str]]]] = []
+    total_chunks: dict[tuple[str, str], int] = {}
+    skipped = 0
+    for source, texts in grouped.items():
+        if source is None:
+            pending.extend((None, None, i, text) for i, text in enumerate(texts))
+            continue
+
+        content_hash = content_hashes[source]
+        completed = min(storage.get_ingest_progress(source, content_hash), len(texts))
+        if completed:
+            logger.info(
+                "保存済みのチャンクをスキップします (%s): %d/%d",
+                source,
+                completed,
+                len(texts),
+            )
+        skipped += completed
+        total_chunks[(source, content_hash)] = len(texts)
+        items = [
+            (source, content_hash, i, texts[i]) for i in range(completed, len(texts))
+        ]
+        if storage.has_stale_version(source, content_hash):
+            replacements.append((source, content_hash, items))
+        else:
+            pending.extend(items)
+
+    embedded = 0
+    duplicates = 0
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start : start + batch_size]
+        kept = _store_batch(batch, storage, embedding_model, deduplicator, total_chunks)
+        embedded += kept
+        duplicates += len(batch) - kept
+
+        # 学習後の追加が一定量を超えた近似検索インデックスを再学習する
+        storage.maintain_index()
+
+        logger.info(
+            "チェックポイントを保存しました: %d/%d チャンク (保存: %d, 重複として除外: %d)",
+            start + len(batch),
+            len(pending),
+            embedded,
+            duplicates,
+        )
+
+    deleted = 0
+    for source, content_hash, items in replacements:
+        with storage.transaction():
+            removed = storage.delete_by_source(source, keep_content_hash=content_hash)
+            for start in range(0, len(items), batch_size):
+                batch = items[start : start + batch_size]
+                kept = _store_batch(
+                    batch, storage, embedding_model, deduplicator, total_chunks
+                )
+                embedded += kept
+                duplicates += len(batch) - kept
+        storage.maintain_index()
+        deleted += removed
+        logger.info(
+            "内容が変わったファイルを置き換えました (%s): 削除: %d, 追加: %d チャンク",
+            source,
+            removed,
+            len(items),
+        )
+
+    return {
+        "chunks": len(chunks),
+        "embedded_chunks": embedded,
+        "skipped_chunks": skipped,
+        "duplicate_chunks": duplicates,
+        "deleted_chunks": deleted,
+    }
@@ -0,0 +1,161 @@
+# rag_core/log.py
+"""
+構造化ログのユーティリティ。
+
+`rag_core` と `rag_api_server` のモジュールは `logging.getLogger(__name__)` のロガーに
+ログを出力します。`configure_logging()` で標準エラー出力へのハンドラーを設定すると、
+各レコードにリクエストID (`request_context()` で設定) が付与され、`extra` で渡した
+フィールド (`duration_ms` など) とあわせてテキストまたはJSON Lines で出力されます。
+
+リクエストごとの要約のレコード (`extra=per_request(...)`) は、`request_context()` の
+`sample_rate` の割合のリクエストだけが出力されます。エラーなどのほかのレコードは
+サンプリングされません。
+"""
+
+import contextvars
+import json
+import logging
+import random
+import sys
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any, TextIO
+
+# ログを設定するパッケージのロガー
+PACKAGE_LOGGERS = ("rag_core", "rag_api_server")
+LOG_FORMATS = ("text", "json")
+
+_request_id: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "rag_request_id", default=None
+)
+_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "rag_log_sampled", default=True
+)
+
+# LogRecord の標準の属性 (extra で渡したフィールドと区別するため)
+_RESERVED_ATTRS = frozenset(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", (), None))
+) | {"message", "asctime", "request_id", "per_request"}
+
+
+def new_request_id() -> str:
+    """新しいリクエストIDを返す"""
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id() -> str | None:
+    """現在のリクエストIDを返す (リクエストの外では None)"""
+    return _request_id.get()
+
+
+@contextmanager
+def request_context(
+    request_id: str | None = None, sample_rate: float = 1.0
+) -> Iterator[str]:
+    """
+    with ブロック内のログにリクエストIDを付与し、要約のレコードを出力するかを決める
+
+    コンテキスト変数で保持するため、ブロック内で作成したタスクや `asyncio.to_thread` で
+    実行した処理のログにも同じリクエストIDが付与される。
+
+    Args:
+        request_id: リクエストID。指定しない場合は新しく生成する
+        sample_rate: リクエストごとの要約のレコードを出力する割合 (0.0 から 1.0)
+
+    Yields:
+        リクエストID
+    """
+    request_id = request_id or new_request_id()
+    id_token = _request_id.set(request_id)
+    sampled_token = _sampled.set(sample_rate >= 1.0 or random.random() < sample_rate)
+    try:
+        yield request_id
+    finally:
+        _sampled.reset(sampled_token)
+        _request_id.reset(id_token)
+
+
+def per_request(**fields: Any) -> dict[str, Any]:
+    """リクエストごとの要約のレコード (サンプリング対象) の `extra` を返す"""
+    return {"per_request": True, **fields}
+
+
+def _extra_fields(record: logging.LogRecord) -> dict[str, Any]:
+    return {
+        key: value
+        for key, value in vars(record).items()
+        if key not in _RESERVED_ATTRS and not key.startswith("_")
+    }
+
+
+class RequestContextFilter(logging.Filter):
+    """リクエストIDを付与し、サンプリングされなかったリクエストの要約のレコードを除外するフィルター"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "per_request", False) and not _sampled.get():
+            return False
+        record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """レコードを1行のJSONオブジェクトとして出力するフォーマッター"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            payload["request_id"] = record.request_id
+        payload.update(_extra_fields(record))
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """メッセージの後ろにリクエストIDと追加のフィールドを key=value で出力するフォーマッター"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if getattr(record, "request_id", None):
+            fields = {"request_id": record.request_id, **fields}
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def configure_logging(
+    level: str = "info", log_format: str = "text", stream: TextIO | None = None
+):
+    """
+    `rag_core` と `rag_api_server` のロガーに構造化ログのハンドラーを設定する
+
+    MCPのstdio通信と混ざらないよう、デフォルトでは標準エラー出力に出力する。
+    何度呼び出してもハンドラーは1つだけ設定される。
+
+    Args:
+        level: ログレベル ("debug", "info", "warning", "error")
+        log_format: 出力形式 ("text" または "json")
+        stream: 出力先。指定しない場合は標準エラー出力
+    """
+    if log_format not in LOG_FORMATS:
+        raise ValueError(
+            f"サポートされていないログの形式です: {log_format} {LOG_FORMATS}"
+        )
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+    handler.addFilter(RequestContextFilter())
+    for name in PACKAGE_LOGGERS:
+        logger = logging.getLogger(name)
+        logger.handlers = [handler]
+        logger.setLevel(level.upper())
+        logger.propagate = False
@@ -6,9 +6,13 @@ from langchain_community.document_loaders import (
 )
 from langchain_core.documents import Document
 
+from .document_processor.dedup import NearDuplicateFilter
 from .document_processor.loader import load_documents
-from .document_processor.splitter import split_documents
-from .embedding.model import initialize_embedding_model
+from .embedding.model import DEFAULT_MODEL_NAME, initialize_embedding_model
+from .ingestion import DEFAULT_BATCH_SIZE, ingest_documents
+from .reembed import reembed_collection
+from .vectordb.collection import CollectionManager
+from .vectordb.snapshot import read_manifest
 from .vectordb.storage import DuckDBVectorStore
 
 logging.basicConfig(
@@ -16,43 +20,91 @@ logging.basicConfig(
 )
 
 
-def _process_and_store_documents(docs: list[Document], storage: DuckDBVectorStore):
-    """ドキュメントのリストを処理し、ベクトルDBに保存する共通関数"""
+def _process_and_store_documents(
+    docs: list[Document],
+    storage: DuckDBVectorStore,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dedup_threshold: float | None = None,
+    dedup_mode: str = "drop",
+):
+    """ドキュメントのリストを処理し、ベクトルDBに保存する共通関数
+
+    チャンクは batch_size 件ずつ保存され、ファイルごとの進捗がDBに記録されるため、
+    途中で失敗しても再実行時には保存済みのチャンクから再開されます。
+    dedup_threshold を指定すると、推定Jaccard類似度がそれ以上のチャンクは
+    ニアデュプリケートとしてベクトル化前に除外されます。
+    """
     if not docs:
         logging.warning("処理対象のドキュメントが見つかりませんでした。")
         return
 
     logging.info(
-        f"{len(docs)} 個のドキュメントを読み込みました。チャンク分割を開始します..."
+        f"{len(docs)} 個のドキュメントを読み込みました。チャンク分割とベクトル化を開始します..."
+    )
+    # コレクションの埋め込みと同じモデルでベクトル化する
+    embedding_model = initialize_embedding_model(
+        model_name=storage.embedding_model or DEFAULT_MODEL_NAME
+    )
+    deduplicator = (
+        NearDuplicateFilter(threshold=dedup_threshold, mode=dedup_mode, store=storage)
+        if dedup_threshold is not None
+        else None
     )
-    chunks = split_documents(docs)
-    logging.info(f"{len(chunks)} 個のチャンクに分割しました。ベクトル化を開始します...")
-
-    embedding_model = initialize_embedding_model()
     try:
-        chunk_texts = [chunk.page_content for chunk in chunks]
-        logging.info(f"{len(chunk_texts)} 個のチャンクのベクトル化を実行します...")
-        embeddings = embedding_model.embed_documents(chunk_texts)
-        logging.info("ベクトル化が完了しました。データベースへの保存を開始します...")
-        storage.add_embeddings(texts=chunk_texts, embeddings=embeddings)
-        logging.info("データベースへの保存が完了しました。")
+        stats = ingest_documents(
+            docs,
+            storage,
+            embedding_model,
+            batch_size=batch_size,
+            deduplicator=deduplicator,
+        )
+        logging.info(
+            f"データベースへの保存が完了しました。"
+            f"チャンク数: {stats['chunks']}, 保存: {stats['embedded_chunks']}, "
+            f"スキップ (保存済み): {stats['skipped_chunks']}, "
+            f"重複として除外: {stats['duplicate_chunks']}, "
+            f"古い版として削除: {stats['deleted_chunks']}"
+        )
     except Exception as e:
         logging.error(
-            f"ベクトル化またはDB保存中にエラーが発生しました: {e}", exc_info=True
+            f"ベクトル化またはDB保存中にエラーが発生しました: {e} "
+            "(保存済みのチャンクは再実行時にスキップされます)",
+            exc_info=True,
         )
 
 
-def process_file(file_path: Path):
-    """単一のドキュメントファイルを処理してベクトルDBに登録する"""
+def _get_storage_for_write(
+    collections: CollectionManager, collection: str | None
+) -> DuckDBVectorStore:
+    """書き込み先のコレクションのベクトルストアを返す (存在しない場合はデフォルトのモデルで作成する)"""
+    model_name = collections.embedding_model(collection) or DEFAULT_MODEL_NAME
+    return collections.get(collection, create=True, embedding_model=model_name)
+
+
+def process_file(
+    file_path: Path,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dedup_threshold: float | None = None,
+    dedup_mode: str = "drop",
+    collection: str | None = None,
+):
+    """単一のドキュメントファイルを処理してベクトルDB (指定したコレクション) に登録する"""
     logging.info(f"ファイル処理を開始: {file_path}")
-    storage = DuckDBVectorStore()
+    collections = CollectionManager()
     try:
+        storage = _get_storage_for_write(collections, collection)
         # TextLoaderを使用して単一ファイルを読み込む
         loader = TextLoader(str(file_path), encoding="utf-8")
         docs = loader.load()
         doc = docs[0] if docs else None
         if doc:
-            _process_and_store_documents([doc], storage)
+            _process_and_store_documents(
+                [doc],
+                storage,
+                batch_size=batch_size,
+                dedup_threshold=dedup_threshold,
+                dedup_mode=dedup_mode,
+            )
         else:
             logging.warning(f"ファイルの読み込みに失敗しました: {file_path}")
     except Exception as e:
@@ -60,22 +112,133 @@ def process_file(file_path: Path):
             f"ファイル処理中にエラーが発生しました ({file_path}): {e}", exc_info=True
         )
     finally:
-        storage.close()
+        collections.close()
         logging.info(f"ファイル処理を終了: {file_path}")
 
 
-def process_directory(directory_path: Path):
-    """指定されたディレクトリ内のドキュメントを再帰的に処理してベクトルDBに登録する"""
+def process_directory(
+    directory_path: Path,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dedup_threshold: float | None = None,
+    dedup_mode: str = "drop",
+    collection: str | None = None,
+):
+    """指定されたディレクトリ内のドキュメントを再帰的に処理してベクトルDB (指定したコレクション) に登録する"""
     logging.info(f"ディレクトリ処理を開始: {directory_path}")
-    storage = DuckDBVectorStore()
+    collections = CollectionManager()
     try:
+        storage = _get_storage_for_write(collections, collection)
         docs = load_documents(str(directory_path))
-        _process_and_store_documents(docs, storage)
+        _process_and_store_documents(
+            docs,
+            storage,
+            batch_size=batch_size,
+            dedup_threshold=dedup_threshold,
+            dedup_mode=dedup_mode,
+        )
     except Exception as e:
         logging.error(
             f"ディレクトリ処理中にエラーが発生しました ({directory_path}): {e}",
             exc_info=True,
         )
     finally:
-        storage.close()
+        collections.close()
         logging.info(f"ディレクトリ処理を終了: {directory_path}")
+
+
+def delete_documents(
+    source: str | None = None,
+    ids: list[int] | None = None,
+    collection: str | None = None,
+) -> int:
+    """ソースまたは行IDを指定して、ベクトルDB (指定したコレクション) からチャンクを削除する"""
+    collections = CollectionManager()
+    try:
+        storage = collections.get(collection)
+        deleted = 0
+        with storage.transaction():
+            if source is not None:
+                deleted += storage.delete_by_source(source)
+            if ids:
+                deleted += storage.delete_by_ids(ids)
+        storage.maintain_index()
+        logging.info(f"{deleted} 個のチャンクを削除しました。")
+        return deleted
+    finally:
+        collections.close()
+
+
+def compact_store(collection: str | None = None) -> dict[str, int]:
+    """ベクトルDB (指定したコレクション) の削除済みの領域を回収し、インデックスを作り直す"""
+    collections = CollectionManager()
+    try:
+        stats = collections.get(collection).compact()
+        logging.info(
+            f"コンパクションが完了しました。行数: {stats['rows']}, "
+            f"ファイルサイズ: {stats['file_bytes_before']} -> {stats['file_bytes_after']} bytes"
+        )
+        return stats
+    finally:
+        collections.close()
+
+
+def export_snapshot(directory: Path, collection: str | None = None) -> dict:
+    """ベクトルDB (指定したコレクション) をParquetスナップショットとして書き出す"""
+    collections = CollectionManager()
+    try:
+        return collections.get(collection).export_snapshot(str(directory))
+    finally:
+        collections.close()
+
+
+def import_snapshot(directory: Path, collection: str | None = None) -> dict:
+    """Parquetスナップショットを空のベクトルDB (指定したコレクション) に一括で読み込む"""
+    # コレクションはスナップショットの次元数と埋め込みモデルで作成する
+    manifest = read_manifest(str(directory))
+    collections = CollectionManager()
+    try:
+        storage = collections.get(
+            collection,
+            create=True,
+            embedding_dim=manifest.get("embedding_dim"),
+            embedding_model=manifest.get("embedding_model"),
+        )
+        stats = storage.import_snapshot(str(directory))
+        logging.info(
+            f"スナップショットを読み込みました。行数: {stats['rows']}, "
+            f"読み込み: {stats['load_seconds']}秒, インデックス: {stats['index_seconds']}秒"
+        )
+        return stats
+    finally:
+        collections.close()
+
+
+def reembed(
+    model_name: str,
+    collection: str | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause_seconds: float = 0.0,
+    keep_previous: bool = False,
+) -> dict:
+    """ベクトルDB (指定したコレクション) のチャンクを別の埋め込みモデルでベクトル化し直し、テーブルを切り替える"""
+    collections = CollectionManager()
+    try:
+        stats = reembed_collection(
+            collections,
+            initialize_embedding_model(model_name=model_name),
+            model_name,
+            collection=collection,
+            batch_size=batch_size,
+            pause_seconds=pause_seconds,
+            drop_previous=not keep_previous,
+            on_progress=lambda done, total: logging.info(
+                f"再埋め込みの進捗: {done}/{total}"
+            ),
+        )
+        logging.info(
+            f"再埋め込みが完了しました。テーブル: {stats['previous_table']} -> {stats['table_name']}, "
+            f"行数: {stats['rows']}, 処理時間: {stats['seconds']}秒"
+        )
+        return stats
+    finally:
+        collections.close()
@@ -0,0 +1,234 @@
+# rag_core/metrics.py
+"""
+処理ステージごとのレイテンシと件数を集計するメトリクス。
+
+読み込み・分割・埋め込み・保存・検索などのステージを `metrics.span("embed")` で囲むと、
+処理時間がステージごとのヒストグラムに記録されます。集計した値は `render()` で
+Prometheus のテキスト形式 (exposition format 0.0.4) に書き出せます。
+
+メトリクスはデフォルトで無効です。無効の場合、`span()` は共有の何もしない
+コンテキストマネージャを返し、ほかの記録メソッドもロックを取らずにすぐ戻ります。
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any
+
+# Prometheus のテキスト形式の Content-Type
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# レイテンシのヒストグラムの境界 (秒)
+LATENCY_BUCKETS_SECONDS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# ステージの処理時間のヒストグラムの名前
+STAGE_DURATION = "rag_stage_duration_seconds"
+
+_NOOP_SPAN = nullcontext()
+
+
+class Histogram:
+    """値の分布を境界ごとの累積件数で集計するヒストグラム"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> list[tuple[str, int]]:
+        """境界 (最後は "+Inf") と、境界以下の値の累積件数のリストを返す"""
+        cumulative, counts = 0, []
+        for bound, count in zip(
+            (*map(str, self.buckets), "+Inf"), self._counts, strict=True
+        ):
+            cumulative += count
+            counts.append((bound, cumulative))
+        return counts
+
+    def snapshot(self) -> dict[str, Any]:
+        """境界以下の値の累積件数 (`le`)、件数、合計、平均を返す"""
+        return {
+            "le": dict(self.cumulative_counts()),
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "mean": round(self.sum / self.count, 3) if self.count else 0.0,
+        }
+
+
+class _Span:
+    """with ブロックの処理時間をステージのヒストグラムに記録するコンテキストマネージャ"""
+
+    __slots__ = ("_registry", "_stage", "_started")
+
+    def __init__(self, registry: "MetricsRegistry", stage: str):
+        self._registry = registry
+        self._stage = stage
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._registry.observe(
+            STAGE_DURATION, time.perf_counter() - self._started, stage=self._stage
+        )
+        return False
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class MetricsRegistry:
+    """ヒストグラム・カウンター・ゲージをラベルの組み合わせごとに保持するレジストリ"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._help: dict[str, tuple[str, str]] = {}
+        self._histograms: dict[str, dict[tuple, Histogram]] = {}
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._gauges: dict[str, dict[tuple, float]] = {}
+        self.describe(
+            STAGE_DURATION,
+            "histogram",
+            "処理ステージ (load, split, embed, insert, search など) ごとの処理時間",
+        )
+        self.describe(
+            "rag_rows_ingested_total", "counter", "ベクトルストアに保存したチャンク数"
+        )
+
+    def enable(self, enabled: bool = True):
+        """メトリクスの記録を有効 (または無効) にする"""
+        self.enabled = enabled
+
+    def reset(self):
+        """記録した値をすべて削除する (メトリクスの説明は残す)"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def describe(self, name: str, kind: str, help_text: str):
+        """メトリクスの種類 (histogram, counter, gauge) と説明 (# HELP) を登録する"""
+        self._help[name] = (kind, help_text)
+
+    def span(self, stage: str):
+        """with ブロックの処理時間をステージ `stage` のヒストグラムに記録する"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, stage)
+
+    def timed(self, stage: str):
+        """関数の処理時間をステージ `stage` のヒストグラムに記録するデコレーター
+
+        有効かどうかは呼び出しのたびに確認するため、モジュールの読み込み後に有効にしても記録される。
+        """
+
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, stage):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def observe(self, name: str, value: float, **labels: str):
+        """ヒストグラム `name` に値を記録する"""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(LATENCY_BUCKETS_SECONDS)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        """カウンター `name` に値を加算する"""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_counter(self, name: str, value: float, **labels: str):
+        """ほかの場所で数えている累積値をカウンター `name` の値として設定する"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        """ゲージ `name` の値を設定する"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def render(self) -> str:
+        """記録した値を Prometheus のテキスト形式で返す"""
+        lines: list[str] = []
+
+        def header(name: str, default_kind: str):
+            kind, help_text = self._help.get(name, (default_kind, ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                header(name, "histogram")
+                for labels, histogram in sorted(series.items()):
+                    for bound, count in histogram.cumulative_counts():
+                        bucket_labels = _format_labels((*labels, ("le", bound)))
+                        lines.append(f"{name}_bucket{bucket_labels} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(
+                        f"{name}_count{_format_labels(labels)} {histogram.count}"
+                    )
+            for kind, metrics_by_name in (
+                ("counter", self._counters),
+                ("gauge", self._gauges),
+            ):
+                for name, series in sorted(metrics_by_name.items()):
+                    header(name, kind)
+                    for labels, value in sorted(series.items()):
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# プロセス全体で共有するレジストリ
+metrics = MetricsRegistry()
@@ -0,0 +1,143 @@
+# rag_core/profiling.py
+"""
+リクエストや登録ジョブ単位のプロファイリング。
+
+`profiler.profile("query")` で囲んだ処理を cProfile で計測し、設定したディレクトリに
+pstats 形式の `.prof` ファイルとして書き出します。`.prof` ファイルは snakeviz や tuna
+(アイシクル/サンバースト図)、flameprof (フレームグラフのSVG) などで表示できます。
+
+プロファイリングはデフォルトで無効です。`configure()` で出力先のディレクトリを
+設定した場合だけ、`force=True` を指定した処理と `sample_rate` の割合で選ばれた処理を
+計測します。無効の場合や選ばれなかった場合、`profile()` は共有の何もしない
+コンテキストマネージャを返します。
+
+cProfile はプロファイラーを有効にしたスレッドの処理を計測するため、1つのスレッドで
+同時に計測するのは1つの処理だけです。同じスレッドで計測中に選ばれたほかの処理
+(イベントループで並行して実行されるリクエストなど) は計測しません。計測中の
+リクエストの `await` の間に実行されたほかのリクエストの処理はプロファイルに含まれます。
+"""
+
+import cProfile
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from .log import current_request_id
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUFFIX = ".prof"
+
+_NOOP_PROFILE = nullcontext()
+
+
+def _safe_name(name: str) -> str:
+    """ファイル名に使用できない文字を "_" に置き換える"""
+    return re.sub(r"[^0-9A-Za-z_.-]+", "_", name).strip("_") or "profile"
+
+
+class _ProfileSession:
+    """with ブロックの処理を cProfile で計測し、終了時に `.prof` ファイルに書き出すコンテキストマネージャ"""
+
+    def __init__(self, profiler: "RequestProfiler", name: str):
+        self._profiler = profiler
+        self._name = name
+        self._profile: cProfile.Profile | None = None
+        # 書き出したファイルのパス (計測しなかった場合は None)
+        self.path: Path | None = None
+
+    def __enter__(self):
+        state = self._profiler._thread_state
+        if getattr(state, "active", False):
+            logger.debug(
+                "ほかの処理を計測中のため、プロファイルしません: %s", self._name
+            )
+            return self
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12 以降は、プロセスで同時に1つのプロファイラーしか有効にできない
+            logger.debug(
+                "ほかの処理を計測中のため、プロファイルしません: %s", self._name
+            )
+            return self
+        state.active = True
+        self._profile = profile
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._profile is None:
+            return False
+        try:
+            self._profile.disable()
+            self.path = self._profiler._output_path(self._name)
+            self._profile.dump_stats(self.path)
+        finally:
+            self._profiler._thread_state.active = False
+        logger.info("プロファイルを書き出しました: %s", self.path)
+        return False
+
+
+class RequestProfiler:
+    """処理を選んで cProfile で計測し、出力先のディレクトリに書き出すプロファイラー"""
+
+    def __init__(self, directory: str | Path | None = None, sample_rate: float = 0.0):
+        # スレッドごとの計測中かどうか
+        self._thread_state = threading.local()
+        self.configure(directory, sample_rate)
+
+    @property
+    def enabled(self) -> bool:
+        """出力先のディレクトリが設定されているか"""
+        return self.directory is not None
+
+    def configure(self, directory: str | Path | None, sample_rate: float = 0.0):
+        """
+        出力先のディレクトリと計測する処理の割合を設定する
+
+        Args:
+            directory: `.prof` ファイルの出力先。None の場合はプロファイリングを無効にする
+            sample_rate: `force` を指定しない処理を計測する割合 (0.0 から 1.0)
+        """
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(
+                f"sample_rate は 0.0 以上 1.0 以下である必要があります: {sample_rate}"
+            )
+        self.directory = Path(directory) if directory else None
+        self.sample_rate = sample_rate
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def profile(self, name: str, force: bool = False):
+        """
+        with ブロックの処理を計測するコンテキストマネージャを返す
+
+        Args:
+            name: 処理の名前 (ファイル名に使用する)
+            force: サンプリングせずに必ず計測するか
+
+        Returns:
+            計測する場合は `path` 属性に書き出したファイルのパスが設定されるコンテキストマネージャ
+        """
+        if self.directory is None:
+            return _NOOP_PROFILE
+        if not force and (
+            self.sample_rate <= 0.0 or random.random() >= self.sample_rate
+        ):
+            return _NOOP_PROFILE
+        return _ProfileSession(self, name)
+
+    def _output_path(self, name: str) -> Path:
+        parts = [time.strftime("%Y%m%d-%H%M%S"), _safe_name(name)]
+        request_id = current_request_id()
+        parts.append(_safe_name(request_id) if request_id else f"{time.time_ns():x}")
+        return self.directory / ("-".join(parts) + PROFILE_SUFFIX)
+
+
+# プロセス全体で共有するプロファイラー
+profiler = RequestProfiler()
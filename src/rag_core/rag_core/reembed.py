@@ -0,0 +1,263 @@
+# rag_core/reembed.py
+"""
+埋め込みモデルを切り替えるための再埋め込みモジュール。
+
+埋め込みモデルを変更すると、保存済みの埋め込みと新しいモデルによるクエリの埋め込みは比較できません。
+再埋め込みでは、保存済みのテキストを新しいモデルでバッチごとにベクトル化して、コレクションの
+次のリビジョンのテーブル (シャドウテーブル) に書き込みます。その間の検索は元のテーブルで続けられます。
+すべての行を書き込んだら、書き込みを止めた状態で差分 (追加・削除された行と取り込みの進捗など) を
+反映し、カタログのテーブル名を書き換えてアトミックに切り替えます。
+
+- 行IDは元のテーブルの値を引き継ぐため、検索結果の id による削除はそのまま使用できます
+- 中断した場合は、同じモデルで再実行するとシャドウテーブルの続きから再開します
+- 切り替え後のテーブルには使用したモデルの名前が記録され、別のモデルでの書き込みはエラーになります
+"""
+
+import logging
+import time
+from collections.abc import Callable
+from contextlib import AbstractContextManager, nullcontext
+from typing import Any
+
+from langchain_ollama import OllamaEmbeddings
+
+from .embedding.model import embed_query, embed_texts
+from .ingestion import DEFAULT_BATCH_SIZE
+from .vectordb.collection import (
+    DEFAULT_COLLECTION,
+    CollectionManager,
+    validate_collection_name,
+)
+from .vectordb.sharded import ShardedVectorStore
+from .vectordb.storage import DuckDBVectorStore
+
+logger = logging.getLogger(__name__)
+
+# 新しいモデルの埋め込みの次元数を調べるためのテキスト
+_DIMENSION_PROBE = "dimension"
+
+
+def _shard_pairs(
+    live: DuckDBVectorStore, shadow: DuckDBVectorStore
+) -> list[tuple[DuckDBVectorStore, DuckDBVectorStore, dict[str, str]]]:
+    """
+    元のテーブルとシャドウテーブルの (元のストア, シャドウのストア, 複製するテーブルの対応) を
+    シャードごとに返します。同じシャードの行は同じファイルに保存されます。
+    """
+    if isinstance(live, ShardedVectorStore):
+        return [
+            (
+                live_shard,
+                shadow_shard,
+                {live.shard_keys_table_name: shadow.shard_keys_table_name},
+            )
+            for live_shard, shadow_shard in zip(live.shards, shadow.shards, strict=True)
+        ]
+    return [(live, shadow, {})]
+
+
+def _copy_new_rows(
+    live: DuckDBVectorStore,
+    shadow: DuckDBVectorStore,
+    embedding_model: OllamaEmbeddings,
+    batch_size: int,
+    pause_seconds: float = 0.0,
+    on_batch: Callable[[int], None] | None = None,
+) -> int:
+    """
+    元のテーブルのうち、シャドウテーブルの最大のIDより後の行を再埋め込みしてコピーします。
+
+    元のテーブルはシャドウテーブルと同じファイルにあるため、シャドウテーブルの接続から読み込みます
+    (元のテーブルの接続は検索・書き込みを行うスレッドが使用しています)。
+
+    Returns:
+        コピーした行数。
+    """
+    copied = 0
+    while True:
+        rows = shadow.conn.execute(
+            f"""
+            SELECT id, text, source, content_hash, ordinal FROM {live.table_name}
+            WHERE id > (SELECT COALESCE(MAX(id), 0) FROM {shadow.table_name})
+            ORDER BY id
+            LIMIT ?
+            """,
+            [batch_size],
+        ).fetchall()
+        if not rows:
+            return copied
+        ids, texts, sources, content_hashes, ordinals = (
+            list(column) for column in zip(*rows, strict=True)
+        )
+        embeddings = embed_texts(texts, embedding_model)
+        shadow.add_embeddings(
+            texts,
+            embeddings,
+            sources=sources,
+            content_hashes=content_hashes,
+            ids=ids,
+            ordinals=ordinals,
+        )
+        copied += len(rows)
+        if on_batch is not None:
+            on_batch(len(rows))
+        # Ollamaと検索のリソースを使い切らないよう、バッチの間で待機する
+        if pause_seconds > 0:
+            time.sleep(pause_seconds)
+
+
+def _sync_shadow(
+    live: DuckDBVectorStore, shadow: DuckDBVectorStore, tables: dict[str, str]
+) -> int:
+    """
+    シャドウテーブルを元のテーブルに合わせます。
+
+    元のテーブルから削除された行を削除し、取り込みの進捗・MinHash・重複リンクのテーブルを複製して、
+    IDのシーケンスを元のテーブルの続きから採番するように設定します。
+
+    Returns:
+        削除した行数。
+    """
+    tables = {
+        **{
+            live.metadata_table_names[role]: table_name
+            for role, table_name in shadow.metadata_table_names.items()
+        },
+        **tables,
+    }
+    with shadow.transaction():
+        removed = [
+            row_id
+            for (row_id,) in shadow.conn.execute(
+                f"SELECT id FROM {shadow.table_name} EXCEPT SELECT id FROM {live.table_name}"
+            ).fetchall()
+        ]
+        if removed:
+            shadow.delete_by_ids(removed)
+        for source_table, target_table in tables.items():
+            shadow.conn.execute(f"DELETE FROM {target_table}")
+            shadow.conn.execute(
+                f"INSERT INTO {target_table} BY NAME SELECT * FROM {source_table}"
+            )
+        next_id = shadow.conn.execute(
+            f"SELECT nextval('{live.id_sequence_name}')"
+        ).fetchone()[0]
+        shadow._reset_id_sequence(start=next_id)
+    return len(removed)
+
+
+def reembed_collection(
+    collections: CollectionManager,
+    embedding_model: OllamaEmbeddings,
+    model_name: str,
+    collection: str | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause_seconds: float = 0.0,
+    drop_previous: bool = True,
+    write_lock: AbstractContextManager | None = None,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> dict[str, Any]:
+    """
+    コレクションのすべてのチャンクを新しい埋め込みモデルでベクトル化し直し、テーブルを切り替えます。
+
+    シャドウテーブルへの書き込み中も、元のテーブルでの検索と書き込みは続けられます。
+    再埋め込み中に追加された行は続けて処理され、最後の差分の反映と切り替えの間だけ
+    `write_lock` を取得して書き込みを止めます。
+
+    Args:
+        collections: コレクションを管理する CollectionManager。
+        embedding_model: 新しいモデルで初期化済みの埋め込みモデル。
+        model_name: 新しいモデルの名前。切り替え後のテーブルに記録されます。
+        collection: 対象のコレクション名。指定しない場合はデフォルトのコレクション。
+        batch_size: 1回にベクトル化・保存する行数。
+        pause_seconds: バッチの間で待機する秒数 (負荷の調整用)。
+        drop_previous: 切り替え後に元のテーブルを削除するかどうか。
+                       False の場合は `collections.drop_retired()` で削除できます。
+        write_lock: 書き込みと排他するロック。APIサーバーなど、再埋め込み中に
+                    別のスレッドから書き込みがある場合に指定します。
+        on_progress: バッチごとに (今回ベクトル化した行数, 元のテーブルの行数) で呼び出される関数。
+
+    Returns:
+        切り替え後のテーブル (`table_name`)、元のテーブル (`previous_table`)、行数 (`rows`)、
+        今回ベクトル化した行数 (`embedded_rows`)、切り替え前に削除を反映した行数 (`removed_rows`)、
+        処理時間 (`seconds`) などを含む辞書。
+
+    Raises:
+        ValueError: コレクションが存在しない場合。
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size は1以上である必要があります: {batch_size}")
+    name = validate_collection_name(collection or DEFAULT_COLLECTION)
+    started = time.perf_counter()
+    live = collections.get(name)
+    embedding_dim = len(embed_query(_DIMENSION_PROBE, embedding_model))
+    shadow = collections.open_revision(name, model_name, embedding_dim)
+    pairs = _shard_pairs(live, shadow)
+
+    total_rows = sum(
+        shadow_shard.conn.execute(
+            f"SELECT count(*) FROM {live_shard.table_name}"
+        ).fetchone()[0]
+        for live_shard, shadow_shard, _ in pairs
+    )
+    embedded_rows = 0
+
+    def on_batch(rows: int):
+        nonlocal embedded_rows
+        embedded_rows += rows
+        if on_progress is not None:
+            on_progress(embedded_rows, total_rows)
+
+    logger.info(
+        "再埋め込みを開始します: コレクション=%s, %s -> %s, モデル=%s, 次元数=%d, 行数=%d",
+        name,
+        live.table_name,
+        shadow.table_name,
+        model_name,
+        embedding_dim,
+        total_rows,
+    )
+    for live_shard, shadow_shard, _ in pairs:
+        _copy_new_rows(
+            live_shard,
+            shadow_shard,
+            embedding_model,
+            batch_size,
+            pause_seconds,
+            on_batch,
+        )
+    shadow.maintain_index()
+
+    # 差分の反映から切り替えまでは書き込みを止め、それまでに保存された行をすべて新しいテーブルに含める
+    removed_rows = 0
+    with write_lock if write_lock is not None else nullcontext():
+        for live_shard, shadow_shard, tables in pairs:
+            _copy_new_rows(
+                live_shard, shadow_shard, embedding_model, batch_size, on_batch=on_batch
+            )
+            removed_rows += _sync_shadow(live_shard, shadow_shard, tables)
+        shadow.maintain_index()
+        rows = sum(
+            shadow_shard.conn.execute(
+                f"SELECT count(*) FROM {shadow_shard.table_name}"
+            ).fetchone()[0]
+            for _, shadow_shard, _ in pairs
+        )
+        # 切り替え後のストアは検索・書き込みを行うスレッドが使用するため、以降はアクセスしない
+        previous = collections.swap(name, shadow)
+    if drop_previous:
+        collections.drop_retired()
+
+    stats = {
+        "collection": name,
+        "embedding_model": model_name,
+        "embedding_dim": embedding_dim,
+        "table_name": shadow.table_name,
+        "previous_table": previous.table_name,
+        "rows": rows,
+        "embedded_rows": embedded_rows,
+        "removed_rows": removed_rows,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info("再埋め込みが完了し、テーブルを切り替えました: %s", stats)
+    return stats
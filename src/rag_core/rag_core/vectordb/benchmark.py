@@ -0,0 +1,161 @@
+# rag_core/vectordb/benchmark.py
+"""
+近似検索インデックスの再現率・レイテンシ・メモリ使用量を厳密検索と比較するレポート。
+
+保存済みの埋め込みにノイズを加えたものをクエリとして使用し、
+全行をスキャンする厳密検索の上位k件を正解として recall@k を計算します。
+
+使用例:
+    python -m rag_core.vectordb.benchmark --db vector_store.db --index-type pq
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from ..log import configure_logging
+from .storage import DuckDBVectorStore
+
+
+def recall_at_k(approximate: list[int], exact: list[int], k: int = 10) -> float:
+    """厳密検索の上位k件のうち、近似検索の上位k件に含まれる割合を返します。"""
+    truth = set(exact[:k])
+    if not truth:
+        return 1.0
+    return len(truth & set(approximate[:k])) / len(truth)
+
+
+def sample_queries(
+    store: DuckDBVectorStore, num_queries: int = 100, noise: float = 0.05, seed: int = 0
+) -> np.ndarray:
+    """保存済みの埋め込みからランダムに選んだ行にノイズを加え、クエリとして返します。"""
+    rows = store.conn.execute(
+        f"SELECT embedding FROM {store.table_name} USING SAMPLE {num_queries} ROWS"
+    ).fetchnumpy()
+    if not len(rows["embedding"]):
+        return np.empty((0, store.embedding_dim), dtype=np.float32)
+    queries = np.stack(rows["embedding"]).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    scale = (
+        noise
+        * np.linalg.norm(queries, axis=1, keepdims=True)
+        / np.sqrt(queries.shape[1])
+    )
+    return queries + rng.normal(size=queries.shape).astype(np.float32) * scale
+
+
+def _exact_ids(store: DuckDBVectorStore, query: np.ndarray, k: int) -> list[int]:
+    """インデックスを使用せずに全行をスキャンした上位k件のIDを返します。"""
+    rows = store.conn.execute(
+        f"""
+        SELECT id FROM {store.table_name}
+        ORDER BY array_cosine_similarity(embedding, ?::FLOAT[{store.embedding_dim}]) DESC
+        LIMIT ?
+        """,
+        [query.tolist(), k],
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def evaluate(
+    store: DuckDBVectorStore, queries: np.ndarray, k: int = 10, **search_kwargs
+) -> dict:
+    """
+    ストアの類似検索を厳密検索と比較します。
+
+    Args:
+        store: 評価するベクトルストア。
+        queries: クエリの埋め込み (n, d)。
+        k: 再現率を計算する上位件数。
+        **search_kwargs: `similarity_search_with_ids` に渡す追加の引数 (nprobe など)。
+
+    Returns:
+        dict: recall@k の平均、近似検索と厳密検索のレイテンシ (ミリ秒)、
+              100万件あたりのメモリ使用量 (MiB) を含む辞書。
+    """
+    recalls, approximate_ms, exact_ms = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.similarity_search_with_ids(query.tolist(), k=k, **search_kwargs)
+        approximate_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        truth = _exact_ids(store, query, k)
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        recalls.append(recall_at_k([row_id for row_id, _, _ in hits], truth, k))
+
+    # float32 の埋め込み1件あたりのバイト数
+    float32_bytes = store.embedding_dim * np.dtype(np.float32).itemsize
+    index = store._approximate_index()
+    if index is not None and index.is_trained:
+        bytes_per_vector = index.bytes_per_vector()
+    else:
+        bytes_per_vector = float32_bytes
+    return {
+        "index_type": store.index_type,
+        "queries": len(queries),
+        f"recall@{k}": float(np.mean(recalls)) if recalls else 0.0,
+        "latency_ms_p50": float(np.percentile(approximate_ms, 50)) if recalls else 0.0,
+        "latency_ms_p95": float(np.percentile(approximate_ms, 95)) if recalls else 0.0,
+        "exact_latency_ms_p50": float(np.percentile(exact_ms, 50)) if recalls else 0.0,
+        "bytes_per_vector": bytes_per_vector,
+        "mib_per_million": bytes_per_vector * 1_000_000 / 1024 / 1024,
+        "float32_mib_per_million": float32_bytes * 1_000_000 / 1024 / 1024,
+    }
+
+
+def print_report(report: dict):
+    """評価結果を表形式で表示します。"""
+    width = max(len(key) for key in report)
+    for key, value in report.items():
+        formatted = f"{value:.3f}" if isinstance(value, float) else str(value)
+        print(f"{key.ljust(width)}  {formatted}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似検索インデックスの評価レポート")
+    parser.add_argument("--db", default="vector_store.db", help="DuckDBファイルのパス")
+    parser.add_argument("--table", default="embeddings", help="埋め込みテーブルの名前")
+    parser.add_argument("--index-type", default="pq", help="評価するインデックスの種類")
+    parser.add_argument("--queries", type=int, default=100, help="クエリ数")
+    parser.add_argument("-k", type=int, default=10, help="recall@k の k")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVFのnprobe")
+    parser.add_argument("--pq-m", type=int, default=64, help="PQの部分空間の数")
+    parser.add_argument(
+        "--pq-rerank-factor", type=int, default=10, help="PQの再スコアリング倍率"
+    )
+    parser.add_argument(
+        "--matryoshka-dim", type=int, default=256, help="Matryoshkaの先頭の次元数"
+    )
+    parser.add_argument(
+        "--matryoshka-candidates",
+        type=int,
+        default=100,
+        help="Matryoshkaで再スコアリングする候補数",
+    )
+    args = parser.parse_args()
+    configure_logging()
+
+    store = DuckDBVectorStore(
+        db_path=args.db,
+        table_name=args.table,
+        index_type=args.index_type,
+        pq_m=args.pq_m,
+        pq_rerank_factor=args.pq_rerank_factor,
+        matryoshka_dim=args.matryoshka_dim,
+        matryoshka_candidates=args.matryoshka_candidates,
+    )
+    try:
+        index = store._approximate_index()
+        if index is not None and not index.is_trained:
+            store.build_index()
+        search_kwargs = {"nprobe": args.nprobe} if args.nprobe is not None else {}
+        queries = sample_queries(store, num_queries=args.queries)
+        print_report(evaluate(store, queries, k=args.k, **search_kwargs))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+# rag_core/vectordb/collection.py
+"""
+名前付きコレクションの管理。
+
+コレクションごとに専用の埋め込みテーブル (とそれに付随する取り込みの進捗・MinHash・
+近似検索インデックス) を持つため、検索は指定したコレクションのデータだけをスキャンします。
+コレクションは最初の書き込み時に作成され、名前・テーブル名・埋め込みの次元数・
+埋め込みモデルがカタログテーブル (`{table_name}_collections`) に記録されます。
+
+埋め込みモデルを切り替える再埋め込み (`rag_core.reembed`) では、コレクションの次のリビジョンの
+テーブルに埋め込みを作り直し、カタログのテーブル名を書き換えることで切り替えます。
+"""
+
+import logging
+import re
+import threading
+from collections.abc import Callable
+from datetime import datetime
+
+import duckdb
+
+from .storage import DuckDBVectorStore
+
+logger = logging.getLogger(__name__)
+
+# コレクションを指定しない場合に使用するコレクション (既存の `embeddings` テーブル)
+DEFAULT_COLLECTION = "default"
+
+# テーブル名の一部になるため、英小文字・数字・アンダースコアのみ許可する
+_COLLECTION_NAME_PATTERN = re.compile(r"^[a-z][a-z0-9_]{0,62}$")
+
+
+def validate_collection_name(name: str) -> str:
+    """
+    コレクション名を検証します。
+
+    Raises:
+        ValueError: 英小文字で始まり、英小文字・数字・アンダースコアからなる63文字以内の名前でない場合。
+    """
+    if not _COLLECTION_NAME_PATTERN.match(name):
+        raise ValueError(
+            f"無効なコレクション名です: {name!r} "
+            "(英小文字で始まり、英小文字・数字・アンダースコアからなる63文字以内)"
+        )
+    return name
+
+
+def collection_table_name(base_table_name: str, collection: str) -> str:
+    """コレクションの埋め込みテーブル名を返します。デフォルトのコレクションは既存のテーブルを使用します。"""
+    if collection == DEFAULT_COLLECTION:
+        return base_table_name
+    # `{table}_minhash` などの付随するテーブルと衝突しないよう、区切りにはアンダースコアを2つ使う
+    return f"{base_table_name}__{collection}"
+
+
+def revision_table_name(base_table_name: str, collection: str, revision: int) -> str:
+    """
+    コレクションのリビジョン (再埋め込みの回数 + 1) ごとの埋め込みテーブル名を返します。
+
+    リビジョン1は `collection_table_name` と同じです。それ以降は `embeddings_r2`、
+    `embeddings_r2__team` のようになり、他のコレクションのテーブル名 (`embeddings__...`) とは衝突しません。
+    """
+    if revision == 1:
+        return collection_table_name(base_table_name, collection)
+    return collection_table_name(f"{base_table_name}_r{revision}", collection)
+
+
+class CollectionManager:
+    """コレクションごとのベクトルストアを必要に応じて作成・保持するクラス"""
+
+    def __init__(
+        self,
+        db_path: str = "vector_store.db",
+        table_name: str = "embeddings",
+        embedding_dim: int = 1024,
+        store_factory: Callable[..., DuckDBVectorStore] = DuckDBVectorStore,
+        catalog_path: str | None = None,
+        **store_kwargs,
+    ):
+        """
+        CollectionManagerを初期化します。
+
+        Args:
+            db_path (str): ベクトルストアのDuckDBファイルのパス。
+            table_name (str): デフォルトのコレクションのテーブル名 (他のコレクションのテーブル名の接頭辞)。
+            embedding_dim (int): 新しく作成するコレクションの埋め込みの次元数のデフォルト値。
+            store_factory: ベクトルストアを生成する関数。`db_path`, `table_name`, `embedding_dim`
+                           とその他の `store_kwargs` を受け取ります (`ShardedVectorStore` なども指定可能)。
+            catalog_path (str | None): カタログテーブルを保存するDuckDBファイルのパス。
+                                       指定しない場合は `db_path` を使用します。
+            **store_kwargs: 各コレクションのベクトルストアに渡す追加の引数 (index_type など)。
+        """
+        self.db_path = db_path
+        self.table_name = table_name
+        self.embedding_dim = embedding_dim
+        self.store_factory = store_factory
+        self.store_kwargs = store_kwargs
+        self.catalog_table_name = f"{table_name}_collections"
+        self._stores: dict[str, DuckDBVectorStore] = {}
+        # 再埋め込みで置き換えられ、まだ削除していないテーブルのベクトルストア
+        self._retired: list[DuckDBVectorStore] = []
+        # 再埋め込みのジョブは別のスレッドからカタログを更新するため、カタログの操作を直列化する
+        self._lock = threading.RLock()
+
+        self.catalog = duckdb.connect(database=catalog_path or db_path, read_only=False)
+        self.catalog.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.catalog_table_name} (
+                name VARCHAR PRIMARY KEY,
+                table_name VARCHAR,
+                embedding_dim INTEGER,
+                created_at TIMESTAMP,
+                embedding_model VARCHAR,
+                revision INTEGER DEFAULT 1,
+                pending_table VARCHAR,
+                pending_model VARCHAR
+            );
+            ALTER TABLE {self.catalog_table_name} ADD COLUMN IF NOT EXISTS embedding_model VARCHAR;
+            ALTER TABLE {self.catalog_table_name} ADD COLUMN IF NOT EXISTS revision INTEGER DEFAULT 1;
+            ALTER TABLE {self.catalog_table_name} ADD COLUMN IF NOT EXISTS pending_table VARCHAR;
+            ALTER TABLE {self.catalog_table_name} ADD COLUMN IF NOT EXISTS pending_model VARCHAR;
+            """
+        )
+
+    def _lookup(self, name: str) -> dict | None:
+        """カタログからコレクションの記録 (テーブル名・次元数・埋め込みモデルなど) を取得します。"""
+        # fetchone() で結果を読み切らないとカタログの接続のトランザクションが残り、
+        # 同じファイルに対する CHECKPOINT (compact) が失敗するため fetchall() を使用する
+        with self._lock:
+            rows = self.catalog.execute(
+                f"""
+                SELECT table_name, embedding_dim, embedding_model, revision,
+                       pending_table, pending_model
+                FROM {self.catalog_table_name} WHERE name = ?
+                """,
+                [name],
+            ).fetchall()
+        if not rows:
+            return None
+        table_name, dim, model, revision, pending_table, pending_model = rows[0]
+        return {
+            "table_name": table_name,
+            "embedding_dim": dim,
+            "embedding_model": model,
+            "revision": revision,
+            "pending_table": pending_table,
+            "pending_model": pending_model,
+        }
+
+    def _register(
+        self, name: str, embedding_dim: int, embedding_model: str | None
+    ) -> dict:
+        """コレクションをカタログに登録します。"""
+        table_name = collection_table_name(self.table_name, name)
+        with self._lock:
+            self.catalog.execute(
+                f"""
+                INSERT OR IGNORE INTO {self.catalog_table_name}
+                    (name, table_name, embedding_dim, created_at, embedding_model)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [name, table_name, embedding_dim, datetime.now(), embedding_model],
+            )
+        logger.info(
+            "コレクションを作成しました: %s (テーブル: %s, 次元数: %s)",
+            name,
+            table_name,
+            embedding_dim,
+        )
+        return self._lookup(name)
+
+    def _open(
+        self, table_name: str, embedding_dim: int, embedding_model: str | None
+    ) -> DuckDBVectorStore:
+        return self.store_factory(
+            db_path=self.db_path,
+            table_name=table_name,
+            embedding_dim=embedding_dim,
+            embedding_model=embedding_model,
+            **self.store_kwargs,
+        )
+
+    def exists(self, name: str | None = None) -> bool:
+        """コレクションが存在するかどうかを返します。"""
+        name = validate_collection_name(name or DEFAULT_COLLECTION)
+        return name == DEFAULT_COLLECTION or self._lookup(name) is not None
+
+    def embedding_model(self, name: str | None = None) -> str | None:
+        """
+        コレクションの埋め込みを作成したモデルの名前を返します。
+
+        コレクションが存在しない場合、またはモデルが記録されていない場合は None です。
+        """
+        name = validate_collection_name(name or DEFAULT_COLLECTION)
+        with self._lock:
+            if name in self._stores:
+                return self._stores[name].embedding_model
+            entry = self._lookup(name)
+        return entry["embedding_model"] if entry else None
+
+    def get(
+        self,
+        name: str | None = None,
+        create: bool = False,
+        embedding_dim: int | None = None,
+        embedding_model: str | None = None,
+    ) -> DuckDBVectorStore:
+        """
+        コレクションのベクトルストアを返します。
+
+        Args:
+            name (str | None): コレクション名。指定しない場合はデフォルトのコレクション。
+            create (bool): コレクションが存在しない場合に作成するかどうか。
+            embedding_dim (int | None): 作成する場合の埋め込みの次元数。
+                                        指定しない場合は初期化時の値を使用します。
+            embedding_model (str | None): 書き込む埋め込みを作成するモデルの名前。
+                                          作成する場合、またはモデルが記録されていない既存の
+                                          コレクションの場合はカタログに記録します。
+
+        Returns:
+            コレクションのベクトルストア。
+
+        Raises:
+            ValueError: コレクション名が無効な場合、コレクションが存在せず `create` が False の場合、
+                        または `embedding_model` がコレクションに記録されたモデルと異なる場合。
+        """
+        name = validate_collection_name(name or DEFAULT_COLLECTION)
+        with self._lock:
+            store = self._stores.get(name)
+            if store is None:
+                entry = self._lookup(name)
+                if entry is None:
+                    # デフォルトのコレクションは既存のデータベースとの互換性のため常に存在する
+                    if not create and name != DEFAULT_COLLECTION:
+                        raise ValueError(f"コレクションが存在しません: {name}")
+                    entry = self._register(
+                        name, embedding_dim or self.embedding_dim, embedding_model
+                    )
+                store = self._open(
+                    entry["table_name"],
+                    entry["embedding_dim"],
+                    entry["embedding_model"],
+                )
+                self._stores[name] = store
+            if embedding_model is not None:
+                self._check_embedding_model(name, store, embedding_model)
+            return store
+
+    def _check_embedding_model(
+        self, name: str, store: DuckDBVectorStore, embedding_model: str
+    ):
+        """別のモデルの埋め込みが同じテーブルに混在しないよう、記録されたモデルと照合します。"""
+        if store.embedding_model is None:
+            # モデルが記録される前に作成されたコレクションは、最初に書き込んだモデルを記録する
+            self.catalog.execute(
+                f"UPDATE {self.catalog_table_name} SET embedding_model = ? WHERE name = ?",
+                [embedding_model, name],
+            )
+            store.embedding_model = embedding_model
+        elif store.embedding_model != embedding_model:
+            raise ValueError(
+                f"コレクション {name} の埋め込みはモデル {store.embedding_model} で作成されています "
+                f"(指定されたモデル: {embedding_model})。モデルを切り替えるには再埋め込みを実行してください"
+            )
+
+    def open_revision(
+        self, name: str, embedding_model: str, embedding_dim: int
+    ) -> DuckDBVectorStore:
+        """
+        再埋め込み先となる、コレクションの次のリビジョンのテーブルのベクトルストアを開きます。
+
+        同じモデルへの再埋め込みが中断されていた場合は、そのテーブルを再利用して続きから再開できます。
+        別のモデルへの再埋め込みのテーブルが残っている場合は削除して作り直します。
+
+        Raises:
+            ValueError: コレクションが存在しない場合。
+        """
+        with self._lock:
+            self.get(name)
+            entry = self._lookup(name)
+            table_name = revision_table_name(
+                self.table_name, name, entry["revision"] + 1
+            )
+            if (
+                entry["pending_table"] is not None
+                and entry["pending_model"] != embedding_model
+            ):
+                logger.info(
+                    "中断された再埋め込みのテーブルを削除します: %s (モデル: %s)",
+                    entry["pending_table"],
+                    entry["pending_model"],
+                )
+                self._open(
+                    entry["pending_table"], embedding_dim, entry["pending_model"]
+                ).drop()
+            self.catalog.execute(
+                f"""
+                UPDATE {self.catalog_table_name}
+                SET pending_table = ?, pending_model = ? WHERE name = ?
+                """,
+                [table_name, embedding_model, name],
+            )
+            return self._open(table_name, embedding_dim, embedding_model)
+
+    def swap(self, name: str, store: DuckDBVectorStore) -> DuckDBVectorStore:
+        """
+        コレクションのテーブルを `open_revision` で開いたテーブルに切り替えます。
+
+        カタログの1行の更新で切り替えるため、以降の `get` は新しいテーブルのストアを返します。
+        切り替え前のストアは `drop_retired` で削除されるか、`close` で閉じられるまで保持されます
+        (切り替えの直前に取得したストアで実行中の検索は、そのまま古いテーブルで完了します)。
+
+        Returns:
+            切り替え前のベクトルストア。
+
+        Raises:
+            ValueError: `store` がコレクションの再埋め込み先のテーブルでない場合。
+        """
+        name = validate_collection_name(name)
+        with self._lock:
+            entry = self._lookup(name)
+            if entry is None or entry["pending_table"] != store.table_name:
+                raise ValueError(
+                    f"コレクション {name} の再埋め込み先のテーブルではありません: {store.table_name}"
+                )
+            previous = self.get(name)
+            self.catalog.execute(
+                f"""
+                UPDATE {self.catalog_table_name}
+                SET table_name = ?, embedding_dim = ?, embedding_model = ?,
+                    revision = revision + 1, pending_table = NULL, pending_model = NULL
+                WHERE name = ?
+                """,
+                [store.table_name, store.embedding_dim, store.embedding_model, name],
+            )
+            self._stores[name] = store
+            self._retired.append(previous)
+        logger.info(
+            "コレクション %s のテーブルを切り替えました: %s -> %s (モデル: %s)",
+            name,
+            previous.table_name,
+            store.table_name,
+            store.embedding_model,
+        )
+        return previous
+
+    def drop_retired(self):
+        """`swap` で置き換えられた古いテーブルを削除します。"""
+        with self._lock:
+            retired, self._retired = self._retired, []
+        for store in retired:
+            store.drop()
+
+    def list_collections(self) -> list[dict]:
+        """登録されているコレクションの一覧を返します。"""
+        self.get(DEFAULT_COLLECTION)  # デフォルトのコレクションをカタログに登録する
+        with self._lock:
+            rows = self.catalog.execute(
+                f"""
+                SELECT name, table_name, embedding_dim, embedding_model, revision,
+                       created_at
+                FROM {self.catalog_table_name} ORDER BY name
+                """
+            ).fetchall()
+        return [
+            {
+                "name": name,
+                "table_name": table_name,
+                "embedding_dim": embedding_dim,
+                "embedding_model": embedding_model,
+                "revision": revision,
+                "created_at": created_at.isoformat(),
+            }
+            for name, table_name, embedding_dim, embedding_model, revision, created_at in rows
+        ]
+
+    def close(self):
+        """開いている全てのコレクションのベクトルストアとカタログの接続を閉じます。"""
+        for store in [*self._stores.values(), *self._retired]:
+            store.close()
+        self._stores.clear()
+        self._retired.clear()
+        self.catalog.close()
@@ -0,0 +1,33 @@
+# rag_core/vectordb/hybrid.py
+"""
+複数の検索結果を統合するためのユーティリティ。
+"""
+
+from collections.abc import Hashable, Sequence
+
+# Cormack et al. (2009) で推奨されている定数
+DEFAULT_RRF_K = 60
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Hashable]], k: int = DEFAULT_RRF_K
+) -> list[tuple[Hashable, float]]:
+    """
+    Reciprocal Rank Fusion (RRF) で複数のランキングを1つに統合します。
+
+    各ランキングで r 位 (1始まり) のアイテムに 1 / (k + r) のスコアを与え、
+    全ランキングの合計スコアの降順に並べます。スコアの尺度が異なる検索結果
+    (コサイン類似度とBM25スコアなど) を順位だけで統合できます。
+
+    Args:
+        rankings: アイテムID (行IDなど) を順位順に並べたリストのリスト。
+        k: 下位の順位の影響を調整する定数。
+
+    Returns:
+        (アイテムID, RRFスコア) のタプルをスコアの降順に並べたリスト。
+    """
+    scores: dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,516 @@
+# rag_core/vectordb/ivf.py
+"""
+NumPyで実装した転置ファイル (IVF: Inverted File) インデックス。
+
+k-meansで学習した粗い重心 (centroid) ごとに埋め込みをポスティングリストへ振り分け、
+検索時はクエリに近い `nprobe` 個のリストだけをスキャンします。
+VSS拡張機能のHNSWインデックスとは異なり、インデックス全体をメモリに載せる必要はなく、
+リスト順に並べた埋め込みをメモリマップした .npy ファイルから必要な範囲だけ読み込みます。
+
+学習後に追加された埋め込みは、最も近い重心のリストに割り当てられて差分セグメント
+(DuckDBの `{table_name}_ivf_delta` テーブルとメモリ上の配列) に保持され、
+差分が一定の割合を超えると再学習で本体のファイルに統合されます。
+
+各リストには重心から最も遠い埋め込みまでの距離 (半径) を記録しており、
+類似度のしきい値を指定した検索では、しきい値以上の埋め込みを含み得ないリストをスキャンしません。
+"""
+
+import json
+import logging
+import os
+import shutil
+from collections.abc import Iterator
+from datetime import datetime
+
+import duckdb
+import numpy as np
+
+from .kmeans import assign_nearest, normalize_rows, spherical_kmeans
+
+logger = logging.getLogger(__name__)
+
+
+def iter_table_embeddings(
+    conn: duckdb.DuckDBPyConnection, table_name: str, batch_size: int = 10_000
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """
+    埋め込みテーブルをIDの昇順にバッチで読み込みます。
+
+    テーブル全体をメモリに載せずにインデックスを構築するために使用します。
+
+    Yields:
+        (IDの配列 (n,), 正規化済みの埋め込み (n, d)) のタプル。
+    """
+    last_id = -1
+    while True:
+        rows = conn.execute(
+            f"""
+            SELECT id, embedding FROM {table_name}
+            WHERE id > ? ORDER BY id LIMIT ?
+            """,
+            [last_id, batch_size],
+        ).fetchnumpy()
+        if not len(rows["id"]):
+            return
+        ids = rows["id"].astype(np.int64)
+        yield ids, normalize_rows(np.stack(rows["embedding"]))
+        last_id = int(ids[-1])
+
+
+def exact_similarities(
+    conn: duckdb.DuckDBPyConnection,
+    table_name: str,
+    query_embedding,
+    ids: list[int],
+    embedding_dim: int = 1024,
+) -> dict[int, float]:
+    """
+    指定したIDの行について、テーブルの元の埋め込みとクエリのコサイン類似度を計算します。
+
+    近似検索で絞り込んだ候補の再スコアリングに使用します。
+    候補数が多い場合、`IN (SELECT unnest(...))` よりも `list_contains` の方が高速です。
+
+    Returns:
+        IDから類似度スコアへのマッピング。
+    """
+    if not len(ids):
+        return {}
+    rows = conn.execute(
+        f"""
+        SELECT id, array_cosine_similarity(embedding, ?::FLOAT[{embedding_dim}])
+        FROM {table_name}
+        WHERE list_contains(?::INTEGER[], id)
+        """,
+        [np.asarray(query_embedding, dtype=np.float32).tolist(), [int(i) for i in ids]],
+    ).fetchall()
+    return dict(rows)
+
+
+class IVFIndex:
+    """DuckDBのテーブルに格納された埋め込みに対するIVFインデックス"""
+
+    def __init__(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        index_dir: str,
+        embedding_dim: int = 1024,
+        nlist: int | None = None,
+        nprobe: int = 8,
+        min_train_rows: int = 1000,
+        retrain_ratio: float = 0.5,
+        max_train_samples: int = 200_000,
+    ):
+        """
+        IVFIndexを初期化し、学習済みのインデックスがあれば読み込みます。
+
+        Args:
+            conn: 埋め込みテーブルを持つDuckDB接続。
+            table_name: 埋め込みテーブルの名前。
+            index_dir: インデックスファイルを保存するディレクトリ。
+            embedding_dim: 埋め込みの次元数。
+            nlist: 重心 (ポスティングリスト) の数。指定しない場合は行数の平方根から決定します。
+            nprobe: 検索時にスキャンするリスト数のデフォルト値。
+            min_train_rows: 学習を開始する最小の行数。これ未満の場合は学習しません。
+            retrain_ratio: 差分セグメントの行数が学習済みの行数のこの割合を超えると再学習します。
+            max_train_samples: k-meansの学習に使用する最大サンプル数。
+        """
+        self.conn = conn
+        self.table_name = table_name
+        self.index_dir = index_dir
+        self.embedding_dim = embedding_dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        self.retrain_ratio = retrain_ratio
+        self.max_train_samples = max_train_samples
+        self.delta_table_name = f"{table_name}_ivf_delta"
+
+        self.centroids: np.ndarray | None = None
+        self._vectors: np.ndarray | None = None
+        self._ids: np.ndarray | None = None
+        self._offsets: np.ndarray | None = None
+        # リストごとの重心から最も遠い埋め込みまでの距離 (差分セグメントを含む)
+        self._radii: np.ndarray | None = None
+        # 本体のファイルのうち、テーブルから削除された行の位置
+        self._removed: np.ndarray | None = None
+        self._removed_count = 0
+        self._delta_ids = np.empty(0, dtype=np.int64)
+        self._delta_lists = np.empty(0, dtype=np.int32)
+        self._delta_vectors = np.empty((0, embedding_dim), dtype=np.float32)
+
+        self.conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.delta_table_name} (
+                id INTEGER PRIMARY KEY,
+                list_id INTEGER
+            );
+            """
+        )
+        self._load()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def indexed_rows(self) -> int:
+        """本体のファイルに格納されている行数"""
+        return 0 if self._ids is None else len(self._ids)
+
+    @property
+    def delta_rows(self) -> int:
+        """学習後に追加され、差分セグメントに保持されている行数"""
+        return len(self._delta_ids)
+
+    @property
+    def removed_rows(self) -> int:
+        """本体のファイルに残っているが、テーブルから削除された行数"""
+        return self._removed_count
+
+    def bytes_per_vector(self) -> int:
+        """1ベクトルあたりのインデックスのサイズ (float32の埋め込み + ID) を返します。"""
+        return (
+            self.embedding_dim * np.dtype(np.float32).itemsize
+            + np.dtype(np.int64).itemsize
+        )
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _load(self):
+        """学習済みのインデックスファイルと差分セグメントを読み込みます。"""
+        if not os.path.exists(self._path("meta.json")):
+            return
+        with open(self._path("meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("embedding_dim") != self.embedding_dim:
+            logger.warning(
+                "IVFインデックスの次元が一致しないため無視します: %s",
+                meta.get("embedding_dim"),
+            )
+            return
+
+        self.centroids = np.load(self._path("centroids.npy"))
+        self._offsets = np.load(self._path("offsets.npy"))
+        self._ids = np.load(self._path("ids.npy"), mmap_mode="r")
+        self._vectors = np.load(self._path("vectors.npy"), mmap_mode="r")
+        # 半径を記録する前に学習したインデックスでは、しきい値による枝刈りを行わない
+        if os.path.exists(self._path("radii.npy")):
+            self._radii = np.load(self._path("radii.npy"))
+
+        # 別のプロセスで削除された行を本体と差分セグメントから除外する
+        table_ids = self.conn.execute(f"SELECT id FROM {self.table_name}").fetchnumpy()[
+            "id"
+        ]
+        self._removed = ~np.isin(self._ids, table_ids)
+        self._removed_count = int(self._removed.sum())
+        self.conn.execute(
+            f"""
+            DELETE FROM {self.delta_table_name} d
+            WHERE NOT EXISTS (SELECT 1 FROM {self.table_name} e WHERE e.id = d.id)
+            """
+        )
+
+        # 差分セグメントの埋め込みをメモリに読み込む
+        rows = self.conn.execute(
+            f"""
+            SELECT d.id, d.list_id, e.embedding
+            FROM {self.delta_table_name} d
+            JOIN {self.table_name} e ON e.id = d.id
+            ORDER BY d.id
+            """
+        ).fetchnumpy()
+        if len(rows["id"]):
+            self._delta_ids = rows["id"].astype(np.int64)
+            self._delta_lists = rows["list_id"].astype(np.int32)
+            self._delta_vectors = normalize_rows(np.stack(rows["embedding"]))
+            self._widen_radii(self._delta_vectors, self._delta_lists)
+
+        # インデックス構築後に別のプロセスで追加された行を割り当てる
+        known_max = max(
+            int(self._ids.max()) if len(self._ids) else 0,
+            int(self._delta_ids.max()) if len(self._delta_ids) else 0,
+        )
+        missing = self.conn.execute(
+            f"SELECT id, embedding FROM {self.table_name} WHERE id > ? ORDER BY id",
+            [known_max],
+        ).fetchnumpy()
+        if len(missing["id"]):
+            self.add(missing["id"], np.stack(missing["embedding"]))
+        logger.debug(
+            "IVFインデックスを読み込みました: リスト数=%d, 行数=%d, 差分=%d, 削除=%d",
+            len(self.centroids),
+            self.indexed_rows,
+            self.delta_rows,
+            self.removed_rows,
+        )
+
+    def reload(self):
+        """
+        メモリ上の状態を破棄し、インデックスファイルとテーブルから読み込み直します。
+
+        ロールバックされたトランザクション内で行った追加・削除を取り消すために使用します。
+        """
+        self.centroids = None
+        self._vectors = self._ids = self._offsets = self._radii = self._removed = None
+        self._removed_count = 0
+        self._delta_ids = np.empty(0, dtype=np.int64)
+        self._delta_lists = np.empty(0, dtype=np.int32)
+        self._delta_vectors = np.empty((0, self.embedding_dim), dtype=np.float32)
+        self._load()
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """正規化済みの埋め込みを最も近い重心のリストに割り当てます。"""
+        return assign_nearest(vectors, self.centroids, spherical=True)
+
+    def _widen_radii(self, vectors: np.ndarray, lists: np.ndarray):
+        """割り当てたリストの半径を、正規化済みの埋め込みと重心の距離まで広げます。"""
+        if self._radii is None:
+            return
+        distances = np.linalg.norm(vectors - self.centroids[lists], axis=1)
+        np.maximum.at(self._radii, lists, distances)
+
+    def trained_parameters(self) -> dict[str, np.ndarray]:
+        """学習済みのパラメータ (重心) を返します。`train(centroids=...)` で再利用できます。"""
+        return {} if self.centroids is None else {"centroids": self.centroids}
+
+    def train(self, seed: int = 0, centroids: np.ndarray | None = None):
+        """
+        テーブル内の埋め込みからk-meansで重心を学習し、全行をリストに割り当てます。
+
+        リスト順に並べ替えた埋め込みとIDは .npy ファイルとして書き出され、
+        既存の差分セグメントは破棄されます。
+
+        Args:
+            seed: k-meansの乱数シード。
+            centroids: 学習済みの重心。指定した場合はk-meansを省略し、全行の割り当てだけを行います
+                       (スナップショットからの読み込み時など)。
+        """
+        total = self.conn.execute(f"SELECT count(*) FROM {self.table_name}").fetchone()[
+            0
+        ]
+        if total == 0:
+            logger.info("IVFインデックスを学習する埋め込みがありません。")
+            return
+        if centroids is not None:
+            self.centroids = np.asarray(centroids, dtype=np.float32)
+            nlist = len(self.centroids)
+            logger.info(
+                "IVFインデックスを構築中: 行数=%d, リスト数=%d (学習済みの重心を使用)",
+                total,
+                nlist,
+            )
+        else:
+            nlist = self.nlist or max(1, int(np.sqrt(total)))
+            nlist = min(nlist, total)
+
+            # 学習用のサンプルを取得
+            sample_size = min(total, self.max_train_samples)
+            rows = self.conn.execute(
+                f"SELECT embedding FROM {self.table_name} USING SAMPLE {sample_size} ROWS"
+            ).fetchnumpy()
+            sample = normalize_rows(np.stack(rows["embedding"]))
+            logger.info(
+                "IVFインデックスを学習中: 行数=%d, リスト数=%d, サンプル数=%d",
+                total,
+                nlist,
+                len(sample),
+            )
+            self.centroids = spherical_kmeans(sample, nlist, seed=seed)
+
+        # 1回目の走査: 全行をリストに割り当て、リストごとの半径を求める
+        id_parts, list_parts = [], []
+        radii = np.zeros(nlist, dtype=np.float32)
+        for ids, vectors in iter_table_embeddings(self.conn, self.table_name):
+            lists = self._assign(vectors)
+            id_parts.append(ids)
+            list_parts.append(lists)
+            distances = np.linalg.norm(vectors - self.centroids[lists], axis=1)
+            np.maximum.at(radii, lists, distances)
+        ids = np.concatenate(id_parts)
+        lists = np.concatenate(list_parts)
+        order = np.argsort(lists, kind="stable")
+        positions = np.empty_like(order)
+        positions[order] = np.arange(len(order))
+        counts = np.bincount(lists, minlength=nlist)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        # 2回目の走査: メモリに載せずに、埋め込みをリスト順の位置へ直接書き出す
+        # 検索中の古いファイルはメモリマップされているため、一時ファイルに書いてから置き換える
+        os.makedirs(self.index_dir, exist_ok=True)
+        vectors_file = np.lib.format.open_memmap(
+            self._path("vectors.tmp.npy"),
+            mode="w+",
+            dtype=np.float32,
+            shape=(len(ids), self.embedding_dim),
+        )
+        written = 0
+        for batch_ids, vectors in iter_table_embeddings(self.conn, self.table_name):
+            vectors_file[positions[written : written + len(batch_ids)]] = vectors
+            written += len(batch_ids)
+        vectors_file.flush()
+        del vectors_file
+        np.save(self._path("centroids.tmp.npy"), self.centroids)
+        np.save(self._path("offsets.tmp.npy"), offsets)
+        np.save(self._path("radii.tmp.npy"), radii)
+        np.save(self._path("ids.tmp.npy"), ids[order])
+        with open(self._path("meta.tmp.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "embedding_dim": self.embedding_dim,
+                    "nlist": nlist,
+                    "rows": len(ids),
+                    "trained_at": datetime.now().isoformat(),
+                },
+                f,
+            )
+        for name in ("vectors", "centroids", "offsets", "radii", "ids"):
+            os.replace(self._path(f"{name}.tmp.npy"), self._path(f"{name}.npy"))
+        os.replace(self._path("meta.tmp.json"), self._path("meta.json"))
+
+        self.conn.execute(f"DELETE FROM {self.delta_table_name}")
+        self._delta_ids = np.empty(0, dtype=np.int64)
+        self._delta_lists = np.empty(0, dtype=np.int32)
+        self._delta_vectors = np.empty((0, self.embedding_dim), dtype=np.float32)
+        self._offsets = offsets
+        self._radii = radii
+        self._ids = np.load(self._path("ids.npy"), mmap_mode="r")
+        self._vectors = np.load(self._path("vectors.npy"), mmap_mode="r")
+        self._removed = np.zeros(len(self._ids), dtype=bool)
+        self._removed_count = 0
+        logger.info("IVFインデックスの学習が完了しました: %s", self.index_dir)
+
+    def add(self, ids, embeddings):
+        """
+        新しく追加された埋め込みを最も近い重心のリストに割り当て、差分セグメントに追加します。
+
+        インデックスが未学習の場合は何もしません。
+
+        Args:
+            ids: 埋め込みテーブルの行IDのリスト。
+            embeddings: 対応する埋め込みのリスト。
+        """
+        if not self.is_trained or len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        lists = self._assign(vectors)
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {self.delta_table_name} VALUES (?, ?)",
+            [[int(i), int(lst)] for i, lst in zip(ids, lists, strict=True)],
+        )
+        self._delta_ids = np.concatenate([self._delta_ids, ids])
+        self._delta_lists = np.concatenate([self._delta_lists, lists])
+        self._delta_vectors = np.concatenate([self._delta_vectors, vectors])
+        self._widen_radii(vectors, lists)
+
+    def remove(self, ids):
+        """
+        削除された行をインデックスから取り除きます。
+
+        差分セグメントの行はその場で削除し、本体のファイルの行は次回の学習まで
+        検索対象から除外するだけにとどめます。
+
+        Args:
+            ids: 埋め込みテーブルから削除した行IDのリスト。
+        """
+        if not self.is_trained or len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        self.conn.execute(
+            f"DELETE FROM {self.delta_table_name} WHERE list_contains(?::INTEGER[], id)",
+            [ids.tolist()],
+        )
+        keep = ~np.isin(self._delta_ids, ids)
+        self._delta_ids = self._delta_ids[keep]
+        self._delta_lists = self._delta_lists[keep]
+        self._delta_vectors = self._delta_vectors[keep]
+        self._removed |= np.isin(self._ids, ids)
+        self._removed_count = int(self._removed.sum())
+
+    def drop(self):
+        """インデックスのファイルと差分セグメントのテーブルを削除します。"""
+        self.conn.execute(f"DROP TABLE IF EXISTS {self.delta_table_name}")
+        self.centroids = None
+        self._vectors = self._ids = self._offsets = self._radii = self._removed = None
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+
+    def needs_training(self) -> bool:
+        """初回の学習、または差分・削除の増加による再学習が必要かどうかを返します。"""
+        if not self.is_trained:
+            total = self.conn.execute(
+                f"SELECT count(*) FROM {self.table_name}"
+            ).fetchone()[0]
+            return total >= self.min_train_rows
+        changed = self.delta_rows + self.removed_rows
+        return changed > self.retrain_ratio * max(self.indexed_rows, 1)
+
+    def search(
+        self,
+        query_embedding,
+        k: int = 5,
+        nprobe: int | None = None,
+        min_similarity: float | None = None,
+    ) -> list[tuple[int, float]]:
+        """
+        クエリに近い `nprobe` 個のリストをスキャンし、コサイン類似度の上位k件を返します。
+
+        `min_similarity` を指定した場合、リスト内の埋め込みとクエリの類似度の上限
+        (重心との類似度 + 半径) がしきい値未満のリストはスキャンせず、
+        しきい値未満のスコアは上位k件の選択の前に除外します。
+        すべてのリストが除外された場合は、埋め込みを読み込まずに空のリストを返します。
+
+        Args:
+            query_embedding: クエリの埋め込み。
+            k: 取得する最近傍の数。
+            nprobe: スキャンするリスト数。指定しない場合はデフォルト値を使用します。
+            min_similarity: 返す結果のコサイン類似度の下限。
+
+        Returns:
+            List[Tuple[int, float]]: (ID, 類似度スコア) のタプルを類似度の降順に並べたリスト。
+        """
+        if not self.is_trained:
+            raise RuntimeError("IVFインデックスが学習されていません。")
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32)[None, :])[
+            0
+        ]
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        if min_similarity is not None and self._radii is not None:
+            # 単位ベクトル x と重心 c について q・x <= q・c + |x - c| が成り立つ
+            probe = probe[centroid_scores[probe] + self._radii[probe] >= min_similarity]
+            if not len(probe):
+                return []
+
+        id_parts, score_parts = [], []
+        has_removed = self._removed_count > 0
+        for list_id in probe:
+            start, end = self._offsets[list_id], self._offsets[list_id + 1]
+            if start == end:
+                continue
+            ids, scores = self._ids[start:end], self._vectors[start:end] @ query
+            if has_removed:
+                alive = ~self._removed[start:end]
+                ids, scores = ids[alive], scores[alive]
+            id_parts.append(ids)
+            score_parts.append(scores)
+        if self.delta_rows:
+            mask = np.isin(self._delta_lists, probe)
+            id_parts.append(self._delta_ids[mask])
+            score_parts.append(self._delta_vectors[mask] @ query)
+        if not id_parts:
+            return []
+
+        ids = np.concatenate(id_parts)
+        scores = np.concatenate(score_parts)
+        if min_similarity is not None:
+            above = scores >= min_similarity
+            ids, scores = ids[above], scores[above]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
@@ -0,0 +1,102 @@
+# rag_core/vectordb/kmeans.py
+"""
+インデックスの学習に使用するNumPy実装のk-means。
+"""
+
+import numpy as np
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """各行をL2ノルムで正規化したfloat32の配列を返します (ゼロベクトルはそのまま)。"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def assign_nearest(
+    vectors: np.ndarray,
+    centroids: np.ndarray,
+    spherical: bool = False,
+    batch_size: int = 8192,
+) -> np.ndarray:
+    """
+    各ベクトルを最も近い重心に割り当てます。
+
+    Args:
+        vectors: 割り当てるベクトル (n, d)。
+        centroids: 重心 (k, d)。
+        spherical: True の場合は内積 (正規化済みならコサイン類似度) が最大の重心、
+                   False の場合はユークリッド距離が最小の重心に割り当てます。
+        batch_size: 一度に距離を計算する行数。
+
+    Returns:
+        各ベクトルの重心番号 (n,)。
+    """
+    centroid_norms = (centroids**2).sum(axis=1)
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch_size):
+        block = vectors[start : start + batch_size]
+        products = block @ centroids.T
+        if spherical:
+            labels[start : start + batch_size] = products.argmax(axis=1)
+        else:
+            # ||x - c||^2 = ||x||^2 - 2 x・c + ||c||^2 (||x||^2 は比較に不要)
+            labels[start : start + batch_size] = (centroid_norms - 2 * products).argmin(
+                axis=1
+            )
+    return labels
+
+
+def kmeans(
+    vectors: np.ndarray,
+    k: int,
+    iterations: int = 20,
+    seed: int = 0,
+    spherical: bool = False,
+) -> np.ndarray:
+    """
+    Lloyd法によるk-meansで重心を学習します。
+
+    Args:
+        vectors: 学習データ (n, d)。
+        k: 重心の数。
+        iterations: 反復回数の上限。
+        seed: 初期重心を選ぶ乱数シード。
+        spherical: True の場合は重心を毎回正規化する spherical k-means
+                   (コサイン類似度でのクラスタリング) を行います。
+
+    Returns:
+        学習した重心 (k, d) のfloat32配列。
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    labels = None
+    for _ in range(iterations):
+        new_labels = assign_nearest(vectors, centroids, spherical=spherical)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+
+        # ラベル順に並べ替え、クラスタごとの合計を reduceat でまとめて計算する
+        counts = np.bincount(labels, minlength=k)
+        nonempty = counts > 0
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+        # 空のクラスタはランダムなデータ点で置き換える
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), size=len(empty))]
+        if spherical:
+            centroids = normalize_rows(centroids)
+    return centroids
+
+
+def spherical_kmeans(
+    vectors: np.ndarray, k: int, iterations: int = 20, seed: int = 0
+) -> np.ndarray:
+    """正規化済みのベクトルをコサイン類似度でクラスタリングし、正規化された重心を返します。"""
+    return kmeans(vectors, k, iterations=iterations, seed=seed, spherical=True)
@@ -0,0 +1,213 @@
+# rag_core/vectordb/matryoshka.py
+"""
+埋め込みの先頭の次元だけを使用する2段階検索 (Matryoshka 方式)。
+
+Matryoshka Representation Learning で学習された埋め込みモデルは、先頭の次元に重要な情報が
+集まるため、先頭の128〜256次元を正規化し直したベクトルでもおおまかな順位を再現できます。
+1段階目はメモリ上の短いベクトル (prefix) で全行をスコアリングして候補を絞り込み、
+2段階目で候補だけを元の `FLOAT[1024]` の埋め込みで再スコアリング (rerank) します。
+
+prefix はDuckDBの `{table_name}_prefix_{dim}` テーブルに保存され、起動時にメモリへ読み込まれます。
+Matryoshka 方式で学習されていないモデルでは1段階目の精度が下がるため、
+`benchmark.py` で recall を確認してから次元数と候補数を決めてください。
+"""
+
+import logging
+
+import duckdb
+import numpy as np
+
+from .ivf import exact_similarities
+from .kmeans import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+
+class MatryoshkaIndex:
+    """埋め込みの先頭の次元による粗い検索と、元の埋め込みによる再スコアリングを行うインデックス"""
+
+    def __init__(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        embedding_dim: int = 1024,
+        dim: int = 256,
+        candidates: int = 100,
+    ):
+        """
+        MatryoshkaIndexを初期化し、prefix をメモリに読み込みます。
+
+        Args:
+            conn: 埋め込みテーブルを持つDuckDB接続。
+            table_name: 埋め込みテーブルの名前。
+            embedding_dim: 元の埋め込みの次元数。
+            dim: 1段階目の検索に使用する先頭の次元数。
+            candidates: 2段階目で再スコアリングする候補数 (k より小さい場合は k 件)。
+        """
+        if not 0 < dim <= embedding_dim:
+            raise ValueError(
+                f"dim は1以上 {embedding_dim} 以下である必要があります: {dim}"
+            )
+        self.conn = conn
+        self.table_name = table_name
+        self.embedding_dim = embedding_dim
+        self.dim = dim
+        self.candidates = candidates
+        # 次元数ごとに別のテーブルにすることで、次元数を変更しても作り直しが不要
+        self.prefix_table_name = f"{table_name}_prefix_{dim}"
+
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+
+        self.conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.prefix_table_name} (
+                id INTEGER PRIMARY KEY,
+                prefix FLOAT[{dim}]
+            );
+            """
+        )
+        self._load()
+
+    @property
+    def is_trained(self) -> bool:
+        # 学習は不要なため、常に検索に使用できる
+        return True
+
+    @property
+    def rows(self) -> int:
+        return len(self._ids)
+
+    def bytes_per_vector(self) -> int:
+        """1ベクトルあたりのメモリ使用量 (prefix + ID) を返します。"""
+        return self._vectors.itemsize * self.dim + self._ids.itemsize
+
+    def _load(self):
+        """
+        テーブルとの差分 (削除された行と prefix がまだ作成されていない行) を反映し、
+        全行の prefix をメモリに読み込みます。
+        """
+        self.conn.execute(
+            f"""
+            DELETE FROM {self.prefix_table_name} p
+            WHERE NOT EXISTS (SELECT 1 FROM {self.table_name} e WHERE e.id = p.id)
+            """
+        )
+        self.conn.execute(
+            f"""
+            INSERT INTO {self.prefix_table_name}
+            SELECT id, embedding[1:{self.dim}]::FLOAT[{self.dim}]
+            FROM {self.table_name}
+            WHERE id > (SELECT COALESCE(MAX(id), 0) FROM {self.prefix_table_name})
+            """
+        )
+        rows = self.conn.execute(
+            f"SELECT id, prefix FROM {self.prefix_table_name} ORDER BY id"
+        ).fetchnumpy()
+        if len(rows["id"]):
+            self._ids = rows["id"].astype(np.int64)
+            self._vectors = normalize_rows(np.stack(rows["prefix"]))
+        logger.debug(
+            "Matryoshkaインデックスを読み込みました: 行数=%d, 次元数=%d",
+            self.rows,
+            self.dim,
+        )
+
+    def reload(self):
+        """
+        メモリ上の prefix を破棄し、テーブルから読み込み直します。
+
+        ロールバックされたトランザクション内で行った追加・削除を取り消すために使用します。
+        """
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._load()
+
+    def trained_parameters(self) -> dict[str, np.ndarray]:
+        # 学習するパラメータはない
+        return {}
+
+    def train(self, seed: int = 0):
+        """prefix をテーブルの埋め込みから作り直します。"""
+        self.conn.execute(f"DELETE FROM {self.prefix_table_name}")
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._load()
+
+    def add(self, ids, embeddings):
+        """新しく追加された埋め込みの prefix を保存し、メモリ上の配列に追加します。"""
+        if len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        # 埋め込みテーブルへの挿入と同じトランザクション内で呼び出される
+        self.conn.execute(
+            f"""
+            INSERT OR REPLACE INTO {self.prefix_table_name}
+            SELECT id, embedding[1:{self.dim}]::FLOAT[{self.dim}]
+            FROM {self.table_name}
+            WHERE list_contains(?::INTEGER[], id)
+            """,
+            [ids.tolist()],
+        )
+        prefixes = np.asarray(embeddings, dtype=np.float32)[:, : self.dim]
+        self._ids = np.concatenate([self._ids, ids])
+        self._vectors = np.concatenate([self._vectors, normalize_rows(prefixes)])
+
+    def remove(self, ids):
+        """削除された行の prefix をテーブルとメモリ上の配列から取り除きます。"""
+        if len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        self.conn.execute(
+            f"DELETE FROM {self.prefix_table_name} WHERE list_contains(?::INTEGER[], id)",
+            [ids.tolist()],
+        )
+        keep = ~np.isin(self._ids, ids)
+        self._ids = self._ids[keep]
+        self._vectors = self._vectors[keep]
+
+    def drop(self):
+        """prefix のテーブルを削除します。"""
+        self.conn.execute(f"DROP TABLE IF EXISTS {self.prefix_table_name}")
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+
+    def needs_training(self) -> bool:
+        return False
+
+    def search(
+        self,
+        query_embedding,
+        k: int = 5,
+        candidates: int | None = None,
+        rerank: bool = True,
+    ) -> list[tuple[int, float]]:
+        """
+        prefix で候補を絞り込み、元の埋め込みで再スコアリングした上位k件を返します。
+
+        Args:
+            query_embedding: クエリの埋め込み (元の次元数)。
+            k: 取得する最近傍の数。
+            candidates: 再スコアリングする候補数。指定しない場合は初期化時の値を使用します。
+            rerank: False の場合は prefix のコサイン類似度をそのまま返します。
+
+        Returns:
+            List[Tuple[int, float]]: (ID, 類似度スコア) のタプルを類似度の降順に並べたリスト。
+        """
+        if not self.rows:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_prefix = normalize_rows(query[None, : self.dim])[0]
+        scores = self._vectors @ query_prefix
+
+        pool = max(k, self.candidates if candidates is None else candidates)
+        pool = min(len(scores), pool if rerank else k)
+        top = np.argpartition(-scores, pool - 1)[:pool]
+        top = top[np.argsort(-scores[top])]
+        if not rerank:
+            return [(int(self._ids[i]), float(scores[i])) for i in top]
+
+        exact = exact_similarities(
+            self.conn, self.table_name, query, self._ids[top], self.embedding_dim
+        )
+        return sorted(exact.items(), key=lambda item: item[1], reverse=True)[:k]
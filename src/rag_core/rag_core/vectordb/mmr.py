@@ -0,0 +1,62 @@
+# rag_core/vectordb/mmr.py
+"""
+検索結果の多様化のためのユーティリティ。
+"""
+
+import numpy as np
+
+# 関連度と多様性の重みのデフォルト値 (1.0 で関連度のみ、0.0 で多様性のみ)
+DEFAULT_MMR_LAMBDA = 0.5
+
+
+def maximal_marginal_relevance(
+    query_embedding,
+    candidate_embeddings,
+    k: int,
+    lambda_mult: float = DEFAULT_MMR_LAMBDA,
+) -> list[int]:
+    """
+    Maximal Marginal Relevance (MMR) で候補から k 件を選びます。
+
+    クエリとの類似度が高く、選択済みの候補との類似度が低い候補を1件ずつ選びます。
+    各ステップのスコアは `lambda_mult * sim(q, d) - (1 - lambda_mult) * max(sim(d, 選択済み))` です。
+    候補同士の類似度は最初に行列積で一度に計算し、選択済みの候補との最大類似度は
+    選んだ候補の行との `np.maximum` で更新するため、Pythonのループは選択する件数分だけです。
+
+    Args:
+        query_embedding: クエリの埋め込み。
+        candidate_embeddings: 候補の埋め込みの2次元配列 (候補数 x 次元数)。
+        k: 選択する件数。
+        lambda_mult: 関連度の重み (0.0 以上 1.0 以下)。
+
+    Returns:
+        選択した候補のインデックスを選択順に並べたリスト。
+    """
+    if not 0.0 <= lambda_mult <= 1.0:
+        raise ValueError(
+            f"lambda_mult は 0.0 以上 1.0 以下である必要があります: {lambda_mult}"
+        )
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if candidates.ndim != 2 or len(candidates) == 0 or k <= 0:
+        return []
+    norms = np.linalg.norm(candidates, axis=1, keepdims=True)
+    candidates = candidates / np.where(norms > 0, norms, 1.0)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+    # 選択済みの候補との最大類似度 (最初の1件は関連度のみで選ぶ)
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    selected: list[int] = []
+    for _ in range(min(k, len(candidates))):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        redundancy = (
+            np.maximum(redundancy, pairwise[best]) if selected else pairwise[best]
+        )
+        selected.append(best)
+        available[best] = False
+    return selected
@@ -0,0 +1,443 @@
+# rag_core/vectordb/pq.py
+"""
+直積量子化 (PQ: Product Quantization) による圧縮インデックス。
+
+埋め込みを `m` 個の部分空間に分割し、部分空間ごとにk-meansで学習した256個の代表ベクトル
+(コードブック) の番号で表すことで、1024次元のfloat32 (4 KiB) を `m` バイトに圧縮します。
+検索時はクエリと各代表ベクトルの内積を (m, 256) のルックアップテーブルとして一度だけ計算し、
+各行のスコアをテーブル参照の合計として求めます (非対称距離計算: ADC)。
+
+圧縮コードはメモリに保持され、元の埋め込みはDuckDBのテーブルに残ります。
+必要に応じて上位候補だけを元の `FLOAT[1024]` の埋め込みで再スコアリング (rerank) します。
+"""
+
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+
+import duckdb
+import numpy as np
+
+from .ivf import exact_similarities, iter_table_embeddings
+from .kmeans import kmeans, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+# 部分空間あたりの代表ベクトル数 (コードは uint8 に収まる)
+KSUB = 256
+
+
+class ProductQuantizer:
+    """ベクトルを部分空間ごとのコードブック番号に圧縮するコーデック"""
+
+    def __init__(self, dim: int = 1024, m: int = 64):
+        """
+        ProductQuantizerを初期化します。
+
+        Args:
+            dim (int): ベクトルの次元数。
+            m (int): 部分空間の数 (= 1ベクトルあたりのバイト数)。dim を割り切れる必要があります。
+        """
+        if dim % m:
+            raise ValueError(
+                f"次元数 {dim} は部分空間の数 {m} で割り切れる必要があります。"
+            )
+        self.dim = dim
+        self.m = m
+        self.dsub = dim // m
+        self.codebooks: np.ndarray | None = None  # (m, KSUB, dsub)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dim) を (n, m, dsub) に分割します。"""
+        return np.asarray(vectors, dtype=np.float32).reshape(-1, self.m, self.dsub)
+
+    def train(self, vectors: np.ndarray, iterations: int = 20, seed: int = 0):
+        """部分空間ごとにk-meansでコードブックを学習します。"""
+        sub_vectors = self._split(vectors)
+        codebooks = np.zeros((self.m, KSUB, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            centroids = kmeans(
+                sub_vectors[:, j, :], KSUB, iterations=iterations, seed=seed + j
+            )
+            codebooks[j, : len(centroids)] = centroids
+        self.codebooks = codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """ベクトルを (n, m) の uint8 コードに圧縮します。"""
+        sub_vectors = self._split(vectors)
+        codes = np.empty((len(sub_vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            # ||x - c||^2 の x に依存しない項だけで最近傍の代表ベクトルを選ぶ
+            codebook = self.codebooks[j]
+            distances = (codebook**2).sum(axis=1) - 2 * sub_vectors[
+                :, j, :
+            ] @ codebook.T
+            codes[:, j] = distances.argmin(axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """コードから近似ベクトル (n, dim) を復元します。"""
+        return self.codebooks[np.arange(self.m), codes].reshape(len(codes), self.dim)
+
+    def inner_product_tables(self, query: np.ndarray) -> np.ndarray:
+        """クエリの各部分ベクトルと全代表ベクトルの内積 (m, KSUB) を計算します。"""
+        query_sub = np.asarray(query, dtype=np.float32).reshape(self.m, self.dsub)
+        return np.einsum("jkd,jd->jk", self.codebooks, query_sub)
+
+    def adc_scores(
+        self, tables: np.ndarray, codes: np.ndarray, block_size: int = 65536
+    ) -> np.ndarray:
+        """
+        ルックアップテーブルを使用して、圧縮されたベクトルとクエリの内積を近似計算します。
+
+        Args:
+            tables: `inner_product_tables` で計算したテーブル (m, KSUB)。
+            codes: 圧縮コード (n, m)。
+            block_size: 一度に計算する行数 (一時配列のサイズを抑えるため)。
+
+        Returns:
+            各行の近似スコア (n,)。
+        """
+        scores = np.empty(len(codes), dtype=np.float32)
+        subspaces = np.arange(self.m)
+        for start in range(0, len(codes), block_size):
+            block = codes[start : start + block_size]
+            scores[start : start + block_size] = tables[subspaces, block].sum(axis=1)
+        return scores
+
+
+class PQIndex:
+    """DuckDBのテーブルに格納された埋め込みに対するPQ圧縮インデックス"""
+
+    def __init__(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        index_dir: str,
+        embedding_dim: int = 1024,
+        m: int = 64,
+        rerank_factor: int = 10,
+        min_train_rows: int = 1000,
+        retrain_ratio: float = 0.5,
+        max_train_samples: int = 100_000,
+    ):
+        """
+        PQIndexを初期化し、学習済みのインデックスがあれば読み込みます。
+
+        Args:
+            conn: 埋め込みテーブルを持つDuckDB接続。
+            table_name: 埋め込みテーブルの名前。
+            index_dir: インデックスファイルを保存するディレクトリ。
+            embedding_dim: 埋め込みの次元数。
+            m: 部分空間の数 (= 1ベクトルあたりのバイト数)。
+            rerank_factor: 上位 k * rerank_factor 件の候補を元の埋め込みで再スコアリングします。
+                           0 の場合は再スコアリングせず、近似スコアをそのまま返します。
+            min_train_rows: 学習を開始する最小の行数。これ未満の場合は学習しません。
+            retrain_ratio: 差分の行数が学習済みの行数のこの割合を超えると再学習します。
+            max_train_samples: コードブックの学習に使用する最大サンプル数。
+        """
+        self.conn = conn
+        self.table_name = table_name
+        self.index_dir = index_dir
+        self.embedding_dim = embedding_dim
+        self.rerank_factor = rerank_factor
+        self.min_train_rows = min_train_rows
+        self.retrain_ratio = retrain_ratio
+        self.max_train_samples = max_train_samples
+        self.delta_table_name = f"{table_name}_pq_delta"
+        self.quantizer = ProductQuantizer(dim=embedding_dim, m=m)
+
+        self._ids = np.empty(0, dtype=np.int64)
+        self._codes = np.empty((0, m), dtype=np.uint8)
+        self._trained_rows = 0
+        # 学習後にインデックスから取り除いた行数 (再学習の判定に使用する)
+        self._removed_rows = 0
+
+        self.conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.delta_table_name} (
+                id INTEGER PRIMARY KEY,
+                code UTINYINT[]
+            );
+            """
+        )
+        self._load()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.quantizer.is_trained
+
+    @property
+    def rows(self) -> int:
+        return len(self._ids)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def memory_bytes(self) -> int:
+        """圧縮コード・ID・コードブックがメモリ上で使用するバイト数を返します。"""
+        codebook_bytes = (
+            self.quantizer.codebooks.nbytes
+            if self.quantizer.codebooks is not None
+            else 0
+        )
+        return self._codes.nbytes + self._ids.nbytes + codebook_bytes
+
+    def bytes_per_vector(self) -> int:
+        """1ベクトルあたりのメモリ使用量 (圧縮コード + ID) を返します。"""
+        return self.quantizer.m + self._ids.itemsize
+
+    def _load(self):
+        """学習済みのコードブックと圧縮コードを読み込みます。"""
+        if not os.path.exists(self._path("meta.json")):
+            return
+        with open(self._path("meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if (
+            meta.get("embedding_dim") != self.embedding_dim
+            or meta.get("m") != self.quantizer.m
+        ):
+            logger.warning("PQインデックスの設定が一致しないため無視します: %s", meta)
+            return
+
+        self.quantizer.codebooks = np.load(self._path("codebooks.npy"))
+        self._ids = np.load(self._path("ids.npy"))
+        self._codes = np.load(self._path("codes.npy"))
+        self._trained_rows = len(self._ids)
+
+        # 学習後に追加された行のコード
+        rows = self.conn.execute(
+            f"SELECT id, code FROM {self.delta_table_name} ORDER BY id"
+        ).fetchnumpy()
+        if len(rows["id"]):
+            self._ids = np.concatenate([self._ids, rows["id"].astype(np.int64)])
+            self._codes = np.concatenate(
+                [self._codes, np.stack(rows["code"]).astype(np.uint8)]
+            )
+
+        # 別のプロセスで削除された行を除外する
+        table_ids = self.conn.execute(f"SELECT id FROM {self.table_name}").fetchnumpy()[
+            "id"
+        ]
+        alive = np.isin(self._ids, table_ids)
+        if not alive.all():
+            self.conn.execute(
+                f"""
+                DELETE FROM {self.delta_table_name} d
+                WHERE NOT EXISTS (SELECT 1 FROM {self.table_name} e WHERE e.id = d.id)
+                """
+            )
+            self._removed_rows = int((~alive).sum())
+            self._ids = self._ids[alive]
+            self._codes = self._codes[alive]
+
+        # インデックス構築後に別のプロセスで追加された行を圧縮する
+        known_max = int(self._ids.max()) if len(self._ids) else 0
+        missing = self.conn.execute(
+            f"SELECT id, embedding FROM {self.table_name} WHERE id > ? ORDER BY id",
+            [known_max],
+        ).fetchnumpy()
+        if len(missing["id"]):
+            self.add(missing["id"], np.stack(missing["embedding"]))
+        logger.debug(
+            "PQインデックスを読み込みました: 行数=%d, メモリ=%.1f MiB",
+            self.rows,
+            self.memory_bytes() / 1024 / 1024,
+        )
+
+    def reload(self):
+        """
+        メモリ上の状態を破棄し、インデックスファイルとテーブルから読み込み直します。
+
+        ロールバックされたトランザクション内で行った追加・削除を取り消すために使用します。
+        """
+        self.quantizer.codebooks = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._codes = np.empty((0, self.quantizer.m), dtype=np.uint8)
+        self._trained_rows = 0
+        self._removed_rows = 0
+        self._load()
+
+    def trained_parameters(self) -> dict[str, np.ndarray]:
+        """学習済みのパラメータ (コードブック) を返します。`train(codebooks=...)` で再利用できます。"""
+        if not self.is_trained:
+            return {}
+        return {"codebooks": self.quantizer.codebooks}
+
+    def train(self, seed: int = 0, codebooks: np.ndarray | None = None):
+        """
+        テーブル内の埋め込みのサンプルからコードブックを学習し、全行を圧縮します。
+
+        Args:
+            seed: k-meansの乱数シード。
+            codebooks: 学習済みのコードブック。指定した場合は学習を省略し、全行の圧縮だけを行います。
+        """
+        total = self.conn.execute(f"SELECT count(*) FROM {self.table_name}").fetchone()[
+            0
+        ]
+        if total == 0:
+            logger.info("PQインデックスを学習する埋め込みがありません。")
+            return
+        if codebooks is not None:
+            if codebooks.shape[0] != self.quantizer.m:
+                raise ValueError(
+                    f"コードブックの部分空間の数が一致しません: {codebooks.shape[0]}"
+                )
+            self.quantizer.codebooks = np.asarray(codebooks, dtype=np.float32)
+            logger.info(
+                "PQインデックスを構築中: 行数=%d, 部分空間数=%d (学習済みのコードブックを使用)",
+                total,
+                self.quantizer.m,
+            )
+        else:
+            sample_size = min(total, self.max_train_samples)
+            rows = self.conn.execute(
+                f"SELECT embedding FROM {self.table_name} USING SAMPLE {sample_size} ROWS"
+            ).fetchnumpy()
+            sample = normalize_rows(np.stack(rows["embedding"]))
+            logger.info(
+                "PQインデックスを学習中: 行数=%d, 部分空間数=%d, サンプル数=%d",
+                total,
+                self.quantizer.m,
+                len(sample),
+            )
+            self.quantizer.train(sample, seed=seed)
+
+        id_parts, code_parts = [], []
+        for ids, vectors in iter_table_embeddings(self.conn, self.table_name):
+            id_parts.append(ids)
+            code_parts.append(self.quantizer.encode(vectors))
+        ids = np.concatenate(id_parts)
+        codes = np.concatenate(code_parts)
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        np.save(self._path("codebooks.npy"), self.quantizer.codebooks)
+        np.save(self._path("ids.npy"), ids)
+        np.save(self._path("codes.npy"), codes)
+        with open(self._path("meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "embedding_dim": self.embedding_dim,
+                    "m": self.quantizer.m,
+                    "rows": len(ids),
+                    "trained_at": datetime.now().isoformat(),
+                },
+                f,
+            )
+
+        self.conn.execute(f"DELETE FROM {self.delta_table_name}")
+        self._ids = ids
+        self._codes = codes
+        self._trained_rows = len(ids)
+        self._removed_rows = 0
+        logger.info(
+            "PQインデックスの学習が完了しました: %s (メモリ=%.1f MiB)",
+            self.index_dir,
+            self.memory_bytes() / 1024 / 1024,
+        )
+
+    def add(self, ids, embeddings):
+        """
+        新しく追加された埋め込みを圧縮してインデックスに追加します。
+
+        インデックスが未学習の場合は何もしません。
+        """
+        if not self.is_trained or len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        codes = self.quantizer.encode(
+            normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        )
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {self.delta_table_name} VALUES (?, ?)",
+            [[int(i), code.tolist()] for i, code in zip(ids, codes, strict=True)],
+        )
+        self._ids = np.concatenate([self._ids, ids])
+        self._codes = np.concatenate([self._codes, codes])
+
+    def remove(self, ids):
+        """削除された行の圧縮コードをインデックスから取り除きます。"""
+        if not self.is_trained or len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        self.conn.execute(
+            f"DELETE FROM {self.delta_table_name} WHERE list_contains(?::INTEGER[], id)",
+            [ids.tolist()],
+        )
+        keep = ~np.isin(self._ids, ids)
+        self._removed_rows += int((~keep).sum())
+        self._ids = self._ids[keep]
+        self._codes = self._codes[keep]
+
+    def drop(self):
+        """インデックスのファイルと差分のテーブルを削除します。"""
+        self.conn.execute(f"DROP TABLE IF EXISTS {self.delta_table_name}")
+        self._ids = np.empty(0, dtype=np.int64)
+        self._codes = np.empty((0, self.quantizer.m), dtype=np.uint8)
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+
+    def needs_training(self) -> bool:
+        """初回の学習、または行の追加・削除による再学習が必要かどうかを返します。"""
+        if not self.is_trained:
+            total = self.conn.execute(
+                f"SELECT count(*) FROM {self.table_name}"
+            ).fetchone()[0]
+            return total >= self.min_train_rows
+        added = self.rows + self._removed_rows - self._trained_rows
+        changed = added + self._removed_rows
+        return changed > self.retrain_ratio * max(self._trained_rows, 1)
+
+    def search(
+        self, query_embedding, k: int = 5, rerank: bool | None = None
+    ) -> list[tuple[int, float]]:
+        """
+        ADCで全行の近似スコアを計算し、上位k件を返します。
+
+        Args:
+            query_embedding: クエリの埋め込み。
+            k: 取得する最近傍の数。
+            rerank: 上位候補を元の埋め込みで再スコアリングするかどうか。
+                    指定しない場合は `rerank_factor` が1以上なら再スコアリングします。
+
+        Returns:
+            List[Tuple[int, float]]: (ID, 類似度スコア) のタプルを類似度の降順に並べたリスト。
+            再スコアリングした場合のスコアは元の埋め込みとのコサイン類似度です。
+        """
+        if not self.is_trained:
+            raise RuntimeError("PQインデックスが学習されていません。")
+        if not self.rows:
+            return []
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32)[None, :])[
+            0
+        ]
+        tables = self.quantizer.inner_product_tables(query)
+        scores = self.quantizer.adc_scores(tables, self._codes)
+
+        rerank = self.rerank_factor > 0 if rerank is None else rerank
+        pool = min(len(scores), k * max(self.rerank_factor, 1) if rerank else k)
+        top = np.argpartition(-scores, pool - 1)[:pool]
+        top = top[np.argsort(-scores[top])]
+        candidates = [(int(self._ids[i]), float(scores[i])) for i in top]
+        if not rerank:
+            return candidates[:k]
+
+        # 上位候補だけ元の埋め込みでコサイン類似度を計算し直す
+        exact = exact_similarities(
+            self.conn,
+            self.table_name,
+            query,
+            [row_id for row_id, _ in candidates],
+            self.embedding_dim,
+        )
+        reranked = sorted(
+            ((row_id, exact[row_id]) for row_id, _ in candidates if row_id in exact),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        return reranked[:k]
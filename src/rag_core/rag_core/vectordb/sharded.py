@@ -0,0 +1,819 @@
+# rag_core/vectordb/sharded.py
+"""
+複数のDuckDBファイルにチャンクを分散して保存するシャード化ベクトルストア。
+
+各シャードは独立した `DuckDBVectorStore` (DuckDBファイル・近似検索インデックス) で、
+書き込みはシャードごとに並列に行われ、検索は全シャードに並列に問い合わせてから
+シャードごとの上位k件をヒープでマージします。
+
+チャンクの振り分けには Rendezvous hashing (HRW) を使用するため、シャードを追加したときに
+移動が必要になるのは新しいシャードに割り当てられる約 1/N のチャンクだけです。
+シャードを追加した後は `rebalance()` (またはこのモジュールのコマンドライン) で
+振り分け先が変わったチャンクを移動します。
+
+使用例:
+    python -m rag_core.vectordb.sharded --db vector_store.db --shards 8
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import logging
+import os
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+import numpy as np
+
+from ..log import configure_logging
+from .snapshot import (
+    FORMAT_VERSION,
+    MANIFEST_FILE,
+    export_snapshot,
+    import_snapshot,
+    read_manifest,
+)
+from .storage import DuckDBVectorStore
+
+logger = logging.getLogger(__name__)
+
+# "hash": チャンクのテキストのハッシュで振り分け,
+# "key": add_embeddings に渡したシャードキー (コレクション名やソースなど) で振り分け
+PARTITIONS = ("hash", "key")
+
+# グローバルIDは `ローカルID * MAX_SHARDS + シャード番号` で表す
+# (シャード数を増やしても既存の行のIDは変わらない)
+MAX_SHARDS = 256
+
+
+def shard_path(db_path: str, shard_no: int) -> str:
+    """シャード番号に対応するDuckDBファイルのパスを返します。"""
+    if db_path == ":memory:":
+        return db_path
+    root, ext = os.path.splitext(db_path)
+    return f"{root}_shard{shard_no:02d}{ext}"
+
+
+def rendezvous_shard(key: str, num_shards: int) -> int:
+    """Rendezvous hashing でキーの振り分け先のシャード番号を返します。"""
+    return max(
+        range(num_shards),
+        key=lambda shard_no: hashlib.blake2b(
+            f"{shard_no}:{key}".encode(), digest_size=8
+        ).digest(),
+    )
+
+
+class ShardedVectorStore:
+    """`DuckDBVectorStore` と同じインターフェースで複数のシャードを扱うベクトルストア"""
+
+    def __init__(
+        self,
+        db_path: str = "vector_store.db",
+        num_shards: int = 4,
+        table_name: str = "embeddings",
+        partition: str = "hash",
+        max_workers: int | None = None,
+        **store_kwargs,
+    ):
+        """
+        ShardedVectorStoreを初期化し、各シャードを開きます。
+
+        Args:
+            db_path (str): シャードのファイル名の元になるパス。
+                           "vector_store.db" の場合は "vector_store_shard00.db" などになります。
+            num_shards (int): シャード数。
+            table_name (str): 埋め込みを格納するテーブルの名前。
+            partition (str): チャンクの振り分け方法 ("hash" または "key")。
+            max_workers (int | None): 並列に問い合わせるスレッド数。指定しない場合はシャード数。
+            **store_kwargs: 各シャードの `DuckDBVectorStore` に渡す引数 (index_type など)。
+        """
+        if not 1 <= num_shards <= MAX_SHARDS:
+            raise ValueError(
+                f"シャード数は1以上 {MAX_SHARDS} 以下である必要があります: {num_shards}"
+            )
+        if partition not in PARTITIONS:
+            raise ValueError(
+                f"サポートされていない振り分け方法です: {partition} {PARTITIONS}"
+            )
+        self.db_path = db_path
+        self.table_name = table_name
+        self.partition = partition
+        self.shard_keys_table_name = f"{table_name}_shard_keys"
+        self.shards = [
+            DuckDBVectorStore(
+                db_path=shard_path(db_path, shard_no),
+                table_name=table_name,
+                **store_kwargs,
+            )
+            for shard_no in range(num_shards)
+        ]
+        self.embedding_dim = self.shards[0].embedding_dim
+        self.embedding_model = self.shards[0].embedding_model
+        self.index_type = self.shards[0].index_type
+        for shard in self.shards:
+            shard.conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.shard_keys_table_name} (
+                    id INTEGER PRIMARY KEY,
+                    shard_key VARCHAR
+                );
+                """
+            )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or num_shards, thread_name_prefix="vector-shard"
+        )
+        logger.info("ShardedVectorStoreを初期化しました: シャード数=%d", num_shards)
+
+    @property
+    def num_shards(self) -> int:
+        return len(self.shards)
+
+    @property
+    def write_generation(self) -> int:
+        """
+        書き込み世代。世代はプロセス内で単調に増加するため、いずれかのシャードへの書き込みで
+        全シャードの最大値が更新されます。
+        """
+        return max(shard.write_generation for shard in self.shards)
+
+    @property
+    def metadata_store(self) -> DuckDBVectorStore:
+        """取り込みの進捗とMinHashインデックスを保存するシャード (シャード0)"""
+        return self.shards[0]
+
+    @staticmethod
+    def to_global_id(shard_no: int, local_id: int) -> int:
+        return local_id * MAX_SHARDS + shard_no
+
+    @staticmethod
+    def from_global_id(global_id: int) -> tuple[int, int]:
+        """グローバルIDを (シャード番号, ローカルID) に分解します。"""
+        local_id, shard_no = divmod(int(global_id), MAX_SHARDS)
+        return shard_no, local_id
+
+    def _route(self, text: str, shard_key: str | None) -> int:
+        if self.partition == "key":
+            if shard_key is None:
+                raise ValueError("partition='key' の場合は shard_key が必要です。")
+            return rendezvous_shard(shard_key, self.num_shards)
+        return rendezvous_shard(text, self.num_shards)
+
+    def _fan_out(self, func, shard_nos=None) -> list:
+        """シャードごとに func(シャード番号, シャード) を並列に実行し、結果をシャード順に返します。"""
+        shard_nos = range(self.num_shards) if shard_nos is None else list(shard_nos)
+        return list(
+            self._executor.map(
+                lambda shard_no: func(shard_no, self.shards[shard_no]), shard_nos
+            )
+        )
+
+    def _group_ids(self, ids: list[int]) -> dict[int, list[int]]:
+        """グローバルIDをシャードごとのローカルIDのリストに分けます。"""
+        groups: dict[int, list[int]] = {}
+        for global_id in ids:
+            shard_no, local_id = self.from_global_id(global_id)
+            if shard_no < self.num_shards:
+                groups.setdefault(shard_no, []).append(local_id)
+        return groups
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        全シャードのトランザクションを開始し、ブロックが正常に終了した場合にコミットします。
+
+        コミットはシャードごとに順番に行われるため、シャードをまたいだ原子性は保証されません。
+        """
+        with ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.transaction())
+            yield
+
+    def add_embeddings(
+        self,
+        texts: list[str],
+        embeddings: list[list[float]],
+        shard_key: str | None = None,
+        sources: list[str | None] | None = None,
+        content_hashes: list[str | None] | None = None,
+        ordinals: list[int | None] | None = None,
+    ) -> list[int]:
+        """
+        テキストと埋め込みを振り分け先のシャードに並列に追加します。
+
+        Args:
+            texts (List[str]): テキストコンテンツのリスト。
+            embeddings (List[List[float]]): 対応する埋め込みのリスト。
+            shard_key (str | None): partition="key" の場合の振り分けキー。
+                                     同じキーのチャンクは同じシャードに保存されます。
+            sources (List[str | None] | None): 各チャンクのソース。
+            content_hashes (List[str | None] | None): 各チャンクのソースの本文のハッシュ値。
+            ordinals (List[int | None] | None): 各チャンクのソース内での位置。
+
+        Returns:
+            List[int]: 追加した行のグローバルIDのリスト (入力の順)。
+        """
+        if not texts or len(texts) == 0:
+            logger.debug("追加するテキストがありません。")
+            return []
+        sources = sources if sources is not None else [None] * len(texts)
+        content_hashes = (
+            content_hashes if content_hashes is not None else [None] * len(texts)
+        )
+        ordinals = ordinals if ordinals is not None else [None] * len(texts)
+        groups: dict[int, list[int]] = {}
+        for i, text in enumerate(texts):
+            groups.setdefault(self._route(text, shard_key), []).append(i)
+
+        def add(shard_no: int, shard: DuckDBVectorStore) -> list[int]:
+            indices = groups[shard_no]
+            local_ids = self._add_to_shard(
+                shard_no,
+                [texts[i] for i in indices],
+                [embeddings[i] for i in indices],
+                shard_key,
+                [sources[i] for i in indices],
+                [content_hashes[i] for i in indices],
+                [ordinals[i] for i in indices],
+            )
+            # 外側のトランザクションがない場合は、必要に応じてインデックスを再学習する
+            if shard._transaction_depth == 0:
+                shard.maintain_index()
+            return local_ids
+
+        ids: list[int] = [0] * len(texts)
+        for shard_no, local_ids in zip(groups, self._fan_out(add, groups), strict=True):
+            for i, local_id in zip(groups[shard_no], local_ids, strict=True):
+                ids[i] = self.to_global_id(shard_no, local_id)
+        return ids
+
+    def _delete_from_shard(
+        self, shard_no: int, condition: str, params: list
+    ) -> list[str]:
+        """シャードから条件に一致する行とそのシャードキーを削除し、削除した行のテキストを返します。"""
+        shard = self.shards[shard_no]
+        with shard.transaction():
+            rows = shard._delete_rows(condition, params)
+            if rows:
+                shard.conn.execute(
+                    f"""
+                    DELETE FROM {self.shard_keys_table_name}
+                    WHERE list_contains(?::INTEGER[], id)
+                    """,
+                    [[row_id for row_id, _ in rows]],
+                )
+        return [text for _, text in rows]
+
+    def existing_texts(self, texts: list[str]) -> set[str]:
+        """指定したテキストのうち、いずれかのシャードに存在するものを返します。"""
+        if not texts:
+            return set()
+        return set().union(*self._fan_out(lambda _, shard: shard.existing_texts(texts)))
+
+    def _release_minhash_entries(self, texts: list[str]):
+        """どのシャードにも残っていないテキストのMinHashエントリを削除します。"""
+        self.metadata_store.delete_minhash_entries(
+            list(set(texts) - self.existing_texts(texts))
+        )
+
+    def delete_by_ids(self, ids: list[int]) -> int:
+        """
+        指定したグローバルIDの行を各シャードから並列に削除します。
+
+        Returns:
+            int: 削除した行数。
+        """
+        groups = self._group_ids(ids)
+        if not groups:
+            return 0
+        with self.transaction():
+            per_shard = self._fan_out(
+                lambda shard_no, _: self._delete_from_shard(
+                    shard_no, "list_contains(?::INTEGER[], id)", [groups[shard_no]]
+                ),
+                groups,
+            )
+            texts = [text for texts in per_shard for text in texts]
+            self._release_minhash_entries(texts)
+        return len(texts)
+
+    def delete_by_source(
+        self, source: str, keep_content_hash: str | None = None
+    ) -> int:
+        """
+        ソースのチャンクを全シャードから並列に削除し、取り込み進捗も削除します。
+
+        Args:
+            source (str): ファイルのパスなど、ドキュメントのソース。
+            keep_content_hash (str | None): 指定した場合、このハッシュ値のチャンクは残します。
+
+        Returns:
+            int: 削除した行数。
+        """
+        with self.transaction():
+            per_shard = self._fan_out(
+                lambda shard_no, _: self._delete_from_shard(
+                    shard_no,
+                    "source = ? AND (?::VARCHAR IS NULL OR content_hash IS DISTINCT FROM ?)",
+                    [source, keep_content_hash, keep_content_hash],
+                )
+            )
+            texts = [text for texts in per_shard for text in texts]
+            self._release_minhash_entries(texts)
+            self.metadata_store.delete_source_metadata(source, keep_content_hash)
+        return len(texts)
+
+    def has_stale_version(self, source: str, content_hash: str) -> bool:
+        """いずれかのシャードに、指定したハッシュ値以外の版のチャンクまたは進捗があるかを返します。"""
+        return any(
+            self._fan_out(
+                lambda _, shard: shard.has_stale_version(source, content_hash)
+            )
+        )
+
+    def upsert_source(
+        self,
+        source: str,
+        texts: list[str],
+        embeddings: list[list[float]],
+        content_hash: str | None = None,
+        shard_key: str | None = None,
+    ):
+        """
+        ソースのチャンクをすべて置き換えます。
+
+        削除と追加は全シャードのトランザクション内で行われますが、
+        コミットはシャードごとに行われるため、シャードをまたいだ原子性は保証されません。
+        """
+        with self.transaction():
+            self.delete_by_source(source)
+            self.add_embeddings(
+                texts,
+                embeddings,
+                shard_key=shard_key,
+                sources=[source] * len(texts),
+                content_hashes=[content_hash] * len(texts),
+                ordinals=list(range(len(texts))),
+            )
+        self.maintain_index()
+
+    def compact(self) -> dict[str, int]:
+        """全シャードを並列にコンパクションし、行数とファイルサイズを合計して返します。"""
+
+        def compact_shard(_, shard: DuckDBVectorStore) -> dict[str, int]:
+            # 削除済みの行のシャードキーが残っていれば削除する
+            shard.conn.execute(
+                f"""
+                DELETE FROM {self.shard_keys_table_name} k
+                WHERE NOT EXISTS (SELECT 1 FROM {self.table_name} e WHERE e.id = k.id)
+                """
+            )
+            return shard.compact()
+
+        per_shard = self._fan_out(compact_shard)
+        return {key: sum(stats[key] for stats in per_shard) for key in per_shard[0]}
+
+    def build_index(self):
+        """全シャードの近似検索インデックスを並列に (再) 学習します。"""
+        self._fan_out(lambda _, shard: shard.build_index())
+
+    def maintain_index(self):
+        """学習が必要なシャードの近似検索インデックスを並列に学習します。"""
+        self._fan_out(lambda _, shard: shard.maintain_index())
+
+    # 取り込みの進捗とニアデュプリケート検出のインデックスはシャード0にまとめて保存する
+    def get_ingest_progress(self, source: str, content_hash: str) -> int:
+        return self.metadata_store.get_ingest_progress(source, content_hash)
+
+    def save_ingest_progress(self, *args, **kwargs):
+        self.metadata_store.save_ingest_progress(*args, **kwargs)
+
+    def find_minhash_candidates(self, buckets):
+        return self.metadata_store.find_minhash_candidates(buckets)
+
+    def add_minhash_entries(self, entries):
+        self.metadata_store.add_minhash_entries(entries)
+
+    def add_duplicate_links(self, links):
+        self.metadata_store.add_duplicate_links(links)
+
+    def similarity_search(
+        self,
+        query_embedding: list[float],
+        k: int = 5,
+        nprobe: int | None = None,
+        min_similarity: float | None = None,
+    ) -> list[tuple[str, float]]:
+        """全シャードを並列に検索し、類似度の上位k件の (テキスト, 類似度) を返します。"""
+        return [
+            (text, similarity)
+            for _, text, similarity in self.similarity_search_with_ids(
+                query_embedding, k=k, nprobe=nprobe, min_similarity=min_similarity
+            )
+        ]
+
+    def similarity_search_with_ids(
+        self,
+        query_embedding: list[float],
+        k: int = 5,
+        nprobe: int | None = None,
+        min_similarity: float | None = None,
+    ) -> list[tuple[int, str, float]]:
+        """
+        全シャードを並列に検索し、シャードごとの上位k件をヒープでマージします。
+
+        Returns:
+            List[Tuple[int, str, float]]: (グローバルID, テキスト, 類似度スコア) のタプルのリスト。
+        """
+        per_shard = self._fan_out(
+            lambda shard_no, shard: [
+                (self.to_global_id(shard_no, row_id), text, similarity)
+                for row_id, text, similarity in shard.similarity_search_with_ids(
+                    query_embedding, k=k, nprobe=nprobe, min_similarity=min_similarity
+                )
+            ]
+        )
+        return heapq.nlargest(
+            k, (hit for hits in per_shard for hit in hits), key=lambda hit: hit[2]
+        )
+
+    def similarity_search_batch_with_ids(
+        self,
+        query_embeddings: list[list[float]],
+        k: int = 5,
+        nprobe: int | None = None,
+    ) -> list[list[tuple[int, str, float]]]:
+        """
+        全シャードで複数のクエリの類似検索をまとめて実行し、クエリごとに上位k件をマージします。
+
+        Returns:
+            List[List[Tuple[int, str, float]]]: クエリごとの (グローバルID, テキスト, 類似度スコア) のリスト。
+        """
+        per_shard = self._fan_out(
+            lambda shard_no, shard: [
+                [
+                    (self.to_global_id(shard_no, row_id), text, similarity)
+                    for row_id, text, similarity in hits
+                ]
+                for hits in shard.similarity_search_batch_with_ids(
+                    query_embeddings, k=k, nprobe=nprobe
+                )
+            ]
+        )
+        return [
+            heapq.nlargest(
+                k,
+                (hit for shard_hits in per_shard for hit in shard_hits[query_no]),
+                key=lambda hit: hit[2],
+            )
+            for query_no in range(len(query_embeddings))
+        ]
+
+    def lexical_search(
+        self, query_text: str, k: int = 5
+    ) -> list[tuple[int, str, float]]:
+        """
+        全シャードでBM25全文検索を並列に実行し、スコアの上位k件をマージします。
+
+        BM25のIDFはシャードごとに計算されるため、単一のストアとはスコアが多少異なります。
+        """
+        per_shard = self._fan_out(
+            lambda shard_no, shard: [
+                (self.to_global_id(shard_no, row_id), text, score)
+                for row_id, text, score in shard.lexical_search(query_text, k=k)
+            ]
+        )
+        return heapq.nlargest(
+            k, (hit for hits in per_shard for hit in hits), key=lambda hit: hit[2]
+        )
+
+    def get_texts(self, ids: list[int]) -> dict[int, str]:
+        """指定したグローバルIDの行のテキストを取得します。"""
+        groups = self._group_ids(ids)
+        per_shard = self._fan_out(
+            lambda shard_no, shard: {
+                self.to_global_id(shard_no, row_id): text
+                for row_id, text in shard.get_texts(groups[shard_no]).items()
+            },
+            groups,
+        )
+        return {row_id: text for texts in per_shard for row_id, text in texts.items()}
+
+    def get_embeddings(self, ids: list[int]) -> dict[int, list[float]]:
+        """指定したグローバルIDの行の埋め込みを取得します。"""
+        groups = self._group_ids(ids)
+        per_shard = self._fan_out(
+            lambda shard_no, shard: {
+                self.to_global_id(shard_no, row_id): embedding
+                for row_id, embedding in shard.get_embeddings(groups[shard_no]).items()
+            },
+            groups,
+        )
+        return {
+            row_id: embedding
+            for embeddings in per_shard
+            for row_id, embedding in embeddings.items()
+        }
+
+    def neighbor_chunks(
+        self, ids: list[int], window: int
+    ) -> dict[int, list[tuple[int, str]]]:
+        """
+        指定したグローバルIDの行と、同じソースの前後 `window` 個のチャンクを取得します。
+
+        同じソースのチャンクは別のシャードに保存されている場合があるため、指定した行の位置を
+        各シャードから取得した後、すべての位置の前後のチャンクを各シャードで1回のクエリで取得します。
+        """
+        groups = self._group_ids(ids)
+        positions: dict[int, tuple[str, str | None, int]] = {}
+        for shard_positions in self._fan_out(
+            lambda shard_no, shard: {
+                self.to_global_id(shard_no, row_id): position
+                for row_id, position in shard.chunk_positions(groups[shard_no]).items()
+            },
+            groups,
+        ):
+            positions.update(shard_positions)
+        # ソース (とハッシュ値) ごとに、位置から (グローバルID, テキスト) のリストへのマッピング
+        nearby: dict[tuple[str, str | None], dict[int, list[tuple[int, str]]]] = {}
+        unique_positions = list(set(positions.values()))
+        for shard_no, rows in enumerate(
+            self._fan_out(lambda _, shard: shard.chunks_near(unique_positions, window))
+        ):
+            for row_id, source, content_hash, ordinal, text in rows:
+                nearby.setdefault((source, content_hash), {}).setdefault(
+                    ordinal, []
+                ).append((self.to_global_id(shard_no, row_id), text))
+
+        texts = self.get_texts([row_id for row_id in ids if row_id not in positions])
+        neighbors: dict[int, list[tuple[int, str]]] = {
+            row_id: [(row_id, text)] for row_id, text in texts.items()
+        }
+        for row_id, (source, content_hash, ordinal) in positions.items():
+            chunks = nearby.get((source, content_hash), {})
+            neighbors[row_id] = [
+                chunk
+                for position in range(ordinal - window, ordinal + window + 1)
+                for chunk in sorted(chunks.get(position, []))
+            ]
+        return neighbors
+
+    def similarities_by_ids(
+        self, query_embedding: list[float], ids: list[int]
+    ) -> dict[int, float]:
+        """指定したグローバルIDの行について、クエリとのコサイン類似度を計算します。"""
+        groups = self._group_ids(ids)
+        per_shard = self._fan_out(
+            lambda shard_no, shard: {
+                self.to_global_id(shard_no, row_id): similarity
+                for row_id, similarity in shard.similarities_by_ids(
+                    query_embedding, groups[shard_no]
+                ).items()
+            },
+            groups,
+        )
+        return {row_id: sim for sims in per_shard for row_id, sim in sims.items()}
+
+    def count(self) -> list[int]:
+        """シャードごとの行数を返します。"""
+        return self._fan_out(
+            lambda _, shard: shard.conn.execute(
+                f"SELECT count(*) FROM {self.table_name}"
+            ).fetchone()[0]
+        )
+
+    def export_snapshot(self, directory: str) -> dict:
+        """
+        全シャードを並列に `shardNN/` サブディレクトリへスナップショットとして書き出します。
+
+        Returns:
+            dict: シャード数とシャードごとのマニフェストを含むマニフェスト。
+        """
+        extra_tables = {"shard_keys": self.shard_keys_table_name}
+        shard_manifests = self._fan_out(
+            lambda shard_no, shard: export_snapshot(
+                shard,
+                os.path.join(directory, f"shard{shard_no:02d}"),
+                extra_tables=extra_tables,
+            )
+        )
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "num_shards": self.num_shards,
+            "partition": self.partition,
+            "embedding_dim": self.embedding_dim,
+            "embedding_model": self.embedding_model,
+            "rows": sum(m["rows"] for m in shard_manifests),
+            "shards": [f"shard{shard_no:02d}" for shard_no in range(self.num_shards)],
+        }
+        with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return manifest
+
+    def import_snapshot(self, directory: str) -> dict:
+        """
+        `export_snapshot` で書き出したスナップショットを各シャードに並列に読み込みます。
+
+        グローバルIDにシャード番号が含まれるため、シャード数がスナップショットと同じである必要があります。
+        シャード数を変更する場合は、同じシャード数で読み込んでから `rebalance()` を実行してください。
+
+        Raises:
+            ValueError: シャード化されていないスナップショット、またはシャード数が異なる場合。
+        """
+        manifest = read_manifest(directory)
+        if manifest.get("num_shards") != self.num_shards:
+            raise ValueError(
+                f"スナップショットのシャード数が一致しません。期待値: {self.num_shards}, "
+                f"スナップショット: {manifest.get('num_shards')}"
+            )
+        extra_tables = {"shard_keys": self.shard_keys_table_name}
+        per_shard = self._fan_out(
+            lambda shard_no, shard: import_snapshot(
+                shard,
+                os.path.join(directory, manifest["shards"][shard_no]),
+                extra_tables=extra_tables,
+            )
+        )
+        return {
+            "rows": sum(stats["rows"] for stats in per_shard),
+            "load_seconds": max(stats["load_seconds"] for stats in per_shard),
+            "index_seconds": max(stats["index_seconds"] for stats in per_shard),
+        }
+
+    def _iter_misplaced(
+        self, shard_no: int, batch_size: int
+    ) -> Iterator[dict[int, tuple[list[int], list[str], list[np.ndarray], list]]]:
+        """
+        シャード内の行のうち、振り分け先が別のシャードになる行を移動先ごとにまとめて返します。
+
+        移動先ごとの値は (ID, テキスト, 埋め込み, (シャードキー, ソース, ハッシュ値, 位置)) のリストです。
+        """
+        shard = self.shards[shard_no]
+        last_id = 0
+        while True:
+            rows = shard.conn.execute(
+                f"""
+                SELECT e.id, e.text, e.embedding, k.shard_key, e.source, e.content_hash,
+                       e.ordinal
+                FROM {self.table_name} e
+                LEFT JOIN {self.shard_keys_table_name} k ON k.id = e.id
+                WHERE e.id > ? ORDER BY e.id LIMIT ?
+                """,
+                [last_id, batch_size],
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            moves: dict[int, tuple[list, list, list, list]] = {}
+            for (
+                row_id,
+                text,
+                embedding,
+                shard_key,
+                source,
+                content_hash,
+                ordinal,
+            ) in rows:
+                if self.partition == "key" and shard_key is None:
+                    # キーのない行は移動しない
+                    continue
+                target = self._route(text, shard_key)
+                if target != shard_no:
+                    ids, texts, embeddings, keys = moves.setdefault(
+                        target, ([], [], [], [])
+                    )
+                    ids.append(row_id)
+                    texts.append(text)
+                    embeddings.append(np.asarray(embedding, dtype=np.float32))
+                    keys.append((shard_key, source, content_hash, ordinal))
+            yield moves
+
+    def rebalance(self, batch_size: int = 1000) -> dict[int, int]:
+        """
+        振り分け先が現在のシャード数で変わったチャンクを正しいシャードへ移動します。
+
+        シャードを追加した後に実行します。行は移動先のシャードで新しいIDを採番されるため、
+        移動したチャンクのグローバルIDは変わります。シャード数を減らす場合には対応していません。
+
+        Args:
+            batch_size (int): 一度に読み込む行数。
+
+        Returns:
+            Dict[int, int]: 移動元のシャード番号から移動した行数へのマッピング。
+        """
+        moved: dict[int, int] = {}
+        for shard_no, shard in enumerate(self.shards):
+            for moves in self._iter_misplaced(shard_no, batch_size):
+                for target, (ids, texts, embeddings, keys) in moves.items():
+                    with self.transaction():
+                        # 同じキーの行はまとめて移動先に追加する
+                        by_key: dict = {}
+                        for text, embedding, (
+                            key,
+                            source,
+                            content_hash,
+                            ordinal,
+                        ) in zip(texts, embeddings, keys, strict=True):
+                            group = by_key.setdefault(key, ([], [], [], [], []))
+                            group[0].append(text)
+                            group[1].append(embedding)
+                            group[2].append(source)
+                            group[3].append(content_hash)
+                            group[4].append(ordinal)
+                        for key, group in by_key.items():
+                            self._add_to_shard(target, *group[:2], key, *group[2:])
+                        self._delete_from_shard(
+                            shard_no, "list_contains(?::INTEGER[], id)", [ids]
+                        )
+                    moved[shard_no] = moved.get(shard_no, 0) + len(ids)
+            if moved.get(shard_no):
+                # 移動した行の分だけ偏ったリストやコードブックを作り直す
+                index = shard._approximate_index()
+                if index is not None and index.is_trained:
+                    shard.build_index()
+            logger.info(
+                "シャード%d: %d行を移動しました。", shard_no, moved.get(shard_no, 0)
+            )
+        self.maintain_index()
+        return moved
+
+    def _add_to_shard(
+        self,
+        shard_no: int,
+        texts: list[str],
+        embeddings: list,
+        shard_key: str | None,
+        sources: list[str | None] | None = None,
+        content_hashes: list[str | None] | None = None,
+        ordinals: list[int | None] | None = None,
+    ) -> list[int]:
+        """シャードに行を追加し、シャードキーがあれば再配置のために記録します。追加した行のローカルIDを返します。"""
+        shard = self.shards[shard_no]
+        with shard.transaction():
+            ids = shard.add_embeddings(
+                texts,
+                embeddings,
+                sources=sources,
+                content_hashes=content_hashes,
+                ordinals=ordinals,
+            )
+            if shard_key is not None:
+                shard.conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.shard_keys_table_name} VALUES (?, ?)",
+                    [[row_id, shard_key] for row_id in ids],
+                )
+        return ids
+
+    def drop(self):
+        """全シャードの埋め込みテーブルと、それに付随するテーブルを削除し、接続を閉じます。"""
+        for shard in self.shards:
+            shard.conn.execute(f"DROP TABLE IF EXISTS {self.shard_keys_table_name}")
+        self._executor.shutdown(wait=True)
+        for shard in self.shards:
+            shard.drop()
+
+    def close(self):
+        """全シャードの接続を閉じます。"""
+        self._executor.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="シャードを追加した後にチャンクを再配置します"
+    )
+    parser.add_argument(
+        "--db", default="vector_store.db", help="シャードの元になるパス"
+    )
+    parser.add_argument("--shards", type=int, required=True, help="新しいシャード数")
+    parser.add_argument("--table", default="embeddings", help="埋め込みテーブルの名前")
+    parser.add_argument(
+        "--partition", default="hash", choices=PARTITIONS, help="振り分け方法"
+    )
+    parser.add_argument(
+        "--index-type", default="exact", help="近似検索インデックスの種類"
+    )
+    args = parser.parse_args()
+    configure_logging()
+
+    store = ShardedVectorStore(
+        db_path=args.db,
+        num_shards=args.shards,
+        table_name=args.table,
+        partition=args.partition,
+        index_type=args.index_type,
+    )
+    try:
+        print(f"再配置前の行数: {store.count()}")
+        moved = store.rebalance()
+        print(f"移動した行数: {sum(moved.values())}")
+        print(f"再配置後の行数: {store.count()}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
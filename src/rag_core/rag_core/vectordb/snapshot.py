@@ -0,0 +1,226 @@
+# rag_core/vectordb/snapshot.py
+"""
+ベクトルストアのParquetスナップショットの書き出しと読み込み。
+
+スナップショットはディレクトリで、埋め込みテーブル (ID・テキスト・埋め込み・ソース) と
+取り込み進捗・MinHashインデックスなどのメタデータをテーブルごとの Parquet ファイルに、
+次元数や行数を `manifest.json` に保存します。
+
+読み込みはDuckDBの `read_parquet` による一括挿入で行い、近似検索インデックスは
+全行の挿入後にまとめて学習します。Ollamaで埋め込みを作り直したり、稼働中のDuckDBファイルを
+コピーしたりせずに、新しいレプリカのベクトルストアを準備できます。
+
+コマンドラインからは `rag-core-cli snapshot export` / `rag-core-cli snapshot import` で実行します。
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .storage import DuckDBVectorStore
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+# 近似検索インデックスの学習済みパラメータ (IVFの重心、PQのコードブック)
+INDEX_PARAMETERS_FILE = "index_parameters.npz"
+# スナップショットの形式のバージョン。互換性のない変更をした場合に上げる
+FORMAT_VERSION = 1
+
+
+def _snapshot_tables(store: "DuckDBVectorStore") -> dict[str, str]:
+    """スナップショットに含めるテーブルの (役割 -> テーブル名) を返します。"""
+    return {"embeddings": store.table_name, **store.metadata_table_names}
+
+
+def read_manifest(directory: str) -> dict:
+    """
+    スナップショットのマニフェストを読み込みます。
+
+    Raises:
+        ValueError: マニフェストが存在しない場合、または形式のバージョンがサポートされていない場合。
+    """
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise ValueError(f"スナップショットのマニフェストが見つかりません: {path}")
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(
+            f"サポートされていないスナップショットの形式です: {manifest.get('format_version')}"
+        )
+    return manifest
+
+
+def export_snapshot(
+    store: "DuckDBVectorStore",
+    directory: str,
+    extra_tables: dict[str, str] | None = None,
+) -> dict:
+    """
+    ベクトルストアの内容をParquetファイルとマニフェストに書き出します。
+
+    Args:
+        store: 書き出すベクトルストア。
+        directory: 書き出し先のディレクトリ (存在しない場合は作成します)。
+        extra_tables: 追加で書き出すテーブルの (役割 -> テーブル名)。
+
+    Returns:
+        書き出したスナップショットのマニフェスト。
+    """
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    tables = {**_snapshot_tables(store), **(extra_tables or {})}
+    files = {}
+    # 1つのトランザクションで読み込み、テーブル間で整合性のとれた状態を書き出す
+    with store.transaction():
+        for role, table_name in tables.items():
+            file_name = f"{role}.parquet"
+            # 埋め込みはID順に書き出し、読み込み後の主キーの挿入を連続させる
+            order = " ORDER BY id" if table_name == store.table_name else ""
+            store.conn.execute(
+                f"""
+                COPY (SELECT * FROM {table_name}{order})
+                TO ? (FORMAT parquet, COMPRESSION zstd)
+                """,
+                [os.path.join(directory, file_name)],
+            )
+            rows = store.conn.execute(f"SELECT count(*) FROM {table_name}").fetchone()[
+                0
+            ]
+            files[role] = {"file": file_name, "rows": rows}
+        max_id = store.conn.execute(
+            f"SELECT COALESCE(MAX(id), 0) FROM {store.table_name}"
+        ).fetchone()[0]
+
+    # 読み込み時に学習 (k-means) を省略できるよう、学習済みのパラメータも保存する
+    index = store._approximate_index()
+    parameters = index.trained_parameters() if index is not None else {}
+    if parameters:
+        np.savez(os.path.join(directory, INDEX_PARAMETERS_FILE), **parameters)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "table_name": store.table_name,
+        "embedding_dim": store.embedding_dim,
+        "embedding_model": store.embedding_model,
+        "index_type": store.index_type,
+        "index_parameters": INDEX_PARAMETERS_FILE if parameters else None,
+        "rows": files["embeddings"]["rows"],
+        "max_id": max_id,
+        "created_at": datetime.now().isoformat(),
+        "tables": files,
+    }
+    # マニフェストは最後に書き込み、書き出しが完了したスナップショットだけが読み込めるようにする
+    with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(
+        "スナップショットを書き出しました: %s (行数=%d, %.2f秒)",
+        directory,
+        manifest["rows"],
+        time.perf_counter() - started,
+    )
+    return manifest
+
+
+def import_snapshot(
+    store: "DuckDBVectorStore",
+    directory: str,
+    extra_tables: dict[str, str] | None = None,
+) -> dict:
+    """
+    スナップショットを空のベクトルストアに一括で読み込み、近似検索インデックスを学習します。
+
+    行IDはスナップショットの値がそのまま使用され、IDのシーケンスは最大のIDの次から再開します。
+    スナップショットに同じ種類の近似検索インデックスの学習済みパラメータが含まれる場合は、
+    k-meansによる学習を省略して全行の割り当て (圧縮) だけを行います。
+    全文検索インデックスは次回の全文検索時に構築されます。
+
+    Args:
+        store: 読み込み先のベクトルストア。埋め込みテーブルが空である必要があります。
+        directory: スナップショットのディレクトリ。
+        extra_tables: 追加で読み込むテーブルの (役割 -> テーブル名)。
+
+    Returns:
+        読み込んだ行数 (`rows`) と処理時間 (`load_seconds`, `index_seconds`) を含む辞書。
+
+    Raises:
+        ValueError: スナップショットが不正な場合、次元数が一致しない場合、
+                    または読み込み先のテーブルが空でない場合。
+    """
+    manifest = read_manifest(directory)
+    if "shards" in manifest:
+        raise ValueError(
+            f"シャード化されたスナップショットは ShardedVectorStore で読み込んでください: {directory}"
+        )
+    if manifest["embedding_dim"] != store.embedding_dim:
+        raise ValueError(
+            f"スナップショットの次元数が一致しません。期待値: {store.embedding_dim}, "
+            f"スナップショット: {manifest['embedding_dim']}"
+        )
+    existing = store.conn.execute(
+        f"SELECT count(*) FROM {store.table_name}"
+    ).fetchone()[0]
+    if existing:
+        raise ValueError(
+            f"読み込み先のテーブルが空ではありません: {store.table_name} ({existing}行)"
+        )
+
+    started = time.perf_counter()
+    tables = {**_snapshot_tables(store), **(extra_tables or {})}
+    with store.transaction():
+        for role, table_name in tables.items():
+            entry = manifest["tables"].get(role)
+            if entry is None:
+                continue
+            # 列名で対応付けるため、スナップショットの後に追加された列は NULL になる
+            store.conn.execute(
+                f"INSERT INTO {table_name} BY NAME SELECT * FROM read_parquet(?)",
+                [os.path.join(directory, entry["file"])],
+            )
+        rows = store.conn.execute(
+            f"SELECT count(*) FROM {store.table_name}"
+        ).fetchone()[0]
+        if rows != manifest["rows"]:
+            raise ValueError(
+                f"スナップショットの行数が一致しません。マニフェスト: {manifest['rows']}, 読み込み: {rows}"
+            )
+        store._reset_id_sequence()
+    load_seconds = time.perf_counter() - started
+
+    # 近似検索インデックスは全行を読み込んでからまとめて構築する
+    # 同じ種類のインデックスの学習済みパラメータがあれば、学習を省略して割り当てだけを行う
+    started = time.perf_counter()
+    index = store._approximate_index()
+    parameters = {}
+    if manifest.get("index_parameters") and manifest["index_type"] == store.index_type:
+        with np.load(os.path.join(directory, manifest["index_parameters"])) as f:
+            parameters = dict(f)
+    if parameters or (
+        index is not None and (index.is_trained or index.needs_training())
+    ):
+        try:
+            index.train(**parameters)
+        except ValueError as e:
+            # PQの部分空間の数などの設定が異なる場合は学習し直す
+            logger.warning(
+                "学習済みのパラメータを使用できないため、学習し直します: %s", e
+            )
+            index.train()
+    store._fts_dirty = True
+    store.conn.execute("CHECKPOINT")
+    index_seconds = time.perf_counter() - started
+
+    stats = {
+        "rows": rows,
+        "load_seconds": round(load_seconds, 3),
+        "index_seconds": round(index_seconds, 3),
+    }
+    logger.info("スナップショットを読み込みました: %s %s", directory, stats)
+    return stats
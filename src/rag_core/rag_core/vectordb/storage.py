@@ -1,8 +1,32 @@
+import hashlib
+import itertools
+import logging
 import os
+import tempfile
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
 
 import duckdb
 import numpy as np
 
+from ..metrics import metrics
+from .ivf import IVFIndex, exact_similarities
+from .matryoshka import MatryoshkaIndex
+from .pq import PQIndex
+from .snapshot import export_snapshot, import_snapshot
+
+# "exact": 全行をスキャンする厳密検索, "ivf": IVFインデックスによる近似検索,
+# "pq": 直積量子化で圧縮したコードによる近似検索,
+# "matryoshka": 埋め込みの先頭の次元による粗い検索と元の埋め込みによる再スコアリング
+INDEX_TYPES = ("exact", "ivf", "pq", "matryoshka")
+
+# 書き込み世代の採番。プロセス内のすべてのストアで共有し、開き直したストアの世代が
+# 閉じる前の世代と重ならないようにする
+_write_generations = itertools.count(1)
+
+logger = logging.getLogger(__name__)
+
 
 class DuckDBVectorStore:
     """
@@ -10,7 +34,19 @@ class DuckDBVectorStore:
     """
 
     def __init__(
-        self, db_path: str = "vector_store.db", table_name: str = "embeddings"
+        self,
+        db_path: str = "vector_store.db",
+        table_name: str = "embeddings",
+        embedding_dim: int = 1024,
+        index_type: str = "exact",
+        index_dir: str | None = None,
+        ivf_nlist: int | None = None,
+        ivf_nprobe: int = 8,
+        pq_m: int = 64,
+        pq_rerank_factor: int = 10,
+        matryoshka_dim: int = 256,
+        matryoshka_candidates: int = 100,
+        embedding_model: str | None = None,
     ):
         """
         DuckDBVectorStoreを初期化します。
@@ -18,10 +54,53 @@ class DuckDBVectorStore:
         Args:
             db_path (str): DuckDBデータベースファイルのパス。
             table_name (str): 埋め込みを格納するテーブルの名前。
+            embedding_dim (int): 埋め込みの次元数 (デフォルトは bge-m3 の1024次元)。
+            index_type (str): 類似検索に使用するインデックスの種類
+                              ("exact", "ivf", "pq", "matryoshka")。
+            index_dir (str | None): インデックスファイルを保存するディレクトリ。
+                                    指定しない場合はデータベースファイルの隣に作成します。
+            ivf_nlist (int | None): IVFインデックスのリスト数。指定しない場合は行数から決定します。
+            ivf_nprobe (int): IVFインデックスで検索時にスキャンするリスト数のデフォルト値。
+            pq_m (int): PQインデックスの部分空間の数 (= 1ベクトルあたりのバイト数)。
+            pq_rerank_factor (int): PQインデックスで上位 k * pq_rerank_factor 件を
+                                    元の埋め込みで再スコアリングします。0 の場合は再スコアリングしません。
+            matryoshka_dim (int): Matryoshkaインデックスの1段階目で使用する先頭の次元数。
+            matryoshka_candidates (int): Matryoshkaインデックスで元の埋め込みで再スコアリングする候補数。
+            embedding_model (str | None): テーブルの埋め込みを作成したモデルの名前。
+                                          `CollectionManager` がカタログの記録から設定します。
         """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(
+                f"サポートされていないインデックスの種類です: {index_type} {INDEX_TYPES}"
+            )
         self.db_path = db_path
         self.table_name = table_name
-        self.embedding_dim = 1024  # bge-m3の次元
+        self.embedding_dim = embedding_dim
+        self.embedding_model = embedding_model
+        self.id_sequence_name = f"{table_name}_id_seq"
+        self.progress_table_name = f"{table_name}_ingest_progress"
+        self.minhash_table_name = f"{table_name}_minhash"
+        self.lsh_table_name = f"{table_name}_lsh"
+        self.duplicates_table_name = f"{table_name}_duplicates"
+        # 全文検索インデックスは初回の全文検索時に構築される
+        self.fts_schema_name = f"fts_main_{table_name}"
+        self._fts_loaded = False
+        self._fts_dirty = False
+        self._transaction_depth = 0
+        # 行の追加・削除やインデックスの再学習のたびに更新される書き込み世代。
+        # 検索結果のキャッシュは、保存時と世代が異なる場合に無効とみなす
+        self.write_generation = next(_write_generations)
+        self.index_type = index_type
+        if index_dir is None:
+            index_dir = (
+                tempfile.mkdtemp(prefix="vector_store_indexes_")
+                if db_path == ":memory:"
+                else f"{os.path.splitext(db_path)[0]}_indexes"
+            )
+        self.index_dir = index_dir
+        self.ivf: IVFIndex | None = None
+        self.pq: PQIndex | None = None
+        self.matryoshka: MatryoshkaIndex | None = None
 
         try:
             self.conn = duckdb.connect(database=self.db_path, read_only=False)
@@ -30,69 +109,693 @@ class DuckDBVectorStore:
             self.conn.execute("LOAD vss;")
             # テーブルが存在しない場合は作成
             self._create_table()
+            self._create_progress_table()
+            self._create_minhash_tables()
+            if index_type == "ivf":
+                self.ivf = IVFIndex(
+                    self.conn,
+                    self.table_name,
+                    index_dir=os.path.join(self.index_dir, f"{self.table_name}_ivf"),
+                    embedding_dim=self.embedding_dim,
+                    nlist=ivf_nlist,
+                    nprobe=ivf_nprobe,
+                )
+            elif index_type == "pq":
+                self.pq = PQIndex(
+                    self.conn,
+                    self.table_name,
+                    index_dir=os.path.join(self.index_dir, f"{self.table_name}_pq"),
+                    embedding_dim=self.embedding_dim,
+                    m=pq_m,
+                    rerank_factor=pq_rerank_factor,
+                )
+            elif index_type == "matryoshka":
+                self.matryoshka = MatryoshkaIndex(
+                    self.conn,
+                    self.table_name,
+                    embedding_dim=self.embedding_dim,
+                    dim=matryoshka_dim,
+                    candidates=matryoshka_candidates,
+                )
         except Exception as e:
-            print(f"DuckDBVectorStoreの初期化エラー: {e}")
+            logger.error("DuckDBVectorStoreの初期化エラー: %s", e)
             raise
 
     def _create_table(self):
-        """埋め込みテーブルが存在しない場合に作成します。"""
+        """埋め込みテーブルとIDのシーケンスが存在しない場合に作成します。"""
         create_table_sql = f"""
         CREATE TABLE IF NOT EXISTS {self.table_name} (
             id INTEGER PRIMARY KEY,
             text VARCHAR,
-            embedding FLOAT[{self.embedding_dim}]
+            embedding FLOAT[{self.embedding_dim}],
+            source VARCHAR,
+            content_hash VARCHAR,
+            ordinal INTEGER
+        );
+        ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS source VARCHAR;
+        ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS content_hash VARCHAR;
+        ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS ordinal INTEGER;
+        """
+        try:
+            self.conn.execute(create_table_sql)
+            # 削除した行のIDを再利用すると、近似検索インデックスに残っている古いエントリが
+            # 新しい行を指してしまうため、IDはシーケンスで採番する
+            max_id = self.conn.execute(
+                f"SELECT COALESCE(MAX(id), 0) FROM {self.table_name}"
+            ).fetchone()[0]
+            self.conn.execute(
+                f"CREATE SEQUENCE IF NOT EXISTS {self.id_sequence_name} START WITH {max_id + 1}"
+            )
+        except Exception as e:
+            logger.error("テーブル作成エラー: %s", e)
+            raise
+
+    def _reset_id_sequence(self, start: int = 1):
+        """
+        IDのシーケンスを作り直し、テーブルの最大のIDの次 (`start` の方が大きい場合は `start`)
+        から採番を再開します。
+        """
+        max_id = self.conn.execute(
+            f"SELECT COALESCE(MAX(id), 0) FROM {self.table_name}"
+        ).fetchone()[0]
+        self.conn.execute(f"DROP SEQUENCE IF EXISTS {self.id_sequence_name}")
+        self.conn.execute(
+            f"CREATE SEQUENCE {self.id_sequence_name} START WITH {max(max_id + 1, start)}"
+        )
+
+    @property
+    def metadata_table_names(self) -> dict[str, str]:
+        """埋め込みテーブルに付随するテーブルの (役割 -> テーブル名) を返します。"""
+        return {
+            "ingest_progress": self.progress_table_name,
+            "minhash": self.minhash_table_name,
+            "lsh": self.lsh_table_name,
+            "duplicates": self.duplicates_table_name,
+        }
+
+    def _create_progress_table(self):
+        """取り込み進捗（チェックポイント）テーブルが存在しない場合に作成します。"""
+        create_table_sql = f"""
+        CREATE TABLE IF NOT EXISTS {self.progress_table_name} (
+            source VARCHAR,
+            content_hash VARCHAR,
+            total_chunks INTEGER,
+            completed_chunks INTEGER,
+            updated_at TIMESTAMP DEFAULT current_timestamp,
+            PRIMARY KEY (source, content_hash)
         );
         """
         try:
             self.conn.execute(create_table_sql)
         except Exception as e:
-            print(f"テーブル作成エラー: {e}")
+            logger.error("進捗テーブル作成エラー: %s", e)
+            raise
+
+    def _create_minhash_tables(self):
+        """ニアデュプリケート検出用のMinHash/LSHテーブルが存在しない場合に作成します。"""
+        create_tables_sql = f"""
+        CREATE TABLE IF NOT EXISTS {self.minhash_table_name} (
+            chunk_hash VARCHAR PRIMARY KEY,
+            source VARCHAR,
+            signature UINTEGER[]
+        );
+        CREATE TABLE IF NOT EXISTS {self.lsh_table_name} (
+            band SMALLINT,
+            bucket BIGINT,
+            chunk_hash VARCHAR
+        );
+        CREATE INDEX IF NOT EXISTS {self.lsh_table_name}_bucket_idx
+            ON {self.lsh_table_name} (bucket);
+        CREATE TABLE IF NOT EXISTS {self.duplicates_table_name} (
+            chunk_hash VARCHAR,
+            source VARCHAR,
+            duplicate_of VARCHAR,
+            similarity FLOAT,
+            created_at TIMESTAMP DEFAULT current_timestamp
+        );
+        """
+        try:
+            self.conn.execute(create_tables_sql)
+        except Exception as e:
+            logger.error("MinHashテーブル作成エラー: %s", e)
             raise
 
-    def add_embeddings(self, texts: list[str], embeddings: list[list[float]]):
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        トランザクションを開始し、ブロックの終了時にコミットします。
+
+        ネストして呼び出された場合は最も外側のブロックのみがBEGIN/COMMITを発行するため、
+        埋め込みの追加と進捗の記録などを1つのトランザクションにまとめられます。
+        例外が発生した場合はロールバックして再送出します。近似検索インデックスのメモリ上の
+        差分はDuckDBのロールバックで元に戻らないため、テーブルから読み込み直します。
+        """
+        if self._transaction_depth > 0:
+            self._transaction_depth += 1
+            try:
+                yield
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        self.conn.begin()
+        self._transaction_depth = 1
+        try:
+            yield
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            index = self._approximate_index()
+            if index is not None:
+                index.reload()
+                self.write_generation = next(_write_generations)
+            raise
+        finally:
+            self._transaction_depth = 0
+
+    def add_embeddings(
+        self,
+        texts: list[str],
+        embeddings: list[list[float]],
+        sources: list[str | None] | None = None,
+        content_hashes: list[str | None] | None = None,
+        ids: list[int] | None = None,
+        ordinals: list[int | None] | None = None,
+    ) -> list[int]:
         """
         テキストチャンクとそれに対応する埋め込みをストアに追加します。
 
         Args:
             texts (List[str]): テキストチャンクのリスト。
             embeddings (List[List[float]]): 対応する埋め込み（浮動小数点数のリスト）のリスト。
+            sources (List[str | None] | None): 各チャンクのソース（ファイルのパスなど）。
+                                               `delete_by_source` と `upsert_source` で使用されます。
+            content_hashes (List[str | None] | None): 各チャンクのソースの本文のハッシュ値。
+            ids (List[int] | None): 行IDのリスト。指定しない場合はシーケンスで採番します
+                                    (再埋め込みで元のテーブルのIDを引き継ぐ場合に指定します)。
+            ordinals (List[int | None] | None): 各チャンクのソース内での位置 (0始まりのチャンク番号)。
+                                                `neighbor_chunks` で前後のチャンクを取得するために使用されます。
+
+        Returns:
+            List[int]: 追加した行に割り当てられたIDのリスト。
         """
         if len(texts) != len(embeddings):
             raise ValueError("テキストと埋め込みの数が一致しません。")
         if not embeddings:
-            print("追加する埋め込みがありません。")
-            return
-
-        # 次に利用可能なIDを取得
-        try:
-            max_id = self.conn.execute(
-                f"SELECT COALESCE(MAX(id), 0) FROM {self.table_name}"
-            ).fetchone()[0]
-        except Exception:
-            max_id = 0
+            logger.debug("追加する埋め込みがありません。")
+            return []
+        sources = sources if sources is not None else [None] * len(texts)
+        content_hashes = (
+            content_hashes if content_hashes is not None else [None] * len(texts)
+        )
+        ordinals = ordinals if ordinals is not None else [None] * len(texts)
+        if not len(sources) == len(content_hashes) == len(ordinals) == len(texts):
+            raise ValueError("テキストとソースの数が一致しません。")
+        if ids is not None and len(ids) != len(texts):
+            raise ValueError("テキストとIDの数が一致しません。")
 
+        started = time.perf_counter()
         # 安全な挿入のためのパラメータ化クエリ
-        insert_sql = (
-            f"INSERT INTO {self.table_name} (id, text, embedding) VALUES (?, ?, ?)"
-        )
+        insert_sql = f"""
+        INSERT INTO {self.table_name} (id, text, embedding, source, content_hash, ordinal)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """
 
         try:
-            self.conn.begin()  # トランザクション開始
-            # 手動で管理されたIDを使用して行ごとにデータを挿入
-            for i, (text, embedding) in enumerate(
-                zip(texts, embeddings, strict=False), start=1
-            ):
-                self.conn.execute(insert_sql, [max_id + i, text, embedding])
-            self.conn.commit()  # すべての挿入が成功した場合に変更をコミット
-            print(f"{len(texts)}個の埋め込みを正常に追加しました。")
+            # すべての挿入が成功した場合のみコミットし、エラー時はロールバック
+            with metrics.span("insert"), self.transaction():
+                # 削除済みの行のIDは再利用しない
+                if ids is None:
+                    ids = [
+                        row[0]
+                        for row in self.conn.execute(
+                            f"SELECT nextval('{self.id_sequence_name}') FROM range(?)",
+                            [len(texts)],
+                        ).fetchall()
+                    ]
+                for row in zip(
+                    ids,
+                    texts,
+                    embeddings,
+                    sources,
+                    content_hashes,
+                    ordinals,
+                    strict=True,
+                ):
+                    self.conn.execute(insert_sql, list(row))
+                # 近似検索インデックスの差分にも同じトランザクションで追加する
+                index = self._approximate_index()
+                if index is not None:
+                    index.add(ids, embeddings)
+            # 全文検索インデックスは次回の全文検索時に再構築する
+            self._fts_dirty = True
+            self.write_generation = next(_write_generations)
+            metrics.inc("rag_rows_ingested_total", len(texts))
+            logger.debug(
+                "埋め込みを追加しました",
+                extra={
+                    "table": self.table_name,
+                    "rows": len(texts),
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                },
+            )
         except Exception as e:
-            print(f"埋め込み追加エラー: {e}")
-            self.conn.rollback()  # エラー時にロールバック
+            logger.error("埋め込み追加エラー: %s", e)
             raise
         # finallyブロックは不要（接続のクローズは`close`メソッドで処理）
 
+        # 外側のトランザクションがない場合は、必要に応じてインデックスを再学習する
+        if self._transaction_depth == 0:
+            self.maintain_index()
+        return ids
+
+    def _delete_rows(self, condition: str, params: list) -> list[tuple[int, str]]:
+        """
+        条件に一致する行を削除し、近似検索インデックスからも取り除きます。
+
+        Args:
+            condition (str): 削除する行を選択するWHERE句の条件。
+            params (list): 条件のパラメータ。
+
+        Returns:
+            List[Tuple[int, str]]: 削除した行の (ID, テキスト) のリスト。
+        """
+        with self.transaction():
+            rows = self.conn.execute(
+                f"SELECT id, text FROM {self.table_name} WHERE {condition}", params
+            ).fetchall()
+            if not rows:
+                return []
+            ids = [row_id for row_id, _ in rows]
+            self.conn.execute(
+                f"DELETE FROM {self.table_name} WHERE list_contains(?::INTEGER[], id)",
+                [ids],
+            )
+            index = self._approximate_index()
+            if index is not None:
+                index.remove(ids)
+        self._fts_dirty = True
+        self.write_generation = next(_write_generations)
+        return rows
+
+    def existing_texts(self, texts: list[str]) -> set[str]:
+        """指定したテキストのうち、テーブルに存在するものを返します。"""
+        if not texts:
+            return set()
+        rows = self.conn.execute(
+            f"""
+            SELECT DISTINCT text FROM {self.table_name}
+            WHERE list_contains(?::VARCHAR[], text)
+            """,
+            [list(texts)],
+        ).fetchall()
+        return {text for (text,) in rows}
+
+    def delete_minhash_entries(self, texts: list[str]):
+        """
+        削除したチャンクのMinHashシグネチャとLSHバケットを削除します。
+
+        削除したチャンクが重複元として残り続けると、同じ内容を再登録したときに
+        ニアデュプリケートとして除外されてしまうため、テーブルから削除したテキストに対して呼び出します。
+
+        Args:
+            texts (List[str]): 削除したチャンクのテキストのリスト。
+        """
+        if not texts:
+            return
+        # チャンクハッシュは NearDuplicateFilter と同じくテキストのSHA-1
+        chunk_hashes = [
+            hashlib.sha1(text.encode("utf-8")).hexdigest() for text in set(texts)
+        ]
+        with self.transaction():
+            for table in (self.minhash_table_name, self.lsh_table_name):
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE list_contains(?::VARCHAR[], chunk_hash)",
+                    [chunk_hashes],
+                )
+
+    def delete_source_metadata(self, source: str, keep_content_hash: str | None = None):
+        """
+        ソースの取り込み進捗と重複チャンクのリンクを削除します。
+
+        Args:
+            source (str): ファイルのパスなど、ドキュメントのソース。
+            keep_content_hash (str | None): 指定した場合、このハッシュ値の進捗は残します。
+        """
+        with self.transaction():
+            self.conn.execute(
+                f"""
+                DELETE FROM {self.progress_table_name}
+                WHERE source = ? AND content_hash IS DISTINCT FROM ?
+                """,
+                [source, keep_content_hash],
+            )
+            self.conn.execute(
+                f"DELETE FROM {self.duplicates_table_name} WHERE source = ?",
+                [source],
+            )
+
+    def delete_by_ids(self, ids: list[int]) -> int:
+        """
+        指定したIDの行を削除します。
+
+        Args:
+            ids (List[int]): 削除する行IDのリスト。
+
+        Returns:
+            int: 削除した行数。
+        """
+        if not ids:
+            return 0
+        with self.transaction():
+            rows = self._delete_rows("list_contains(?::INTEGER[], id)", [list(ids)])
+            texts = [text for _, text in rows]
+            self.delete_minhash_entries(list(set(texts) - self.existing_texts(texts)))
+        logger.info("%d行を削除しました: %s", len(rows), self.table_name)
+        return len(rows)
+
+    def delete_by_source(
+        self, source: str, keep_content_hash: str | None = None
+    ) -> int:
+        """
+        ソースのすべてのチャンクと、その取り込み進捗を削除します。
+
+        Args:
+            source (str): ファイルのパスなど、ドキュメントのソース。
+            keep_content_hash (str | None): 指定した場合、このハッシュ値 (現在の版) の
+                                            チャンクは残し、それ以外の古い版だけを削除します。
+
+        Returns:
+            int: 削除した行数。
+        """
+        with self.transaction():
+            rows = self._delete_rows(
+                "source = ? AND (?::VARCHAR IS NULL OR content_hash IS DISTINCT FROM ?)",
+                [source, keep_content_hash, keep_content_hash],
+            )
+            texts = [text for _, text in rows]
+            self.delete_minhash_entries(list(set(texts) - self.existing_texts(texts)))
+            self.delete_source_metadata(source, keep_content_hash)
+        logger.info("%d行を削除しました (%s): %s", len(rows), source, self.table_name)
+        return len(rows)
+
+    def has_stale_version(self, source: str, content_hash: str) -> bool:
+        """
+        ソースについて、指定したハッシュ値以外の版のチャンクまたは進捗が保存されているかを返します。
+        """
+        row = self.conn.execute(
+            f"""
+            SELECT
+                EXISTS (
+                    SELECT 1 FROM {self.table_name}
+                    WHERE source = ? AND content_hash IS DISTINCT FROM ?
+                )
+                OR EXISTS (
+                    SELECT 1 FROM {self.progress_table_name}
+                    WHERE source = ? AND content_hash <> ?
+                )
+            """,
+            [source, content_hash, source, content_hash],
+        ).fetchone()
+        return bool(row[0])
+
+    def upsert_source(
+        self,
+        source: str,
+        texts: list[str],
+        embeddings: list[list[float]],
+        content_hash: str | None = None,
+    ) -> list[int]:
+        """
+        ソースのチャンクをすべて置き換えます。
+
+        古いチャンクの削除と新しいチャンクの追加は1つのトランザクションで行われるため、
+        検索結果に古い版と新しい版が混在することはありません。
+
+        Args:
+            source (str): ファイルのパスなど、ドキュメントのソース。
+            texts (List[str]): 新しいチャンクのテキストのリスト。
+            embeddings (List[List[float]]): 対応する埋め込みのリスト。
+            content_hash (str | None): 新しい版の本文のハッシュ値。
+
+        Returns:
+            List[int]: 追加した行に割り当てられたIDのリスト。
+        """
+        with self.transaction():
+            self.delete_by_source(source)
+            ids = self.add_embeddings(
+                texts,
+                embeddings,
+                sources=[source] * len(texts),
+                content_hashes=[content_hash] * len(texts),
+                ordinals=list(range(len(texts))),
+            )
+        if self._transaction_depth == 0:
+            self.maintain_index()
+        return ids
+
+    def compact(self) -> dict[str, int]:
+        """
+        削除した行の領域を回収し、インデックスを作り直します。
+
+        近似検索インデックスを再学習して削除済みの行を取り除き、構築済みの全文検索インデックスを
+        再構築した後、CHECKPOINT でWALをデータベースファイルに書き込みます。
+        完全に削除された行グループの領域は再利用されますが、ファイルサイズ自体は縮小されません。
+
+        Returns:
+            Dict[str, int]: 行数 (`rows`) と、データベースファイルの圧縮前後のサイズ
+            (`file_bytes_before`, `file_bytes_after`。メモリ上のデータベースの場合は0)。
+        """
+        file_bytes_before = self._file_bytes()
+        index = self._approximate_index()
+        if index is not None and index.is_trained:
+            index.train()
+            # 再学習で近似検索の結果が変わるため、キャッシュした検索結果を無効にする
+            self.write_generation = next(_write_generations)
+        fts_exists = self.conn.execute(
+            "SELECT count(*) FROM duckdb_schemas() WHERE schema_name = ?",
+            [self.fts_schema_name],
+        ).fetchone()[0]
+        if fts_exists:
+            self._fts_dirty = True
+            self._ensure_fts_index()
+        self.conn.execute("CHECKPOINT")
+        rows = self.conn.execute(f"SELECT count(*) FROM {self.table_name}").fetchone()[
+            0
+        ]
+        stats = {
+            "rows": rows,
+            "file_bytes_before": file_bytes_before,
+            "file_bytes_after": self._file_bytes(),
+        }
+        logger.info("コンパクションが完了しました: %s %s", self.table_name, stats)
+        return stats
+
+    def export_snapshot(self, directory: str) -> dict:
+        """
+        ストアの内容をParquetスナップショットとして書き出します (`snapshot.export_snapshot`)。
+
+        Args:
+            directory (str): 書き出し先のディレクトリ。
+
+        Returns:
+            dict: 書き出したスナップショットのマニフェスト。
+        """
+        return export_snapshot(self, directory)
+
+    def import_snapshot(self, directory: str) -> dict:
+        """
+        Parquetスナップショットを空のストアに一括で読み込みます (`snapshot.import_snapshot`)。
+
+        Args:
+            directory (str): スナップショットのディレクトリ。
+
+        Returns:
+            dict: 読み込んだ行数と処理時間。
+        """
+        stats = import_snapshot(self, directory)
+        self.write_generation = next(_write_generations)
+        return stats
+
+    def drop(self):
+        """
+        埋め込みテーブルと、それに付随するテーブル・シーケンス・インデックスをすべて削除し、
+        接続を閉じます。再埋め込みで置き換えられた古いテーブルの削除に使用します。
+        """
+        index = self._approximate_index()
+        with self.transaction():
+            self.conn.execute(f"DROP SCHEMA IF EXISTS {self.fts_schema_name} CASCADE")
+            for table_name in (*self.metadata_table_names.values(), self.table_name):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+            self.conn.execute(f"DROP SEQUENCE IF EXISTS {self.id_sequence_name}")
+            if index is not None:
+                index.drop()
+        logger.info("テーブルを削除しました: %s", self.table_name)
+        self.close()
+
+    def _file_bytes(self) -> int:
+        """データベースファイルとWALの合計サイズを返します。"""
+        if self.db_path == ":memory:":
+            return 0
+        return sum(
+            os.path.getsize(path)
+            for path in (self.db_path, f"{self.db_path}.wal")
+            if os.path.exists(path)
+        )
+
+    def _approximate_index(self) -> IVFIndex | PQIndex | MatryoshkaIndex | None:
+        """使用中の近似検索インデックスを返します。厳密検索の場合は None です。"""
+        for index in (self.ivf, self.pq, self.matryoshka):
+            if index is not None:
+                return index
+        return None
+
+    def build_index(self):
+        """近似検索インデックスを (再) 学習します。厳密検索の場合は何もしません。"""
+        index = self._approximate_index()
+        if index is not None:
+            index.train()
+            self.write_generation = next(_write_generations)
+
+    def maintain_index(self):
+        """
+        近似検索インデックスの学習が必要な場合に学習します。
+
+        IVF/PQインデックスでは、行数が学習に十分な数に達したときと、
+        学習後に追加された行が一定の割合を超えたときに (再) 学習が行われます。
+        """
+        index = self._approximate_index()
+        if index is not None and index.needs_training():
+            index.train()
+            self.write_generation = next(_write_generations)
+
+    def get_ingest_progress(self, source: str, content_hash: str) -> int:
+        """
+        ファイルの取り込みがどのチャンクまで完了しているかを返します。
+
+        Args:
+            source (str): ファイルのパスなど、ドキュメントのソース。
+            content_hash (str): ドキュメント本文のハッシュ値。
+                                内容が変わったファイルは別の進捗として扱われます。
+
+        Returns:
+            int: 保存済みのチャンク数。記録がない場合は0。
+        """
+        row = self.conn.execute(
+            f"""
+            SELECT completed_chunks FROM {self.progress_table_name}
+            WHERE source = ? AND content_hash = ?
+            """,
+            [source, content_hash],
+        ).fetchone()
+        return row[0] if row else 0
+
+    def save_ingest_progress(
+        self,
+        source: str,
+        content_hash: str,
+        total_chunks: int,
+        completed_chunks: int,
+    ):
+        """
+        ファイルの取り込み進捗を記録します。
+
+        `add_embeddings` と同じ `transaction()` ブロック内で呼び出すことで、
+        埋め込みの保存と進捗の記録がアトミックに行われます。
+
+        Args:
+            source (str): ファイルのパスなど、ドキュメントのソース。
+            content_hash (str): ドキュメント本文のハッシュ値。
+            total_chunks (int): ファイルから生成されたチャンクの総数。
+            completed_chunks (int): 保存済みのチャンク数。
+        """
+        self.conn.execute(
+            f"""
+            INSERT OR REPLACE INTO {self.progress_table_name}
+                (source, content_hash, total_chunks, completed_chunks, updated_at)
+            VALUES (?, ?, ?, ?, current_timestamp)
+            """,
+            [source, content_hash, total_chunks, completed_chunks],
+        )
+
+    def find_minhash_candidates(
+        self, buckets: list[tuple[int, int]]
+    ) -> list[tuple[int, int, str, np.ndarray]]:
+        """
+        LSHインデックスから、指定したバケットに属する保存済みチャンクを取得します。
+
+        Args:
+            buckets (List[Tuple[int, int]]): (バンド番号, バケットキー) のリスト。
+
+        Returns:
+            List[Tuple[int, int, str, np.ndarray]]:
+                (バンド番号, バケットキー, チャンクハッシュ, MinHashシグネチャ) のリスト。
+        """
+        if not buckets:
+            return []
+        rows = self.conn.execute(
+            f"""
+            SELECT l.band, l.bucket, m.chunk_hash, m.signature
+            FROM {self.lsh_table_name} l
+            JOIN (
+                SELECT unnest(?::SMALLINT[]) AS band, unnest(?::BIGINT[]) AS bucket
+            ) q ON l.band = q.band AND l.bucket = q.bucket
+            JOIN {self.minhash_table_name} m ON m.chunk_hash = l.chunk_hash
+            """,
+            [[band for band, _ in buckets], [bucket for _, bucket in buckets]],
+        ).fetchall()
+        return [
+            (band, bucket, chunk_hash, np.asarray(signature, dtype=np.uint32))
+            for band, bucket, chunk_hash, signature in rows
+        ]
+
+    def add_minhash_entries(
+        self,
+        entries: list[tuple[str, str | None, np.ndarray, list[tuple[int, int]]]],
+    ):
+        """
+        チャンクのMinHashシグネチャとLSHバケットを保存します。
+
+        Args:
+            entries: (チャンクハッシュ, ソース, シグネチャ, (バンド番号, バケットキー) のリスト) のリスト。
+        """
+        if not entries:
+            return
+        with self.transaction():
+            for chunk_hash, source, signature, buckets in entries:
+                self.conn.execute(
+                    f"INSERT OR IGNORE INTO {self.minhash_table_name} VALUES (?, ?, ?)",
+                    [chunk_hash, source, [int(v) for v in signature]],
+                )
+                self.conn.executemany(
+                    f"INSERT INTO {self.lsh_table_name} VALUES (?, ?, ?)",
+                    [[band, bucket, chunk_hash] for band, bucket in buckets],
+                )
+
+    def add_duplicate_links(self, links: list[tuple[str, str | None, str, float]]):
+        """
+        ベクトル化せずにスキップしたニアデュプリケートチャンクと重複元の対応を記録します。
+
+        Args:
+            links: (チャンクハッシュ, ソース, 重複元のチャンクハッシュ, 推定Jaccard類似度) のリスト。
+        """
+        if not links:
+            return
+        self.conn.executemany(
+            f"""
+            INSERT INTO {self.duplicates_table_name}
+                (chunk_hash, source, duplicate_of, similarity)
+            VALUES (?, ?, ?, ?)
+            """,
+            [list(link) for link in links],
+        )
+
     def similarity_search(
-        self, query_embedding: list[float], k: int = 5
+        self,
+        query_embedding: list[float],
+        k: int = 5,
+        nprobe: int | None = None,
+        min_similarity: float | None = None,
     ) -> list[tuple[str, float]]:
         """
         コサイン類似度を使用して類似検索を実行します。
@@ -100,37 +803,426 @@ class DuckDBVectorStore:
         Args:
             query_embedding (List[float]): クエリの埋め込み（浮動小数点数のリスト）。
             k (int): 取得する最近傍の数。
+            nprobe (int | None): IVFインデックスでスキャンするリスト数（IVF使用時のみ）。
+            min_similarity (float | None): 返す結果のコサイン類似度の下限。
 
         Returns:
             List[Tuple[str, float]]: (テキスト, 類似度スコア)のタプルのリスト。
         """
-        # オプション: 必要に応じてリストの長さチェックを追加
-        # if len(query_embedding) != self.embedding_dim:
-        #     raise ValueError(f"クエリ埋め込みの次元が一致しません。期待値: {self.embedding_dim}, 実際: {len(query_embedding)}")
+        return [
+            (text, similarity)
+            for _, text, similarity in self.similarity_search_with_ids(
+                query_embedding, k=k, nprobe=nprobe, min_similarity=min_similarity
+            )
+        ]
+
+    @metrics.timed("search")
+    def similarity_search_with_ids(
+        self,
+        query_embedding: list[float],
+        k: int = 5,
+        nprobe: int | None = None,
+        min_similarity: float | None = None,
+    ) -> list[tuple[int, str, float]]:
+        """
+        コサイン類似度を使用して類似検索を実行し、行IDを含む結果を返します。
+
+        近似検索インデックス (IVF/PQ/Matryoshka) が学習済みの場合は近似検索、
+        それ以外は全行をスキャンする厳密検索を行います。
+        `min_similarity` を指定した場合、しきい値未満の行を結果から除外します。
+        スキャンを省略するのはIVFのみで、しきい値以上の行を含み得ないリストをスキャンしません。
+        厳密検索では全行をスキャンして並べ替えの前に、PQ・Matryoshkaでは検索した上位k件から除外します。
+
+        Args:
+            query_embedding (List[float]): クエリの埋め込み（浮動小数点数のリスト）。
+            k (int): 取得する最近傍の数。
+            nprobe (int | None): IVFインデックスでスキャンするリスト数（IVF使用時のみ）。
+            min_similarity (float | None): 返す結果のコサイン類似度の下限。
+
+        Returns:
+            List[Tuple[int, str, float]]: (ID, テキスト, 類似度スコア)のタプルのリスト。
+
+        Raises:
+            ValueError: クエリの埋め込みの次元数がテーブルの次元数と一致しない場合。
+        """
+        # コレクションごとに次元数が異なるため、別のモデルの埋め込みで検索しないよう確認する
+        if len(query_embedding) != self.embedding_dim:
+            raise ValueError(
+                f"クエリ埋め込みの次元が一致しません。期待値: {self.embedding_dim}, 実際: {len(query_embedding)}"
+            )
+
+        index = self._approximate_index()
+        if index is not None and index.is_trained:
+            try:
+                if self.ivf is not None:
+                    hits = self.ivf.search(
+                        query_embedding,
+                        k=k,
+                        nprobe=nprobe,
+                        min_similarity=min_similarity,
+                    )
+                else:
+                    hits = index.search(query_embedding, k=k)
+                    if min_similarity is not None:
+                        hits = [hit for hit in hits if hit[1] >= min_similarity]
+                texts = self.get_texts([row_id for row_id, _ in hits])
+                # 削除済みの行はインデックスに残っていても結果から除外する
+                return [
+                    (row_id, texts[row_id], similarity)
+                    for row_id, similarity in hits
+                    if row_id in texts
+                ]
+            except Exception as e:
+                logger.error(
+                    "%sインデックスによる類似検索中のエラー: %s", self.index_type, e
+                )
+                return []
 
         # コサイン類似度にarray_distanceを使用（1 - コサイン距離）
         # 注: VSSは新しいバージョンでコサイン類似度にlist_similarityを直接使用しますが、
         # array_distanceは一般的に利用可能です。コサイン類似度 = 1 - コサイン距離
         search_sql = f"""
-        SELECT text, array_cosine_similarity(embedding, ?::FLOAT[1024]) AS similarity
+        SELECT id, text, array_cosine_similarity(embedding, ?::FLOAT[{self.embedding_dim}]) AS similarity
         FROM {self.table_name}
         ORDER BY similarity DESC
         LIMIT ?;
         """
+        params = [query_embedding, k]
+        if min_similarity is not None:
+            # しきい値未満の行を並べ替えの前に除外する
+            search_sql = f"""
+            SELECT id, text, similarity FROM (
+                SELECT id, text, array_cosine_similarity(embedding, ?::FLOAT[{self.embedding_dim}]) AS similarity
+                FROM {self.table_name}
+            )
+            WHERE similarity >= ?
+            ORDER BY similarity DESC
+            LIMIT ?;
+            """
+            params = [query_embedding, min_similarity, k]
         try:
-            results = self.conn.execute(search_sql, [query_embedding, k]).fetchall()
-            # 結果を目的の形式（テキスト、スコア）に変換
-            # fetchallはタプルのリストを返します。例: [('doc1 text', 0.98), ('doc2 text', 0.95)]
+            results = self.conn.execute(search_sql, params).fetchall()
+            # fetchallはタプルのリストを返します。例: [(1, 'doc1 text', 0.98), (2, 'doc2 text', 0.95)]
             return results
         except Exception as e:
-            print(f"類似検索中のエラー: {e}")
+            logger.error("類似検索中のエラー: %s", e)
+            return []
+
+    @metrics.timed("search")
+    def similarity_search_batch_with_ids(
+        self,
+        query_embeddings: list[list[float]],
+        k: int = 5,
+        nprobe: int | None = None,
+    ) -> list[list[tuple[int, str, float]]]:
+        """
+        複数のクエリの類似検索をまとめて実行します。
+
+        厳密検索では、全クエリのコサイン類似度を1回のテーブルスキャンで計算し、
+        クエリごとの上位k件を `max_by` で集計します。近似検索インデックスが学習済みの場合は
+        クエリごとにインデックスを検索し、結果のテキストをまとめて1回で取得します。
+
+        Args:
+            query_embeddings (List[List[float]]): クエリの埋め込みのリスト。
+            k (int): クエリごとに取得する最近傍の数。
+            nprobe (int | None): IVFインデックスでスキャンするリスト数（IVF使用時のみ）。
+
+        Returns:
+            List[List[Tuple[int, str, float]]]: クエリごとの (ID, テキスト, 類似度スコア) のリスト。
+            各リストは `similarity_search_with_ids` と同じ形式です。
+
+        Raises:
+            ValueError: クエリの埋め込みの次元数がテーブルの次元数と一致しない場合。
+        """
+        for query_embedding in query_embeddings:
+            if len(query_embedding) != self.embedding_dim:
+                raise ValueError(
+                    f"クエリ埋め込みの次元が一致しません。期待値: {self.embedding_dim}, 実際: {len(query_embedding)}"
+                )
+        if not query_embeddings:
+            return []
+
+        index = self._approximate_index()
+        try:
+            if index is not None and index.is_trained:
+                per_query = [
+                    self.ivf.search(query_embedding, k=k, nprobe=nprobe)
+                    if self.ivf is not None
+                    else index.search(query_embedding, k=k)
+                    for query_embedding in query_embeddings
+                ]
+            else:
+                rows = self.conn.execute(
+                    f"""
+                    WITH queries AS (
+                        SELECT generate_subscripts($1::FLOAT[{self.embedding_dim}][], 1) AS query_no,
+                               unnest($1::FLOAT[{self.embedding_dim}][]) AS query
+                    ), scored AS (
+                        SELECT q.query_no, e.id,
+                               array_cosine_similarity(e.embedding, q.query) AS similarity
+                        FROM {self.table_name} e, queries q
+                    )
+                    SELECT query_no, max_by({{'id': id, 'similarity': similarity}}, similarity, $2)
+                    FROM scored
+                    GROUP BY query_no
+                    """,
+                    [query_embeddings, k],
+                ).fetchall()
+                # 行がない場合はクエリの行も返らないため、空の結果で補う
+                hits_by_query = {
+                    query_no: [(hit["id"], hit["similarity"]) for hit in hits]
+                    for query_no, hits in rows
+                }
+                per_query = [
+                    hits_by_query.get(query_no, [])
+                    for query_no in range(1, len(query_embeddings) + 1)
+                ]
+            texts = self.get_texts(
+                list({row_id for hits in per_query for row_id, _ in hits})
+            )
+        except Exception as e:
+            logger.error("バッチ類似検索中のエラー: %s", e)
+            return [[] for _ in query_embeddings]
+        # 削除済みの行はインデックスに残っていても結果から除外する
+        return [
+            [
+                (row_id, texts[row_id], similarity)
+                for row_id, similarity in hits
+                if row_id in texts
+            ]
+            for hits in per_query
+        ]
+
+    def get_texts(self, ids: list[int]) -> dict[int, str]:
+        """
+        指定したIDの行のテキストを取得します。
+
+        Args:
+            ids (List[int]): 行IDのリスト。
+
+        Returns:
+            Dict[int, str]: IDからテキストへのマッピング（存在しないIDは含まれません）。
+        """
+        if not ids:
+            return {}
+        rows = self.conn.execute(
+            f"""
+            SELECT id, text FROM {self.table_name}
+            WHERE id IN (SELECT unnest(?::INTEGER[]))
+            """,
+            [ids],
+        ).fetchall()
+        return dict(rows)
+
+    def get_embeddings(self, ids: list[int]) -> dict[int, list[float]]:
+        """
+        指定したIDの行の埋め込みを取得します。
+
+        Args:
+            ids (List[int]): 行IDのリスト。
+
+        Returns:
+            Dict[int, List[float]]: IDから埋め込みへのマッピング（存在しないIDは含まれません）。
+        """
+        if not ids:
+            return {}
+        rows = self.conn.execute(
+            f"""
+            SELECT id, embedding FROM {self.table_name}
+            WHERE id IN (SELECT unnest(?::INTEGER[]))
+            """,
+            [ids],
+        ).fetchall()
+        return dict(rows)
+
+    def neighbor_chunks(
+        self, ids: list[int], window: int
+    ) -> dict[int, list[tuple[int, str]]]:
+        """
+        指定したIDの行と、同じソースの前後 `window` 個のチャンクを1回のクエリで取得します。
+
+        前後のチャンクは、ソースと本文のハッシュ値が同じで、位置 (`ordinal`) の差が
+        `window` 以下の行です。ソースまたは位置が記録されていない行は、その行のみを返します。
+
+        Args:
+            ids (List[int]): 行IDのリスト。
+            window (int): 前後それぞれに取得するチャンク数。
+
+        Returns:
+            Dict[int, List[Tuple[int, str]]]: IDから、位置の順に並べた (ID, テキスト) のリストへの
+            マッピング (指定した行を含みます。存在しないIDは含まれません)。
+        """
+        if not ids:
+            return {}
+        rows = self.conn.execute(
+            f"""
+            WITH hits AS (
+                SELECT id AS hit_id, source, content_hash, ordinal
+                FROM {self.table_name}
+                WHERE id IN (SELECT unnest(?::INTEGER[]))
+            )
+            SELECT h.hit_id, e.id, e.text, e.ordinal
+            FROM hits h JOIN {self.table_name} e ON e.id = h.hit_id
+            UNION
+            SELECT h.hit_id, e.id, e.text, e.ordinal
+            FROM hits h JOIN {self.table_name} e
+              ON e.source = h.source
+             AND e.content_hash IS NOT DISTINCT FROM h.content_hash
+             AND e.ordinal BETWEEN h.ordinal - ? AND h.ordinal + ?
+            ORDER BY hit_id, ordinal, id
+            """,
+            [ids, window, window],
+        ).fetchall()
+        neighbors: dict[int, list[tuple[int, str]]] = {}
+        for hit_id, row_id, text, _ in rows:
+            neighbors.setdefault(hit_id, []).append((row_id, text))
+        return neighbors
+
+    def chunk_positions(self, ids: list[int]) -> dict[int, tuple[str, str | None, int]]:
+        """
+        指定したIDの行のうち、ソースと位置が記録されている行の (ソース, ハッシュ値, 位置) を返します。
+        """
+        if not ids:
+            return {}
+        rows = self.conn.execute(
+            f"""
+            SELECT id, source, content_hash, ordinal FROM {self.table_name}
+            WHERE id IN (SELECT unnest(?::INTEGER[]))
+              AND source IS NOT NULL AND ordinal IS NOT NULL
+            """,
+            [ids],
+        ).fetchall()
+        return {
+            row_id: (source, content_hash, ordinal)
+            for row_id, source, content_hash, ordinal in rows
+        }
+
+    def chunks_near(
+        self, positions: list[tuple[str, str | None, int]], window: int
+    ) -> list[tuple[int, str, str | None, int, str]]:
+        """
+        (ソース, ハッシュ値, 位置) のいずれかから位置の差が `window` 以下の行を1回のクエリで返します。
+
+        Returns:
+            List[Tuple[int, str, str | None, int, str]]: (ID, ソース, ハッシュ値, 位置, テキスト) のリスト。
+        """
+        if not positions:
             return []
+        sources, content_hashes, ordinals = (
+            list(column) for column in zip(*positions, strict=True)
+        )
+        return self.conn.execute(
+            f"""
+            WITH positions AS (
+                SELECT
+                    unnest(?::VARCHAR[]) AS source,
+                    unnest(?::VARCHAR[]) AS content_hash,
+                    unnest(?::INTEGER[]) AS ordinal
+            )
+            SELECT DISTINCT e.id, e.source, e.content_hash, e.ordinal, e.text
+            FROM positions p
+            JOIN {self.table_name} e
+              ON e.source = p.source
+             AND e.content_hash IS NOT DISTINCT FROM p.content_hash
+             AND e.ordinal BETWEEN p.ordinal - ? AND p.ordinal + ?
+            """,
+            [sources, content_hashes, ordinals, window, window],
+        ).fetchall()
+
+    def similarities_by_ids(
+        self, query_embedding: list[float], ids: list[int]
+    ) -> dict[int, float]:
+        """
+        指定したIDの行について、クエリとのコサイン類似度を計算します。
+
+        Args:
+            query_embedding (List[float]): クエリの埋め込み（浮動小数点数のリスト）。
+            ids (List[int]): 対象の行IDのリスト。
+
+        Returns:
+            Dict[int, float]: IDから類似度スコアへのマッピング。
+        """
+        return exact_similarities(
+            self.conn, self.table_name, query_embedding, ids, self.embedding_dim
+        )
+
+    def _fts_index_is_current(self) -> bool:
+        """全文検索インデックスが存在し、テーブルの全行を含んでいるかを確認します。"""
+        exists = self.conn.execute(
+            "SELECT count(*) FROM duckdb_schemas() WHERE schema_name = ?",
+            [self.fts_schema_name],
+        ).fetchone()[0]
+        if not exists:
+            return False
+        indexed = self.conn.execute(
+            f"SELECT count(*) FROM {self.fts_schema_name}.docs"
+        ).fetchone()[0]
+        total = self.conn.execute(f"SELECT count(*) FROM {self.table_name}").fetchone()[
+            0
+        ]
+        return indexed == total
+
+    def _ensure_fts_index(self):
+        """
+        必要に応じて全文検索 (BM25) インデックスを構築します。
+
+        DuckDBのFTS拡張機能のインデックスは差分更新ができないため、
+        挿入時にはインデックスを無効化するだけにとどめ、
+        次回の全文検索の直前にまとめて再構築します。
+        """
+        if not self._fts_loaded:
+            self.conn.execute("INSTALL fts;")
+            self.conn.execute("LOAD fts;")
+            self._fts_loaded = True
+            # 他のプロセスによる書き込みも考慮し、インデックスの行数を確認する
+            self._fts_dirty = self._fts_dirty or not self._fts_index_is_current()
+        if not self._fts_dirty:
+            return
+
+        # API名やエラーコードを検索できるよう、英数字とアンダースコアをトークンとして残す
+        # (デフォルトの設定では数字が除去される)
+        self.conn.execute(
+            f"""
+            PRAGMA create_fts_index(
+                '{self.table_name}', 'id', 'text',
+                stemmer = 'none',
+                ignore = '(\\.|[^a-z0-9_])+',
+                overwrite = 1
+            )
+            """
+        )
+        self._fts_dirty = False
+        logger.debug("全文検索インデックスを再構築しました: %s", self.table_name)
+
+    def lexical_search(
+        self, query_text: str, k: int = 5
+    ) -> list[tuple[int, str, float]]:
+        """
+        DuckDBのFTS拡張機能を使用してBM25による全文検索を実行します。
+
+        Args:
+            query_text (str): 検索クエリのテキスト。
+            k (int): 取得する件数。
+
+        Returns:
+            List[Tuple[int, str, float]]: (ID, テキスト, BM25スコア)のタプルのリスト。
+        """
+        self._ensure_fts_index()
+        search_sql = f"""
+        SELECT id, text, {self.fts_schema_name}.match_bm25(id, ?) AS score
+        FROM {self.table_name}
+        WHERE score IS NOT NULL
+        ORDER BY score DESC
+        LIMIT ?;
+        """
+        with metrics.span("lexical_search"):
+            return self.conn.execute(search_sql, [query_text, k]).fetchall()
 
     def close(self):
         """データベース接続を閉じます。"""
         if self.conn:
             self.conn.close()
-            print("DuckDB接続を閉じました。")
+            logger.info("DuckDB接続を閉じました。")
 
 
 # 使用例（オプション - テスト用）